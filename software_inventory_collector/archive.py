@@ -0,0 +1,244 @@
+"""Post-processing of tarballs produced by the collector."""
+import bz2
+import gzip
+import hashlib
+import io
+import json
+import lzma
+import os
+import shutil
+import tarfile
+from types import ModuleType
+from typing import Dict, List, Sequence, Union
+
+import zstandard
+
+COMPRESSORS: Dict[str, ModuleType] = {"gz": gzip, "bz2": bz2, "xz": lzma}
+DICTIONARY_COMPRESSION = "zstd-dict"
+COMPRESSIONS = (*COMPRESSORS, DICTIONARY_COMPRESSION)
+INDEXED_FORMAT = "indexed"
+ARCHIVE_FORMATS = ("tar", INDEXED_FORMAT)
+INDEX_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+DICTIONARY_SIZE = 110 * 1024
+DICTIONARY_LEVEL = 9
+# Dictionary is trained from a sample of members, so that training time and memory
+# don't grow with the size of the fleet
+DICTIONARY_SAMPLE_SIZE = 64 * 1024 * 1024
+
+
+def compress_tarball(tar_path: str, compression: str) -> str:
+    """Compress finished tarball and remove the original.
+
+    The function is self-contained so that it can be executed by a worker process.
+
+    :param tar_path: Path to the tarball
+    :param compression: Compression format, one of `COMPRESSORS` keys
+    :return: Path to the compressed tarball ('<tar_path>.<compression>')
+    """
+    compressed_path = f"{tar_path}.{compression}"
+    with open(tar_path, "rb") as source, open(compressed_path, "wb") as compressed:
+        destination: io.BufferedIOBase
+        if compression == "gz":
+            # gzip header is written without name and mtime, which change in every run
+            destination = gzip.GzipFile(filename="", mode="wb", fileobj=compressed, mtime=0)
+        else:
+            destination = COMPRESSORS[compression].open(compressed, "wb")
+        with destination:
+            shutil.copyfileobj(source, destination, COPY_BUFFER_SIZE)
+    os.remove(tar_path)
+    return compressed_path
+
+
+def normalize_tarball(tar_path: str, run: str) -> str:
+    """Rewrite finished tarball so that the same data produce the same tarball in any run.
+
+    Members are sorted by name, '_@_<run>' suffix is removed from their names (before
+    '.zst' extension of payloads stored compressed), and their headers are normalized
+    (zero mtime, root owner, mode 0o600). The run is recorded only in the first member,
+    `MANIFEST_NAME`. Members that are not regular files are dropped. Like
+    `compress_tarball`, the function is self-contained so that it can be executed by
+    a worker process.
+
+    :param tar_path: Path to the tarball
+    :param run: Timestamp of the run that produced the tarball
+    :return: Path to the tarball
+    """
+    suffix = f"_@_{run}"
+    manifest = json.dumps({"run": run}, sort_keys=True).encode("UTF-8")
+    temp_path = f"{tar_path}.tmp"
+    with tarfile.open(tar_path) as source, tarfile.open(temp_path, "w") as destination:
+        destination.addfile(_normalized_info(MANIFEST_NAME, len(manifest)), io.BytesIO(manifest))
+        for member in sorted(source.getmembers(), key=lambda member: member.name):
+            content = source.extractfile(member)
+            if content is None:
+                continue
+            # payloads stored in their content encoding keep its extension
+            stem, extension = os.path.splitext(member.name)
+            if extension != ".zst":
+                stem, extension = member.name, ""
+            name = stem[: -len(suffix)] + extension if stem.endswith(suffix) else member.name
+            destination.addfile(_normalized_info(name, member.size), content)
+    os.replace(temp_path, tar_path)
+    return tar_path
+
+
+def _normalized_info(name: str, size: int) -> tarfile.TarInfo:
+    """Return tar header of a regular file that doesn't depend on the run."""
+    tar_info = tarfile.TarInfo(name)
+    tar_info.size = size
+    tar_info.mtime = 0
+    tar_info.mode = 0o600
+    tar_info.uid = tar_info.gid = 0
+    tar_info.uname = tar_info.gname = "root"
+    return tar_info
+
+
+def dictionary_path(directory: str, run: str) -> str:
+    """Return path to zstd dictionary used to compress tarballs of a run."""
+    return os.path.join(directory, f"zstd_dictionary_@_{run}.dict")
+
+
+def _is_plain(member: tarfile.TarInfo) -> bool:
+    """Return True if member is a regular file that isn't compressed yet."""
+    return member.isfile() and not member.name.endswith(".zst")
+
+
+def train_dictionary(tar_paths: Sequence[str]) -> bytes:
+    """Train zstd dictionary from members of finished tarballs.
+
+    Members are sampled evenly across all tarballs, up to `DICTIONARY_SAMPLE_SIZE`.
+    Members that are already compressed ('.zst') are skipped.
+
+    :param tar_paths: Paths to the tarballs
+    :return: Dictionary data, or empty bytes if there's not enough data to train it
+    """
+    total_size = 0
+    for tar_path in tar_paths:
+        with tarfile.open(tar_path) as tar_file:
+            total_size += sum(member.size for member in tar_file if _is_plain(member))
+    # every n-th member is sampled, rounded so that the sample fits into the limit
+    stride = max(1, -(-total_size // DICTIONARY_SAMPLE_SIZE))
+
+    samples: List[Union[bytes, bytearray, memoryview]] = []
+    position = 0
+    for tar_path in tar_paths:
+        with tarfile.open(tar_path) as tar_file:
+            for member in tar_file:
+                content = tar_file.extractfile(member)
+                if content is None or not _is_plain(member):
+                    continue
+                if position % stride == 0:
+                    samples.append(content.read())
+                position += 1
+
+    try:
+        return zstandard.train_dictionary(DICTIONARY_SIZE, samples).as_bytes()
+    except zstandard.ZstdError:
+        return b""
+
+
+def compress_members(tar_path: str, dictionary: bytes) -> str:
+    """Compress each member of finished tarball with zstd dictionary.
+
+    Members are renamed to '<name>.zst' and the tarball is replaced in place. Members
+    that were stored as zstd frames received from exporters are kept as-is. Like
+    `compress_tarball`, the function is self-contained so that it can be executed
+    by a worker process.
+
+    :param tar_path: Path to the tarball
+    :param dictionary: Data of zstd dictionary, members are compressed without
+        dictionary if empty
+    :return: Path to the tarball
+    """
+    dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+    compressor = zstandard.ZstdCompressor(level=DICTIONARY_LEVEL, dict_data=dict_data)
+    temp_path = f"{tar_path}.tmp"
+    with tarfile.open(tar_path) as source, tarfile.open(temp_path, "w") as destination:
+        for member in source:
+            content = source.extractfile(member)
+            if content is None or not _is_plain(member):
+                destination.addfile(member, content)
+                continue
+            compressed = compressor.compress(content.read())
+            member.name = f"{member.name}.zst"
+            member.size = len(compressed)
+            destination.addfile(member, io.BytesIO(compressed))
+    os.replace(temp_path, tar_path)
+    return tar_path
+
+
+def consolidated_path(directory: str, run: str) -> str:
+    """Return path to single archive that holds all data of a run in the directory."""
+    return os.path.join(directory, f"run_@_{run}.tar")
+
+
+def index_path(archive_path: str) -> str:
+    """Return path to sidecar index of consolidated archive."""
+    return f"{archive_path}.index"
+
+
+def _member_prefix(tar_path: str, run: str) -> str:
+    """Return tarball name used as prefix of its members, without the run if given."""
+    prefix = os.path.splitext(os.path.basename(tar_path))[0]
+    suffix = f"_@_{run}"
+    if run and prefix.endswith(suffix):
+        return prefix[: -len(suffix)]
+    return prefix
+
+
+def consolidate_tarballs(
+    tar_paths: Sequence[str], archive_path: str, dictionary: str = "", run: str = ""
+) -> str:
+    """Merge finished tarballs into single archive with sidecar index of its members.
+
+    Members are stored uncompressed in tar format as '<tarball name>/<member name>',
+    so the archive stays readable by standard tools, while the index (member name
+    mapped to offset, size and SHA-256 checksum of its data) lets readers get any
+    member with a single seek. Merged tarballs are removed.
+
+    :param tar_paths: Paths to the tarballs
+    :param archive_path: Path to the consolidated archive
+    :param dictionary: Name of zstd dictionary used to compress the members, if any
+    :param run: Timestamp of the run of normalized tarballs, its '_@_<run>' suffix is
+        removed from tarball names, so that member names don't depend on the run
+    :return: Path to the index
+    """
+    members = {}
+    with tarfile.open(archive_path, "w") as archive:
+        for tar_path in tar_paths:
+            prefix = _member_prefix(tar_path, run)
+            with tarfile.open(tar_path) as source:
+                for member in source:
+                    content = source.extractfile(member)
+                    if content is None:
+                        continue
+                    data = content.read()
+                    member.name = f"{prefix}/{member.name}"
+                    archive.addfile(member, io.BytesIO(data))
+                    # data is padded to full blocks and followed by the next header
+                    blocks = -(-member.size // tarfile.BLOCKSIZE)
+                    members[member.name] = {
+                        "offset": archive.offset - blocks * tarfile.BLOCKSIZE,
+                        "size": member.size,
+                        "sha256": hashlib.sha256(data).hexdigest(),
+                    }
+
+    temp_path = f"{index_path(archive_path)}.tmp"
+    with open(temp_path, "w", encoding="UTF-8") as index_file:
+        json.dump(
+            {
+                "version": INDEX_VERSION,
+                "archive": os.path.basename(archive_path),
+                "dictionary": dictionary,
+                "members": members,
+            },
+            index_file,
+        )
+    os.replace(temp_path, index_path(archive_path))
+    for tar_path in tar_paths:
+        os.remove(tar_path)
+    return index_path(archive_path)
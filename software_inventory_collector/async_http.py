@@ -0,0 +1,180 @@
+"""Minimal asyncio HTTP/1.1 client fetching several paths over one connection.
+
+Requests to a single exporter are pipelined: all of them are sent at once and the
+responses are read in order from the same connection. If the server closes the
+connection early (e.g. it speaks only HTTP/1.0), remaining requests are sent again
+over a new connection.
+"""
+import asyncio
+from typing import AsyncIterator, Dict, List, Sequence, Tuple
+from urllib.parse import urlsplit
+
+from software_inventory_collector.exception import HTTPClientError
+from software_inventory_collector.pipeline import CHUNK_SIZE
+
+USER_AGENT = "software-inventory-collector"
+
+
+def _parse_address(endpoint: str) -> Tuple[str, int]:
+    """Split exporter endpoint ('host:port') into host and port."""
+    url = urlsplit(f"http://{endpoint}")
+    try:
+        port = url.port or 80
+    except ValueError as exc:
+        raise HTTPClientError(f"Invalid endpoint '{endpoint}'") from exc
+    if not url.hostname:
+        raise HTTPClientError(f"Invalid endpoint '{endpoint}'")
+    return url.hostname, port
+
+
+def _build_requests(endpoint: str, paths: Sequence[str], accept_encoding: str) -> bytes:
+    """Return pipelined GET requests, the last one asking server to close the connection."""
+    requests = []
+    for index, path in enumerate(paths):
+        connection = "close" if index == len(paths) - 1 else "keep-alive"
+        requests.append(
+            f"GET {path} HTTP/1.1\r\n"
+            f"Host: {endpoint}\r\n"
+            f"User-Agent: {USER_AGENT}\r\n"
+            f"Accept-Encoding: {accept_encoding}\r\n"
+            f"Connection: {connection}\r\n"
+            "\r\n"
+        )
+    return "".join(requests).encode("ascii")
+
+
+async def _read_line(reader: asyncio.StreamReader, timeout: float) -> bytes:
+    """Read single CRLF terminated line."""
+    try:
+        line = await asyncio.wait_for(reader.readuntil(b"\r\n"), timeout)
+    except asyncio.LimitOverrunError as exc:
+        raise HTTPClientError("Response line exceeds the limit of the stream") from exc
+    return line[:-2]
+
+
+async def _read_head(reader: asyncio.StreamReader, timeout: float) -> Tuple[str, int, Dict]:
+    """Read status line and headers of a response.
+
+    :return: HTTP version, status code and headers with lower-case names
+    """
+    status_line = (await _read_line(reader, timeout)).decode("latin-1")
+    try:
+        version, status, _ = (status_line + " ").split(" ", 2)
+        status_code = int(status)
+    except ValueError as exc:
+        raise HTTPClientError(f"Invalid status line '{status_line}'") from exc
+
+    headers: Dict[str, str] = {}
+    while True:
+        line = (await _read_line(reader, timeout)).decode("latin-1")
+        if not line:
+            return version, status_code, headers
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+
+def _content_length(headers: Dict) -> int:
+    """Return length of the body announced by Content-Length header."""
+    value = headers["content-length"]
+    try:
+        length = int(value)
+    except ValueError as exc:
+        raise HTTPClientError(f"Invalid Content-Length '{value}'") from exc
+    if length < 0:
+        raise HTTPClientError(f"Invalid Content-Length '{value}'")
+    return length
+
+
+async def _read_body(
+    reader: asyncio.StreamReader, headers: Dict, timeout: float
+) -> AsyncIterator[bytes]:
+    """Read response body in chunks, according to its framing."""
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        while True:
+            size_line = await _read_line(reader, timeout)
+            try:
+                remaining = int(size_line.split(b";")[0], 16)
+            except ValueError as exc:
+                raise HTTPClientError(f"Invalid chunk size '{size_line!r}'") from exc
+            if remaining == 0:
+                while await _read_line(reader, timeout):  # skip trailers
+                    pass
+                return
+            while remaining:
+                chunk = await asyncio.wait_for(
+                    reader.readexactly(min(remaining, CHUNK_SIZE)), timeout
+                )
+                remaining -= len(chunk)
+                yield chunk
+            await _read_line(reader, timeout)
+    elif "content-length" in headers:
+        remaining = _content_length(headers)
+        while remaining:
+            chunk = await asyncio.wait_for(reader.readexactly(min(remaining, CHUNK_SIZE)), timeout)
+            remaining -= len(chunk)
+            yield chunk
+    else:
+        while True:
+            chunk = await asyncio.wait_for(reader.read(CHUNK_SIZE), timeout)
+            if not chunk:
+                return
+            yield chunk
+
+
+def _keep_alive(version: str, headers: Dict) -> bool:
+    """Return True if the server keeps the connection open after the response."""
+    connection = headers.get("connection", "").lower()
+    if version == "HTTP/1.1":
+        keep_alive = connection != "close"
+    else:
+        keep_alive = connection == "keep-alive"
+    # Body without explicit length is terminated by closing the connection
+    return keep_alive and (
+        "content-length" in headers or "chunked" in headers.get("transfer-encoding", "").lower()
+    )
+
+
+async def fetch_pipelined(
+    endpoint: str, paths: Sequence[str], timeout: float, accept_encoding: str = "identity"
+) -> AsyncIterator[Tuple[str, str, AsyncIterator[bytes]]]:
+    """Fetch several paths from a server reusing single connection where possible.
+
+    Responses are yielded in order of `paths` as tuples of the path, the content
+    encoding of the body, and an async iterator of body chunks, which are not
+    decoded. Body that's not consumed by the caller is discarded before the next
+    response is read.
+
+    :param endpoint: Server address in 'host:port' format
+    :param paths: Paths to fetch (e.g. ['/dpkg', '/snap'])
+    :param timeout: Timeout of connecting and of each read from the connection
+    :param accept_encoding: Value of Accept-Encoding header of the requests
+    :return: Async iterator of (path, content encoding, body chunks)
+    """
+    host, port = _parse_address(endpoint)
+    pending: List[str] = list(paths)
+    while pending:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        received = 0
+        try:
+            writer.write(_build_requests(endpoint, pending, accept_encoding))
+            await writer.drain()
+            while pending:
+                try:
+                    version, status, headers = await _read_head(reader, timeout)
+                except asyncio.IncompleteReadError as exc:
+                    if received:  # closed by server after previous response, reconnect
+                        break
+                    raise HTTPClientError("Connection closed without response") from exc
+                if status != 200:
+                    raise HTTPClientError(f"Unexpected status {status} for '{pending[0]}'")
+
+                body = _read_body(reader, headers, timeout)
+                yield pending[0], headers.get("content-encoding", ""), body
+                async for _ in body:
+                    pass
+                pending.pop(0)
+                received += 1
+                if not _keep_alive(version, headers):
+                    break
+        finally:
+            writer.close()
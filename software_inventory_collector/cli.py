@@ -2,19 +2,28 @@
 """CLI Entrypoint to the software-inventory-collector."""
 import argparse
 import sys
+from contextlib import nullcontext
+from dataclasses import asdict
 
 import yaml
 from juju import jasyncio
-from juju.controller import Controller
 from juju.errors import JujuError
 
 from software_inventory_collector.collector import (
+    disconnect_controllers,
     fetch_exporter_data,
     fetch_juju_data,
-    get_controller,
+    finalize_archives,
+    get_controllers,
 )
+from software_inventory_collector.concurrency import new_limiter
 from software_inventory_collector.config import Config
 from software_inventory_collector.exception import ConfigError, ConfigMissingKeyError
+from software_inventory_collector.health import check_targets
+from software_inventory_collector.inventory import load_targets
+from software_inventory_collector.profiling import TOP_ALLOCATORS, Profiler
+from software_inventory_collector.schedule import RunSchedule
+from software_inventory_collector.sink import new_sink
 
 
 def parse_cli() -> argparse.Namespace:
@@ -33,12 +42,38 @@ def parse_cli() -> argparse.Namespace:
         default=False,
         help="Verifies successful connection to the controller but no output is produced.",
     )
+    arg_parser.add_argument(
+        "--check-targets",
+        action="store_true",
+        default=False,
+        help="Quickly probe all exporters, print their latencies and unreachable ones. "
+        "No output is produced.",
+    )
+    arg_parser.add_argument(
+        "--profile",
+        metavar="PATH",
+        default="",
+        help="Profile the run with cProfile and write the stats into PATH (.pstats file).",
+    )
+    arg_parser.add_argument(
+        "--trace-malloc",
+        metavar="N",
+        type=int,
+        nargs="?",
+        const=TOP_ALLOCATORS,
+        default=0,
+        help="Trace memory allocations and list top N allocators after each phase "
+        f"of the run (default N: {TOP_ALLOCATORS}).",
+    )
     return arg_parser.parse_args()
 
 
 def parse_config(config_path: str) -> Config:
     """Load and parse application config file.
 
+    Targets from the inventory at `settings.targets_path` are appended to the
+    targets defined in the config file, with their models labelled the same way.
+
     :param config_path: Path to the application config
     :return: `Config` object holding application configuration
     """
@@ -53,37 +88,71 @@ def parse_config(config_path: str) -> Config:
     except ConfigMissingKeyError as exc:
         raise ConfigError(f"Config is missing required key '{exc.key_name}'") from exc
 
+    if config.settings.targets_path:
+        targets = load_targets(config.settings.targets_path)
+        config.label_targets(targets)
+        config.targets.extend(targets)
+
     return config
 
 
 def main() -> None:
-    """Run software inventory collector."""
-    args = parse_cli()
+    """Run software inventory collector.
 
-    try:
-        config = parse_config(args.config)
-        controller: Controller = jasyncio.run(get_controller(config))
-    except JujuError as exc:
-        print(f"Failed to connect to juju controller: {exc}")
-        sys.exit(1)
-    except ConfigError as exc:
-        print(f"Failed to load config: {exc}")
-        sys.exit(1)
-
-    if args.dry_run:
-        jasyncio.run(controller.disconnect())
-        print("OK.")
-        sys.exit(0)
+    Phases of the run are profiled if it's requested by CLI arguments.
+    """
+    args = parse_cli()
 
-    try:
-        fetch_exporter_data(config)
-        jasyncio.run(fetch_juju_data(config, controller))
-        exit_code = 0
-    except Exception as exc:  # pylint: disable=W0718
-        print(f"Failed to collect data: {exc}")
-        exit_code = 1
-    finally:
-        jasyncio.run(controller.disconnect())
+    with Profiler(args.profile, args.trace_malloc) as profiler:
+        try:
+            with profiler.phase("config"):
+                config = parse_config(args.config)
+            if args.check_targets:
+                with profiler.phase("check"):
+                    report = jasyncio.run(check_targets(config.targets))
+                print(report.format())
+                sys.exit(1 if report.failures else 0)
+            with profiler.phase("controller"):
+                controllers = jasyncio.run(get_controllers(config))
+        except JujuError as exc:
+            print(f"Failed to connect to juju controller: {exc}")
+            sys.exit(1)
+        except ConfigError as exc:
+            print(f"Failed to load config: {exc}")
+            sys.exit(1)
+
+        if args.dry_run:
+            jasyncio.run(disconnect_controllers(controllers))
+            print("OK.")
+            sys.exit(0)
+
+        settings = config.settings
+        schedule = RunSchedule(
+            settings.history_path, settings.run_deadline, asdict(settings.intervals)
+        )
+        limiter = new_limiter(settings)
+        try:
+            sink = new_sink(settings)
+            with sink or nullcontext():
+                with profiler.phase("exporters"):
+                    fetch_exporter_data(config, schedule, limiter, sink)
+                with profiler.phase("juju"):
+                    jasyncio.run(fetch_juju_data(config, controllers, schedule, sink))
+            # streamed archive is not stored, so there is nothing to finalize
+            if sink is None:
+                with profiler.phase("archives"):
+                    finalize_archives(config)
+            schedule.save()
+            if schedule.skipped:
+                print(f"Skipped due to run deadline: {', '.join(schedule.skipped)}")
+            if limiter is not None:
+                print(limiter.report())
+            exit_code = 0
+        except Exception as exc:  # pylint: disable=W0718
+            print(f"Failed to collect data: {exc}")
+            exit_code = 1
+        finally:
+            jasyncio.run(disconnect_controllers(controllers))
 
     sys.exit(exit_code)
 
@@ -1,126 +1,894 @@
 """Implementation of collector functions from various data sources."""
+import asyncio
 import datetime
+import glob
 import json
 import os
 import tarfile
-from tempfile import NamedTemporaryFile
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from itertools import repeat
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
 
 import requests
+import urllib3
 import yaml
+from juju import jasyncio
 from juju.controller import Controller
 from juju.errors import JujuAPIError
 from juju.model import Model
 
-from software_inventory_collector.config import Config
-from software_inventory_collector.exception import CollectionError
+from software_inventory_collector.archive import (
+    DICTIONARY_COMPRESSION,
+    INDEXED_FORMAT,
+    compress_members,
+    compress_tarball,
+    consolidate_tarballs,
+    consolidated_path,
+    dictionary_path,
+    normalize_tarball,
+    train_dictionary,
+)
+from software_inventory_collector.async_http import fetch_pipelined
+from software_inventory_collector.concurrency import (
+    AdaptiveLimiter,
+    new_limiter,
+    record_request,
+    record_response,
+)
+from software_inventory_collector.config import (
+    Config,
+    _ConfigJujuController,
+    _ConfigTarget,
+    model_label,
+)
+from software_inventory_collector.discovery import discover_targets
+from software_inventory_collector.encoding import (
+    IDENTITY,
+    EncodedBody,
+    EncodingPolicy,
+    encoding_policy,
+)
+from software_inventory_collector.exception import CollectionError, HTTPClientError
+from software_inventory_collector.index import PackageIndex, PayloadParser
+from software_inventory_collector.layout import (
+    archive_dir,
+    archive_pattern,
+    prune_archives,
+)
+from software_inventory_collector.model_cache import ModelCache
+from software_inventory_collector.pipeline import (
+    CHUNK_SIZE,
+    SPOOL_SIZE,
+    ArchivePipeline,
+    SpooledPayload,
+    spool,
+)
+from software_inventory_collector.profiling import timed
+from software_inventory_collector.schedule import MODELS, TARGETS, RunSchedule
+from software_inventory_collector.sink import TarStreamSink, member_info
 
 ENDPOINTS = ["dpkg", "snap", "kernel"]
+JUJU_ARTIFACTS = ["status", "bundle"]
+# Juju client returns whole artifacts as text, which is held with its encoded copy
+JUJU_COPIES = 2
 
 TIMESTAMP = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
 
+_T = TypeVar("_T")
 
-def _add_file_to_tar(file_name: str, content: str, tar_path: str) -> None:
-    """Write content to a file with specified name and add it to tarball.
+
+def _add_file_to_tar(file_name: str, content: IO[bytes], tar_path: str) -> None:
+    """Add content of a file object to tarball under specified name.
 
     :param file_name: Resulting name of the file in tarball
-    :param content: Content of the file
+    :param content: File object with the content of the file
     :param tar_path: path to tarball to which the file will be added.
     :return: None
     """
-    with NamedTemporaryFile() as temp_file:
-        temp_file.write(content.encode("UTF-8"))
-        temp_file.flush()
-        with tarfile.open(tar_path, "a", encoding="UTF-8") as tar_file:
-            tar_file.add(temp_file.name, arcname=file_name)
+    tar_info = member_info(file_name, content)
+    with tarfile.open(tar_path, "a", encoding="UTF-8") as tar_file:
+        tar_file.addfile(tar_info, content)
 
 
-def fetch_exporter_data(config: Config) -> None:
-    """Query exporter endpoints and collect data."""
-    for target in config.targets:
-        url = f"http://{target.endpoint}/"
-        tar = f"{target.customer}_@_{target.site}_@_{target.model}_@_{TIMESTAMP}.tar"
-        tar_path = os.path.join(config.settings.collection_path, tar)
-        for endpoint in ENDPOINTS:
-            try:
-                content = requests.get(url + endpoint, timeout=60)
+def _new_pipeline(config: Config, sink: Optional[TarStreamSink] = None) -> ArchivePipeline:
+    """Return archive pipeline configured according to the collector settings.
+
+    Data are written into tarballs, or into the streaming sink if it's provided.
+    """
+    return ArchivePipeline(
+        _add_file_to_tar if sink is None else sink.write,
+        memory_budget=config.settings.memory_budget,
+        queue_size=config.settings.workers,
+    )
+
+
+def _output_dir(config: Config, target: _ConfigTarget) -> str:
+    """Return directory for tarball of the exporter according to the archive layout."""
+    return archive_dir(config.settings, target.customer, target.site, TIMESTAMP)
+
+
+def _target_tar_path(target: _ConfigTarget, output_path: str) -> str:
+    """Return path to tarball that holds data collected from the exporter."""
+    tar = f"{target.customer}_@_{target.site}_@_{target.model}_@_{TIMESTAMP}.tar"
+    return os.path.join(output_path, tar)
+
+
+@contextmanager
+def _package_index(config: Config) -> Iterator[Optional[PackageIndex]]:
+    """Return package index, or None if it's not enabled in config."""
+    if not config.settings.index_path:
+        yield None
+        return
+
+    with PackageIndex(config.settings.index_path, run=TIMESTAMP) as index:
+        yield index
+
+
+def _fetch_target(  # pylint: disable=R0913,R0914,R0917
+    target: _ConfigTarget,
+    output_path: str,
+    pipeline: ArchivePipeline,
+    index: Optional[PackageIndex] = None,
+    endpoints: Sequence[str] = tuple(ENDPOINTS),
+    policy: EncodingPolicy = EncodingPolicy(),
+) -> None:
+    """Query endpoints of a single exporter and pass the data to the pipeline.
+
+    Responses are streamed into spooled files, so only the part of the memory budget
+    reserved for each response is ever held in memory. If the package index is
+    enabled, responses are parsed as they stream in. Responses are requested in the
+    content encoding of the policy, and stored as received if the archive stores
+    that encoding, decoded otherwise.
+    """
+    url = f"http://{target.endpoint}/"
+    tar_path = _target_tar_path(target, output_path)
+    for endpoint in endpoints:
+        reserved = pipeline.reserve()
+        parser = PayloadParser(endpoint)
+        record_request()
+        try:
+            with requests.get(
+                url + endpoint, headers=policy.headers, timeout=60, stream=True
+            ) as content:
+                record_response()
                 content.raise_for_status()
-            except requests.exceptions.RequestException as exc:
-                raise CollectionError(
-                    f"Failed to collect data from target '{target.endpoint}': f{exc}"
-                ) from exc
+                if policy.accept:
+                    # body is decoded by `EncodedBody`, so that it can be stored as received
+                    chunks = content.raw.stream(CHUNK_SIZE, decode_content=False)
+                    encoding = content.headers.get("Content-Encoding", "")
+                else:
+                    chunks, encoding = content.iter_content(CHUNK_SIZE), ""
+                body = EncodedBody(encoding, policy, None if index is None else parser.write)
+                payload = spool(body.decode(chunks), reserved)
+        except (
+            requests.exceptions.RequestException,
+            urllib3.exceptions.HTTPError,
+            HTTPClientError,
+        ) as exc:
+            pipeline.budget.release(reserved)
+            raise CollectionError(
+                f"Failed to collect data from target '{target.endpoint}': f{exc}"
+            ) from exc
+
+        file_name = f"{endpoint}_@_{target.hostname}_@_{TIMESTAMP}{body.suffix}"
+        pipeline.submit(tar_path, file_name, payload, reserved)
+        if index is not None:
+            parser.close()
+            index.add_payload(target, parser)
+
+
+async def _fetch_target_async(  # pylint: disable=R0913,R0914,R0917
+    target: _ConfigTarget,
+    output_path: str,
+    pipeline: ArchivePipeline,
+    index: Optional[PackageIndex] = None,
+    endpoints: Sequence[str] = tuple(ENDPOINTS),
+    policy: EncodingPolicy = EncodingPolicy(),
+) -> None:
+    """Query endpoints of a single exporter using asyncio HTTP client.
+
+    Requests are pipelined over a single connection to the exporter. Like in
+    `_fetch_target`, responses are streamed into spooled files within the reserved
+    part of the memory budget.
+    """
+    loop = asyncio.get_running_loop()
+    tar_path = _target_tar_path(target, output_path)
+    record_request()
+    try:
+        async for path, encoding, body in fetch_pipelined(
+            target.endpoint,
+            [f"/{endpoint}" for endpoint in endpoints],
+            timeout=60,
+            accept_encoding=policy.headers.get("Accept-Encoding", IDENTITY),
+        ):
+            record_response()
+            parser = PayloadParser(path.lstrip("/"))
+            encoded = EncodedBody(encoding, policy, None if index is None else parser.write)
+            reserved = await pipeline.reserve_async()
+            payload = SpooledPayload(reserved)
+            try:
+                async for chunk in body:
+                    payload.write(encoded.write(chunk))
+                payload.write(encoded.write(b"", final=True))
+            except BaseException:
+                payload.file.close()
+                pipeline.budget.release(reserved)
+                raise
+
+            file_name = f"{path.lstrip('/')}_@_{target.hostname}_@_{TIMESTAMP}{encoded.suffix}"
+            await loop.run_in_executor(
+                None, pipeline.submit, tar_path, file_name, payload.getfile(), reserved
+            )
+            if index is not None:
+                parser.close()
+                index.add_payload(target, parser)
+    except (OSError, EOFError, asyncio.TimeoutError, HTTPClientError) as exc:
+        raise CollectionError(
+            f"Failed to collect data from target '{target.endpoint}': {exc!r}"
+        ) from exc
+
+
+def _skipped_artifacts(
+    schedule: RunSchedule, key: str, artifacts: Sequence[str], due: Sequence[str]
+) -> Optional[bytes]:
+    """Return JSON listing of artifacts that are not due, with times of their last collection.
+
+    :param schedule: Schedule of the run
+    :param key: Endpoint of the exporter or label of the model
+    :param artifacts: Names of all artifacts
+    :param due: Names of artifacts collected in this run
+    :return: Encoded listing, or None if all artifacts are collected
+    """
+    skipped = {}
+    for artifact in artifacts:
+        last = schedule.last_collected(key, artifact)
+        if artifact not in due and last is not None:
+            skipped[artifact] = datetime.datetime.fromtimestamp(
+                last, datetime.timezone.utc
+            ).isoformat()
+    if not skipped:
+        return None
+    return json.dumps(skipped, sort_keys=True).encode()
+
+
+def _fetch_scheduled_target(  # pylint: disable=R0913,R0917
+    target: _ConfigTarget,
+    output_path: str,
+    pipeline: ArchivePipeline,
+    index: Optional[PackageIndex],
+    schedule: RunSchedule,
+    policy: EncodingPolicy = EncodingPolicy(),
+) -> None:
+    """Query endpoints of exporter that are due, measuring its duration.
+
+    Endpoints that are not due are listed in a 'skipped' member of the tarball.
+    Exporter is skipped if it can't finish before the deadline.
+    """
+    endpoints = schedule.due(target.endpoint, ENDPOINTS)
+    skipped = _skipped_artifacts(schedule, target.endpoint, ENDPOINTS, endpoints)
+    if skipped is not None:
+        pipeline.submit_data(
+            _target_tar_path(target, output_path),
+            f"skipped_@_{target.hostname}_@_{TIMESTAMP}",
+            skipped,
+        )
+    if not endpoints or schedule.skip(TARGETS, target.endpoint):
+        return
+    with schedule.timed(TARGETS, target.endpoint, full=len(endpoints) == len(ENDPOINTS)):
+        _fetch_target(target, output_path, pipeline, index, endpoints, policy)
+    schedule.collected(target.endpoint, endpoints)
+
 
-            file_name = f"{endpoint}_@_{target.hostname}_@_{TIMESTAMP}"
-            _add_file_to_tar(file_name, content.text, tar_path)
+async def _fetch_scheduled_target_async(  # pylint: disable=R0913,R0917
+    target: _ConfigTarget,
+    output_path: str,
+    pipeline: ArchivePipeline,
+    index: Optional[PackageIndex],
+    schedule: RunSchedule,
+    policy: EncodingPolicy = EncodingPolicy(),
+) -> None:
+    """Asyncio variant of `_fetch_scheduled_target`."""
+    endpoints = schedule.due(target.endpoint, ENDPOINTS)
+    skipped = _skipped_artifacts(schedule, target.endpoint, ENDPOINTS, endpoints)
+    if skipped is not None:
+        await pipeline.submit_data_async(
+            _target_tar_path(target, output_path),
+            f"skipped_@_{target.hostname}_@_{TIMESTAMP}",
+            skipped,
+        )
+    if not endpoints or schedule.skip(TARGETS, target.endpoint):
+        return
+    with schedule.timed(TARGETS, target.endpoint, full=len(endpoints) == len(ENDPOINTS)):
+        await _fetch_target_async(target, output_path, pipeline, index, endpoints, policy)
+    schedule.collected(target.endpoint, endpoints)
 
 
-async def get_controller(config: Config) -> Controller:
-    """Return connected instance of Juju Controller."""
+def _collects_concurrently(config: Config) -> bool:
+    """Return True if jobs may run concurrently, so that their order matters.
+
+    Adaptive limiter may allow several jobs at once even with a single worker.
+    """
+    return config.settings.workers > 1 or config.settings.concurrency == "adaptive"
+
+
+def _scheduled_targets(config: Config, schedule: RunSchedule) -> List[_ConfigTarget]:
+    """Return targets in the order in which they should be collected.
+
+    Longest targets go first if they are collected concurrently.
+    """
+    if not _collects_concurrently(config):
+        return config.targets
+    return schedule.order(TARGETS, config.targets, key=lambda target: target.endpoint)
+
+
+async def _fetch_exporter_data_async(
+    config: Config,
+    schedule: RunSchedule,
+    limiter: Optional[AdaptiveLimiter],
+    sink: Optional[TarStreamSink] = None,
+) -> None:
+    """Query exporters concurrently on the event loop.
+
+    Up to `settings.workers` exporters are queried at once, or as many as the adaptive
+    limiter allows.
+    """
+    semaphore = asyncio.Semaphore(config.settings.workers)
+    policy = encoding_policy(config.settings)
+    with _new_pipeline(config, sink) as pipeline, _package_index(config) as index:
+
+        async def fetch_target(target: _ConfigTarget) -> None:
+            async with semaphore if limiter is None else limiter.async_slot():
+                await _fetch_scheduled_target_async(
+                    target, _output_dir(config, target), pipeline, index, schedule, policy
+                )
+
+        tasks = [
+            asyncio.ensure_future(fetch_target(target))
+            for target in _scheduled_targets(config, schedule)
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except Exception:
+            for task in tasks:
+                task.cancel()
+            raise
+
+
+def fetch_exporter_data(
+    config: Config,
+    schedule: Optional[RunSchedule] = None,
+    limiter: Optional[AdaptiveLimiter] = None,
+    sink: Optional[TarStreamSink] = None,
+) -> None:
+    """Query exporter endpoints and collect data.
+
+    Up to `settings.workers` exporters are queried in parallel, either by a pool of
+    threads, or by asyncio HTTP client running on the event loop shared with Juju
+    client if `settings.http_engine` is 'asyncio'. With adaptive concurrency, the
+    number of parallel queries follows the limit of the adaptive limiter instead,
+    up to `settings.max_workers`.
+
+    :param config: Collector configuration
+    :param schedule: Schedule of the run that orders the targets, measures them and
+        skips the ones that would not finish before the deadline
+    :param limiter: Adaptive limiter of parallel queries, created from the settings
+        if not provided
+    :param sink: Streaming sink of the collected data, tarballs are written if not provided
+    """
+    schedule = schedule or RunSchedule()
+    limiter = limiter or new_limiter(config.settings)
+    if config.settings.http_engine == "asyncio":
+        jasyncio.run(_fetch_exporter_data_async(config, schedule, limiter, sink))
+        return
+
+    workers = config.settings.workers if limiter is None else limiter.maximum
+    policy = encoding_policy(config.settings)
+    with _new_pipeline(config, sink) as pipeline, _package_index(config) as index:
+
+        def fetch_target(target: _ConfigTarget) -> None:
+            with nullcontext() if limiter is None else limiter.slot():
+                _fetch_scheduled_target(
+                    target, _output_dir(config, target), pipeline, index, schedule, policy
+                )
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(fetch_target, target)
+                for target in _scheduled_targets(config, schedule)
+            ]
+            try:
+                for future in futures:
+                    future.result()
+            except CollectionError:
+                for future in futures:
+                    future.cancel()
+                raise
+
+
+async def get_controller(
+    config: Config, juju_controller: Optional[_ConfigJujuController] = None
+) -> Controller:
+    """Return connected instance of Juju Controller.
+
+    :param config: Collector configuration
+    :param juju_controller: Controller to connect to, defaults to the first configured one
+    """
+    juju_controller = juju_controller or config.controllers[0]
     controller = Controller()
     await controller.connect(
-        endpoint=config.juju_controller.endpoint,
-        username=config.juju_controller.username,
-        password=config.juju_controller.password,
-        cacert=config.juju_controller.ca_cert,
+        endpoint=juju_controller.endpoint,
+        username=juju_controller.username,
+        password=juju_controller.password,
+        cacert=juju_controller.ca_cert,
     )
     return controller
 
 
-async def _save_bundle_data(model: Model, file_name: str, dest_tarball: str) -> None:
-    """Save exported bundle into the file inside 'dest_tarball'.
+async def get_controllers(config: Config) -> Dict[str, Controller]:
+    """Connect to all configured Juju controllers concurrently.
 
-    Exported bundle is stripped from the Cross Model Relation data.
+    If any of the connections fails, the established ones are closed and the
+    error is raised.
 
-    :param model: Connected Juju model object
-    :param file_name: Filename of the exported bundle within tarball
-    :param dest_tarball: Output tarball in which the bundle file will be stored.
-    :return: None
+    :param config: Collector configuration
+    :return: Connected controllers by their names
     """
-    try:
-        bundle = await model.export_bundle()
-    except JujuAPIError as exc:
-        if str(exc) == "nothing to export as there are no applications":
-            bundle = "{}"
-        else:
-            raise exc
+    juju_controllers = config.controllers
+    results = await asyncio.gather(
+        *(get_controller(config, juju_controller) for juju_controller in juju_controllers),
+        return_exceptions=True,
+    )
+    controllers = {}
+    for juju_controller, result in zip(juju_controllers, results):
+        if isinstance(result, Controller):
+            controllers[juju_controller.name] = result
+    failures = [result for result in results if isinstance(result, BaseException)]
+    if failures:
+        await disconnect_controllers(controllers)
+        raise failures[0]
+    return controllers
 
-    bundle_yaml = yaml.load_all(bundle, Loader=yaml.FullLoader)
-    for data in bundle_yaml:
+
+async def disconnect_controllers(controllers: Mapping[str, Controller]) -> None:
+    """Disconnect from all Juju controllers."""
+    await asyncio.gather(*(controller.disconnect() for controller in controllers.values()))
+
+
+@contextmanager
+def _process_pool(config: Config) -> Iterator[Optional[Executor]]:
+    """Return process pool for CPU heavy work, or None if it's not enabled in config."""
+    if not config.settings.archive_processes:
+        yield None
+        return
+
+    with ProcessPoolExecutor(max_workers=config.settings.archive_processes) as pool:
+        yield pool
+
+
+async def _run_cpu_bound(pool: Optional[Executor], func: Callable[..., _T], *args: Any) -> _T:
+    """Run function in a process pool without blocking the event loop.
+
+    Function is called directly if the process pool is not enabled.
+    """
+    if pool is None:
+        return func(*args)
+    return await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+
+
+def _bundle_to_json(bundle: str) -> List[str]:
+    """Convert exported YAML bundle to JSON, skipping the Cross Model Relation data."""
+    documents = []
+    for data in yaml.load_all(bundle, Loader=yaml.FullLoader):
         bundle_json = json.dumps(data)
         # skip SAAS; multiple documents, we need to import only the bundle
         if "offers" in bundle_json:
             continue
+        documents.append(bundle_json)
+    return documents
+
 
-        _add_file_to_tar(file_name, bundle_json, dest_tarball)
+async def _save_bundle_data(  # pylint: disable=R0913,R0917
+    model: Model,
+    file_name: str,
+    dest_tarball: str,
+    pipeline: ArchivePipeline,
+    pool: Optional[Executor] = None,
+    reserve: int = SPOOL_SIZE,
+) -> int:
+    """Save exported bundle into the file inside 'dest_tarball'.
 
+    Exported bundle is stripped from the Cross Model Relation data. Memory for the
+    bundle is reserved before it's exported, as Juju client loads it as a whole.
 
-async def _save_status_data(model: Model, file_name: str, dest_tarball: str) -> None:
+    :param model: Connected Juju model object
+    :param file_name: Filename of the exported bundle within tarball
+    :param dest_tarball: Output tarball in which the bundle file will be stored.
+    :param pipeline: Archive pipeline that writes the data
+    :param pool: Optional process pool used to parse the bundle
+    :param reserve: Number of bytes to reserve from the memory budget for the bundle
+    :return: Number of saved bytes
+    """
+    reserved = await pipeline.reserve_async(reserve)
+    try:
+        try:
+            bundle = await model.export_bundle()
+        except JujuAPIError as exc:
+            if str(exc) == "nothing to export as there are no applications":
+                bundle = "{}"
+            else:
+                raise exc
+        documents = await _run_cpu_bound(pool, _bundle_to_json, bundle)
+    except BaseException:
+        pipeline.budget.release(reserved)
+        raise
+
+    size = 0
+    for bundle_json in documents:
+        data = bundle_json.encode("UTF-8")
+        size += len(data)
+        reserved = await pipeline.submit_data_async(dest_tarball, file_name, data, reserved)
+    pipeline.budget.release(reserved)
+    return size
+
+
+async def _save_status_data(
+    model: Model,
+    file_name: str,
+    dest_tarball: str,
+    pipeline: ArchivePipeline,
+    reserve: int = SPOOL_SIZE,
+) -> bytes:
     """Save status data of a model.
 
+    Memory for the status is reserved before it's queried, as Juju client loads
+    it as a whole.
+
     :param model: Connected Juju model object
     :param file_name: Filename of the exported bundle within tarball
     :param dest_tarball: Output tarball in which the bundle file will be stored.
-    :return: None
+    :param pipeline: Archive pipeline that writes the data
+    :param reserve: Number of bytes to reserve from the memory budget for the status
+    :return: Saved status in JSON format
+    """
+    reserved = await pipeline.reserve_async(reserve)
+    try:
+        status = await model.get_status()
+        data = status.to_json().encode("UTF-8")
+    except BaseException:
+        pipeline.budget.release(reserved)
+        raise
+    pipeline.budget.release(
+        await pipeline.submit_data_async(dest_tarball, file_name, data, reserved)
+    )
+    return data
+
+
+@contextmanager
+def _discovery_pool(config: Config) -> Iterator[Optional[Executor]]:
+    """Return thread pool for discovered exporters.
+
+    Thread pool is not needed (None is returned) if discovery is not enabled or if
+    exporters are queried by asyncio HTTP client.
+    """
+    if not config.settings.discover_targets or config.settings.http_engine == "asyncio":
+        yield None
+        return
+
+    with ThreadPoolExecutor(max_workers=config.settings.workers) as pool:
+        yield pool
+
+
+@dataclass
+class _JujuCollection:  # pylint: disable=R0902
+    """Resources shared by collection of all models from a controller."""
+
+    config: Config
+    pipeline: ArchivePipeline
+    exporter_slots: asyncio.Semaphore
+    pool: Optional[Executor] = None
+    exporters: Optional[Executor] = None
+    index: Optional[PackageIndex] = None
+    schedule: RunSchedule = field(default_factory=RunSchedule)
+    policy: EncodingPolicy = EncodingPolicy()
+    models: ModelCache = field(default_factory=lambda: ModelCache(max_size=0))
+    exporter_jobs: List["asyncio.Future[None]"] = field(default_factory=list)
+
+    def reservation(self, label: str, artifact: str) -> int:
+        """Return number of bytes to reserve for an artifact of a model before it's fetched.
+
+        Artifacts reserve their size from the previous run, including the copies made
+        while they're stored. Artifacts of unknown size reserve the whole memory budget.
+        """
+        size = self.schedule.size(label, artifact)
+        if size is None:
+            return self.pipeline.budget.limit
+        return int(size) * JUJU_COPIES
+
+    async def _fetch_target_async(self, target: _ConfigTarget) -> None:
+        """Query discovered exporter on the event loop, limited by `exporter_slots`."""
+        async with self.exporter_slots:
+            await _fetch_scheduled_target_async(
+                target,
+                _output_dir(self.config, target),
+                self.pipeline,
+                self.index,
+                self.schedule,
+                self.policy,
+            )
+
+    def fetch_discovered_targets(self, model_name: str, status: Dict) -> None:
+        """Start collection from exporters discovered in the model status.
+
+        Exporters that are already listed in config targets are skipped.
+        """
+        settings = self.config.settings
+        if not settings.discover_targets:
+            return
+
+        loop = asyncio.get_running_loop()
+        known_endpoints = {target.endpoint for target in self.config.targets}
+        for target in discover_targets(status, model_name, settings):
+            if target.endpoint in known_endpoints:
+                continue
+            job: "asyncio.Future[None]"
+            if self.exporters is None:
+                job = asyncio.ensure_future(self._fetch_target_async(target))
+            else:
+                job = loop.run_in_executor(
+                    self.exporters,
+                    _fetch_scheduled_target,
+                    target,
+                    _output_dir(self.config, target),
+                    self.pipeline,
+                    self.index,
+                    self.schedule,
+                    self.policy,
+                )
+            self.exporter_jobs.append(job)
+
+
+def _model_tar_path(config: Config, label: str) -> str:
+    """Return path to tarball that holds data collected from the model."""
+    settings = config.settings
+    tar = f"{settings.customer}_@_{settings.site}_@_{label}_@_{TIMESTAMP}.tar"
+    return os.path.join(archive_dir(settings, settings.customer, settings.site, TIMESTAMP), tar)
+
+
+async def _fetch_model_data(
+    controller: Controller,
+    model_name: str,
+    collection: _JujuCollection,
+    artifacts: Sequence[str] = tuple(JUJU_ARTIFACTS),
+    controller_name: str = "",
+) -> None:
+    """Collect status and bundle of a single model, or only those of them that are due.
+
+    Collection from exporters discovered in the model starts as soon as the status
+    is received. Applications from the status are added to the package index.
+    Outputs of the model are named by `model_label`, so models with the same name
+    on different controllers don't collide. The model connection is checked out of
+    the model cache of the collection, and artifacts are collected once more over
+    a new connection if the cached one turns out to be broken.
     """
-    status = await model.get_status()
-    _add_file_to_tar(file_name, status.to_json(), dest_tarball)
+    settings = collection.config.settings
+    label = model_label(controller_name, model_name)
+    tar_path = _model_tar_path(collection.config, label)
+    bundle_file = f"juju_bundle_@_{label}_@_{TIMESTAMP}"
+    status_file = f"juju_status_@_{label}_@_{TIMESTAMP}"
+
+    remaining = list(artifacts)
+
+    async def collect(model: Model) -> None:
+        if "status" in remaining:
+            status_json = await _save_status_data(
+                model,
+                status_file,
+                tar_path,
+                collection.pipeline,
+                collection.reservation(label, "status"),
+            )
+            collection.schedule.record_size(label, "status", len(status_json))
+            # status is parsed only when it's needed, as it can be large
+            status = {}
+            if collection.index is not None or settings.discover_targets:
+                status = json.loads(status_json)
+            # once written, the status is no longer covered by the memory budget
+            del status_json
+            if collection.index is not None:
+                collection.index.add_status(settings, label, status)
+            collection.fetch_discovered_targets(label, status)
+            # retry with a new connection must not store the status twice
+            remaining.remove("status")
+        if "bundle" in remaining:
+            size = await _save_bundle_data(
+                model,
+                bundle_file,
+                tar_path,
+                collection.pipeline,
+                collection.pool,
+                collection.reservation(label, "bundle"),
+            )
+            collection.schedule.record_size(label, "bundle", size)
 
+    await collection.models.run(controller, controller_name, model_name, collect)
 
-async def fetch_juju_data(config: Config, controller: Controller) -> None:
-    """Query Juju controller and collect information about models."""
-    model_uuids = await controller.model_uuids()
-    customer = config.settings.customer
-    site = config.settings.site
-    output_path = config.settings.collection_path
-    tar_name = f"{customer}_@_{site}_@_{{model}}_@_{TIMESTAMP}.tar"
 
-    for model_name in model_uuids.keys():
-        model = await controller.get_model(model_name)
-        bundle_file = f"juju_bundle_@_{model_name}_@_{TIMESTAMP}"
-        status_file = f"juju_status_@_{model_name}_@_{TIMESTAMP}"
-        tar_path = os.path.join(output_path, tar_name.format(model=model_name))
+async def _list_models(controllers: Mapping[str, Controller]) -> List[Tuple[str, str]]:
+    """Return names of controllers and models of all controllers, queried concurrently."""
+    names = list(controllers)
+    model_uuids = await asyncio.gather(*(controllers[name].model_uuids() for name in names))
+    return [
+        (name, model_name) for name, models in zip(names, model_uuids) for model_name in models
+    ]
 
-        await _save_status_data(model, status_file, tar_path)
-        await _save_bundle_data(model, bundle_file, tar_path)
-        await model.disconnect()
 
-    await controller.disconnect()
+async def fetch_juju_data(
+    config: Config,
+    controllers: Mapping[str, Controller],
+    schedule: Optional[RunSchedule] = None,
+    sink: Optional[TarStreamSink] = None,
+    models: Optional[ModelCache] = None,
+) -> None:
+    """Query Juju controllers and collect information about models.
+
+    Models of all controllers are collected on one event loop, up to
+    `settings.workers` of them concurrently, the longest ones first. If target
+    discovery is enabled, exporters found in the models are collected as well.
+    Artifacts that are not due are listed in a 'juju_skipped' member of the tarball.
+
+    :param config: Collector configuration
+    :param controllers: Connected Juju controllers by their names
+    :param schedule: Schedule of the run that orders the models, measures them and
+        skips the ones that would not finish before the deadline
+    :param sink: Streaming sink of the collected data, tarballs are written if not provided
+    :param models: Cache of model connections reused by repeated collections, the
+        controllers are then left connected for the caller to reuse and disconnect.
+        Models and controllers are disconnected after the collection if not provided
+    """
+    schedule = schedule or RunSchedule()
+    model_names = await _list_models(controllers)
+    # models are limited by workers only, adaptive limiter applies to exporters
+    if config.settings.workers > 1:
+        model_names = schedule.order(MODELS, model_names, key=lambda model: model_label(*model))
+    semaphore = asyncio.Semaphore(config.settings.workers)
+
+    with _new_pipeline(config, sink) as pipeline, _process_pool(config) as pool, _discovery_pool(
+        config
+    ) as exporters, _package_index(config) as index:
+        collection = _JujuCollection(
+            config,
+            pipeline,
+            exporter_slots=asyncio.Semaphore(config.settings.workers),
+            pool=pool,
+            exporters=exporters,
+            index=index,
+            schedule=schedule,
+            policy=encoding_policy(config.settings),
+            models=ModelCache(max_size=0) if models is None else models,
+        )
+
+        async def fetch_model(controller_name: str, model_name: str) -> None:
+            label = model_label(controller_name, model_name)
+            artifacts = schedule.due(label, JUJU_ARTIFACTS)
+            # status is always needed to discover exporters and index applications
+            if "status" not in artifacts and (
+                index is not None or config.settings.discover_targets
+            ):
+                artifacts.insert(0, "status")
+            skipped = _skipped_artifacts(schedule, label, JUJU_ARTIFACTS, artifacts)
+            if skipped is not None:
+                await pipeline.submit_data_async(
+                    _model_tar_path(config, label),
+                    f"juju_skipped_@_{label}_@_{TIMESTAMP}",
+                    skipped,
+                )
+            async with semaphore:
+                if not artifacts or schedule.skip(MODELS, label):
+                    return
+                with timed(f"model {label}"), schedule.timed(
+                    MODELS, label, full=len(artifacts) == len(JUJU_ARTIFACTS)
+                ):
+                    await _fetch_model_data(
+                        controllers[controller_name],
+                        model_name,
+                        collection,
+                        artifacts,
+                        controller_name,
+                    )
+                schedule.collected(label, artifacts)
+
+        tasks = [asyncio.ensure_future(fetch_model(*model)) for model in model_names]
+        try:
+            await asyncio.gather(*tasks)
+            await asyncio.gather(*collection.exporter_jobs)
+        except Exception:
+            for task in tasks + collection.exporter_jobs:
+                task.cancel()
+            raise
+
+    # controllers of a model cache are kept connected along with their models
+    if models is None:
+        await disconnect_controllers(controllers)
+
+
+def finalize_archives(config: Config) -> None:
+    """Compress tarballs produced by this run and prune archives of old runs.
+
+    With `settings.deterministic`, tarballs are first rewritten so that the same data
+    produce the same tarball in any run. Tarballs are compressed in parallel by
+    `settings.archive_processes` worker processes if compression is enabled. With
+    'zstd-dict' compression, a zstd dictionary is trained from the collected payloads,
+    saved next to the tarballs, and each payload is compressed with it. With 'indexed'
+    archive format, tarballs are then merged into a single archive per directory with
+    a sidecar index of its members. Old runs are removed according to the retention
+    settings.
+    """
+    settings = config.settings
+    tar_paths = glob.glob(archive_pattern(settings, TIMESTAMP))
+    if settings.deterministic:
+        _map_archives(config, normalize_tarball, tar_paths, TIMESTAMP)
+    dictionary = b""
+    if settings.compression == DICTIONARY_COMPRESSION:
+        dictionary = _save_dictionary(tar_paths)
+        _map_archives(config, compress_members, tar_paths, dictionary)
+    elif settings.compression:
+        _map_archives(config, compress_tarball, tar_paths, settings.compression)
+    if settings.archive_format == INDEXED_FORMAT:
+        _consolidate_archives(tar_paths, bool(dictionary), settings.deterministic)
+    prune_archives(settings, TIMESTAMP)
+
+
+def _consolidate_archives(
+    tar_paths: List[str], with_dictionary: bool, deterministic: bool = False
+) -> None:
+    """Merge tarballs of this run into single indexed archive in each directory.
+
+    Names of members of deterministic archives don't contain the run.
+    """
+    directories: Dict[str, List[str]] = {}
+    for tar_path in sorted(tar_paths):
+        directories.setdefault(os.path.dirname(tar_path), []).append(tar_path)
+    for directory, paths in directories.items():
+        dictionary = dictionary_path(directory, TIMESTAMP) if with_dictionary else ""
+        consolidate_tarballs(
+            paths,
+            consolidated_path(directory, TIMESTAMP),
+            os.path.basename(dictionary),
+            TIMESTAMP if deterministic else "",
+        )
+
+
+def _save_dictionary(tar_paths: List[str]) -> bytes:
+    """Train zstd dictionary from tarballs and save it into each directory with them."""
+    dictionary = train_dictionary(tar_paths)
+    if dictionary:
+        for directory in {os.path.dirname(tar_path) for tar_path in tar_paths}:
+            with open(dictionary_path(directory, TIMESTAMP), "wb") as dictionary_file:
+                dictionary_file.write(dictionary)
+    return dictionary
+
+
+def _map_archives(
+    config: Config, func: Callable[[str, _T], str], tar_paths: List[str], argument: _T
+) -> None:
+    """Process tarballs, in parallel if the process pool is enabled."""
+    with _process_pool(config) as pool:
+        if pool is None:
+            for tar_path in tar_paths:
+                func(tar_path, argument)
+        else:
+            list(pool.map(func, tar_paths, repeat(argument)))
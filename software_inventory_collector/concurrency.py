@@ -0,0 +1,223 @@
+"""Adaptive limit of concurrently queried exporters."""
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Callable, Deque, Iterator, Optional, Tuple
+
+from software_inventory_collector.config import _ConfigSettings
+
+ADAPTIVE = "adaptive"
+
+# Limit is multiplied by this factor when latency rises or a request fails
+BACKOFF = 0.7
+# Latency is considered rising when it exceeds the lowest observed latency
+# this many times, plus the slack that absorbs jitter of fast networks
+LATENCY_TOLERANCE = 1.5
+LATENCY_SLACK = 0.005
+
+# Limiter and start time of the query within the slot held by the current thread or task
+_SLOT: ContextVar[Optional[Tuple["AdaptiveLimiter", float]]] = ContextVar("_SLOT", default=None)
+
+
+class AsyncWaiters:
+    """Tasks waiting for a resource that is shared with threads.
+
+    Threads wait on the condition guarding the resource, while tasks wait on
+    futures of their event loops, so that they don't occupy threads of an executor
+    that the holders of the resource might need to release it.
+    """
+
+    def __init__(self) -> None:
+        """Initiate empty queue of waiters."""
+        self._waiters: Deque[Tuple[asyncio.AbstractEventLoop, "asyncio.Future[None]"]] = deque()
+
+    async def wait_for(
+        self, condition: threading.Condition, predicate: Callable[[], bool]
+    ) -> None:
+        """Wait on the running event loop until the predicate holds.
+
+        :param condition: Condition guarding the resource, held while the predicate runs
+        :param predicate: Function that takes the resource if it's available
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            with condition:
+                if predicate():
+                    return
+                waiter = loop.create_future()
+                self._waiters.append((loop, waiter))
+            await waiter
+
+    def wake_up(self, count: Optional[int] = None) -> None:
+        """Wake up the first `count` waiting tasks, or all of them if None.
+
+        Cancelled tasks don't count. Must be called with the condition held.
+        """
+        while self._waiters and (count is None or count > 0):
+            loop, waiter = self._waiters.popleft()
+            if not waiter.cancelled():
+                loop.call_soon_threadsafe(_set_done, waiter)
+                if count is not None:
+                    count -= 1
+
+
+class AdaptiveLimiter:  # pylint: disable=R0902
+    """AIMD limit of concurrently queried exporters.
+
+    Each exporter is queried within a slot, and the latency of its first response
+    is compared with the lowest latency observed so far. While latency stays flat,
+    the limit grows: by one per response until the first backoff (slow start), then
+    by one per round of responses. When latency rises or a query fails, the limit is
+    multiplied by `BACKOFF`, at most once per round, as queries started before the
+    backoff can't reflect it yet.
+    """
+
+    def __init__(self, initial: int, maximum: int, minimum: int = 1) -> None:
+        """Initiate limiter.
+
+        :param initial: Initial number of concurrent queries
+        :param maximum: Maximum number of concurrent queries
+        :param minimum: Minimum number of concurrent queries
+        """
+        self.minimum = minimum
+        self.maximum = max(maximum, minimum)
+        self.limit = float(min(max(initial, minimum), self.maximum))
+        self.lowest = self.highest = self.limit
+        self.backoffs = 0
+        self.in_flight = 0
+        self._baseline: Optional[float] = None
+        self._backoff_at = float("-inf")
+        self._condition = threading.Condition()
+        self._async_waiters = AsyncWaiters()
+
+    def _try_acquire(self) -> bool:
+        """Take a slot if the limit allows it, must be called with the lock held."""
+        if self.in_flight >= int(self.limit):
+            return False
+        self.in_flight += 1
+        return True
+
+    def _wake_up(self) -> None:
+        """Wake up threads and tasks waiting for the free slots, must be called with the lock held.
+
+        Woken up waiters check the limit again, so waking up too many of them is safe,
+        but it would be wasteful with thousands of tasks waiting.
+        """
+        free = int(self.limit) - self.in_flight
+        if free <= 0:
+            return
+        self._condition.notify(free)
+        self._async_waiters.wake_up(free)
+
+    def _release(self) -> None:
+        """Return a slot."""
+        with self._condition:
+            self.in_flight -= 1
+            self._wake_up()
+
+    def observe(self, started: float, latency: float, failed: bool = False) -> None:
+        """Adjust the limit based on a response.
+
+        :param started: Monotonic time when the query started
+        :param latency: Time until the first response of the query
+        :param failed: True if the query failed
+        """
+        with self._condition:
+            if not failed:
+                self._baseline = (
+                    latency if self._baseline is None else min(self._baseline, latency)
+                )
+            rising = failed or (
+                self._baseline is not None
+                and latency > self._baseline * LATENCY_TOLERANCE + LATENCY_SLACK
+            )
+            if not rising:
+                self.limit = min(
+                    self.maximum, self.limit + (1 / self.limit if self.backoffs else 1)
+                )
+            elif started > self._backoff_at:
+                self.limit = max(self.minimum, self.limit * BACKOFF)
+                self._backoff_at = time.monotonic()
+                self.backoffs += 1
+            self.lowest = min(self.lowest, self.limit)
+            self.highest = max(self.highest, self.limit)
+            self._wake_up()
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """Hold a slot in the current thread, waiting until the limit allows it."""
+        with self._condition:
+            self._condition.wait_for(self._try_acquire)
+        with self._observed():
+            yield
+
+    @asynccontextmanager
+    async def async_slot(self) -> AsyncIterator[None]:
+        """Hold a slot in the current task, waiting until the limit allows it."""
+        await self._async_waiters.wait_for(self._condition, self._try_acquire)
+        with self._observed():
+            yield
+
+    @contextmanager
+    def _observed(self) -> Iterator[None]:
+        """Observe failure or latency of the first response of the query within a slot."""
+        started = time.monotonic()
+        token = _SLOT.set((self, started))
+        try:
+            yield
+        except Exception:
+            self.observe(started, time.monotonic() - started, failed=True)
+            raise
+        finally:
+            _SLOT.reset(token)
+            self._release()
+
+    def report(self) -> str:
+        """Return summary of the limit during the run."""
+        return (
+            f"Exporter concurrency: limit {int(self.limit)} "
+            f"(lowest {int(self.lowest)}, highest {int(self.highest)}, "
+            f"{self.backoffs} backoffs)"
+        )
+
+
+def _set_done(waiter: "asyncio.Future[None]") -> None:
+    """Wake up a waiting task, unless it was cancelled."""
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+def new_limiter(settings: _ConfigSettings) -> Optional[AdaptiveLimiter]:
+    """Return adaptive limiter if it's enabled in the settings."""
+    if settings.concurrency != ADAPTIVE:
+        return None
+    return AdaptiveLimiter(settings.workers, settings.max_workers)
+
+
+def record_request() -> None:
+    """Report that the current query sends its first request.
+
+    Latency is measured from here rather than from taking the slot, so that waiting
+    for the memory budget within the slot doesn't count as latency of the exporter.
+    """
+    slot = _SLOT.get()
+    if slot is None:
+        return
+    _SLOT.set((slot[0], time.monotonic()))
+
+
+def record_response() -> None:
+    """Report that the current query received its first response.
+
+    Only the first response within a slot is observed, as the later ones are
+    delayed by reading of the previous responses.
+    """
+    slot = _SLOT.get()
+    if slot is None:
+        return
+    limiter, started = slot
+    _SLOT.set(None)
+    limiter.observe(started, time.monotonic() - started)
@@ -1,18 +1,138 @@
 """Module containing software-inventory-collector configuration classes."""
-from dataclasses import dataclass, fields
-from typing import ClassVar, Dict, List, get_args, get_origin
+from dataclasses import MISSING, dataclass, field, fields
+from typing import (
+    Any,
+    ClassVar,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+    get_args,
+    get_origin,
+)
 
 from typing_extensions import Self
 
-from software_inventory_collector.exception import ConfigMissingKeyError
+from software_inventory_collector.archive import (
+    ARCHIVE_FORMATS,
+    COMPRESSIONS,
+    COMPRESSORS,
+    INDEXED_FORMAT,
+)
+from software_inventory_collector.exception import (
+    ConfigError,
+    ConfigInvalidValueError,
+    ConfigMissingKeyError,
+)
+
+
+class _FieldSchema(NamedTuple):
+    """Resolved definition of a single config attribute."""
+
+    name: str
+    value_type: type
+    is_list: bool
+    is_nested: bool
+    required: bool
+
+
+HTTP_ENGINES = ("sync", "asyncio")
+LAYOUTS = ("flat", "sharded")
+CONCURRENCY_MODES = ("fixed", "adaptive")
+OUTPUTS = ("file", "stdout", "http")
+TRANSFER_ENCODINGS = ("gzip", "zstd")
+
+_SCHEMAS: Dict[type, Tuple[_FieldSchema, ...]] = {}
+
+
+def _resolve_schema(config_class: type) -> Tuple[_FieldSchema, ...]:
+    """Return attribute definitions of a config class.
+
+    Definitions are cached, so type introspection runs only once per class.
+    """
+    schema = _SCHEMAS.get(config_class)
+    if schema is None:
+        resolved = []
+        for attribute in fields(config_class):
+            attribute_type = attribute.type
+            # Optional[X] attributes hold X when they are present in the config
+            if get_origin(attribute_type) == Union:
+                attribute_type = get_args(attribute_type)[0]
+            is_list = get_origin(attribute_type) == list
+            value_type: Any = get_args(attribute_type)[0] if is_list else attribute_type
+            resolved.append(
+                _FieldSchema(
+                    name=attribute.name,
+                    value_type=value_type,
+                    is_list=is_list,
+                    is_nested=issubclass(value_type, _BaseConfig),
+                    required=attribute.default is MISSING and attribute.default_factory is MISSING,
+                )
+            )
+        schema = _SCHEMAS[config_class] = tuple(resolved)
+    return schema
+
+
+def _parse_value(
+    attribute: _FieldSchema, value: Any, path: str, index: Optional[int] = None
+) -> Any:
+    """Validate single (non-list) value of a config attribute.
+
+    :param attribute: Definition of the attribute
+    :param value: Raw value from the config data
+    :param path: Location of the config section that contains the attribute
+    :param index: Position of the value if the attribute is a list
+    :return: Validated value or nested config object
+    """
+    # Full key is built only when it's needed, as this runs for every value in the config
+    if attribute.is_nested:
+        return attribute.value_type.from_dict(  # type: ignore[attr-defined]
+            value, _key(path, attribute.name, index)
+        )
+
+    # YAML loads unquoted numeric scalars (e.g. `site: 2023`) as numbers
+    if (
+        attribute.value_type is str
+        and isinstance(value, (int, float))
+        and not isinstance(value, bool)
+    ):
+        return str(value)
+    # bool is a subclass of int, but it's never a valid number in config
+    if not isinstance(value, attribute.value_type) or (
+        isinstance(value, bool) and attribute.value_type is not bool
+    ):
+        raise ConfigInvalidValueError(
+            _key(path, attribute.name, index),
+            f"expected {attribute.value_type.__name__}, got {type(value).__name__}",
+        )
+    return value
+
+
+def model_label(controller_name: str, model_name: str) -> str:
+    """Return name of a model in the output, prefixed with the name of its controller.
+
+    Models of an unnamed controller keep their plain names. Names of Juju models
+    can't contain '.', so the label is unambiguous even if controller names do.
+    """
+    return f"{controller_name}.{model_name}" if controller_name else model_name
+
+
+def _key(path: str, name: str, index: Optional[int] = None) -> str:
+    """Return full key of an attribute (e.g. 'targets[4].endpoint') used in error messages."""
+    key = f"{path}.{name}" if path else name
+    return key if index is None else f"{key}[{index}]"
 
 
 @dataclass
 class _BaseConfig:
+    __slots__ = ()
+
     NAME: ClassVar[str] = ""
 
     @classmethod
-    def from_dict(cls, source: Dict) -> Self:
+    def from_dict(cls, source: Dict, path: Optional[str] = None) -> Self:
         """Create a config object from raw config data.
 
         This method finds values for each dataclass attributes specified in the class.
@@ -23,33 +143,60 @@ class _BaseConfig:
             * list of nested config structures (section_name:
                 [{section_config}, {section_config}]
 
+        Attributes that define a default value are optional and fall back to that
+        default when missing from the source data. Every value, including items of
+        lists, is validated against the type of its attribute.
+
         :param source: Dict data from config to populate specific config subsection.
+        :param path: Location of the subsection within the config (e.g. 'targets[4]'),
+            used in error messages. Defaults to the `NAME` of the class.
         :return: Initiated instance of the class.
         """
+        path = cls.NAME if path is None else path
+        if not isinstance(source, dict):
+            raise ConfigInvalidValueError(path, f"expected mapping, got {type(source).__name__}")
+
         kwargs = {}
-        try:
-            for field in fields(cls):
-                origin_type = get_origin(field.type)
-                value = source[field.name]
-                if origin_type == list:
-                    # Handle lists of simple and nested config values
-                    nested_type = get_args(field.type)[0]
-                    if issubclass(nested_type, _BaseConfig):
-                        kwargs[field.name] = [nested_type(**value) for value in value]
-                    else:
-                        kwargs[field.name] = value
-                elif issubclass(field.type, _BaseConfig):
-                    kwargs[field.name] = field.type.from_dict(value)  # type: ignore
-                else:
-                    kwargs[field.name] = value
-        except KeyError as exc:
-            raise ConfigMissingKeyError(f"{cls.NAME}.{exc.args[0]}") from exc
+        for attribute in _resolve_schema(cls):
+            if attribute.name not in source:
+                if attribute.required:
+                    raise ConfigMissingKeyError(_key(path, attribute.name))
+                continue
+
+            value = source[attribute.name]
+            if not attribute.is_list:
+                kwargs[attribute.name] = _parse_value(attribute, value, path)
+            elif isinstance(value, list):
+                kwargs[attribute.name] = [
+                    _parse_value(attribute, item, path, index) for index, item in enumerate(value)
+                ]
+            else:
+                raise ConfigInvalidValueError(
+                    _key(path, attribute.name), f"expected list, got {type(value).__name__}"
+                )
 
         return cls(**kwargs)
 
 
 @dataclass
-class _ConfigSettings(_BaseConfig):
+class _ConfigIntervals(_BaseConfig):
+    """Definition for 'settings.intervals' subsection of main config.
+
+    Each value is the minimum number of seconds between two collections of
+    an artifact, 0 means that the artifact is collected in every run.
+    """
+
+    NAME = "intervals"
+
+    dpkg: int = 0
+    snap: int = 0
+    kernel: int = 0
+    status: int = 0
+    bundle: int = 0
+
+
+@dataclass
+class _ConfigSettings(_BaseConfig):  # pylint: disable=R0902
     """Definition for 'settings' subsection of main config."""
 
     NAME = "settings"
@@ -57,13 +204,115 @@ class _ConfigSettings(_BaseConfig):
     collection_path: str
     customer: str
     site: str
+    memory_budget: int = 64 * 1024 * 1024
+    workers: int = 1
+    concurrency: str = "fixed"
+    max_workers: int = 64
+    compression: str = ""
+    archive_processes: int = 0
+    targets_path: str = ""
+    discover_targets: bool = False
+    exporter_application: str = "software-inventory-exporter"
+    exporter_port: int = 8675
+    http_engine: str = "sync"
+    transfer_encoding: str = ""
+    index_path: str = ""
+    history_path: str = ""
+    run_deadline: int = 0
+    layout: str = "flat"
+    archive_format: str = "tar"
+    retention_runs: int = 0
+    retention_days: int = 0
+    retention_bytes: int = 0
+    deterministic: bool = False
+    output: str = "file"
+    ingest_url: str = ""
+    intervals: _ConfigIntervals = field(default_factory=_ConfigIntervals)
+
+    # Lowest allowed values of numeric settings, lower ones would stall or unbound the run
+    MINIMUMS: ClassVar[Dict[str, int]] = {
+        "memory_budget": 1,
+        "workers": 1,
+        "max_workers": 1,
+        "archive_processes": 0,
+        "run_deadline": 0,
+        "retention_runs": 0,
+        "retention_days": 0,
+        "retention_bytes": 0,
+    }
+
+    def __post_init__(self) -> None:
+        """Validate values of the settings."""
+        for name, minimum in self.MINIMUMS.items():
+            if getattr(self, name) < minimum:
+                raise ConfigError(
+                    f"Setting '{name}' must be at least {minimum}, got {getattr(self, name)}"
+                )
+        if self.compression and self.compression not in COMPRESSIONS:
+            raise ConfigError(
+                f"Unsupported compression '{self.compression}', "
+                f"supported values are: {', '.join(COMPRESSIONS)}"
+            )
+        if self.http_engine not in HTTP_ENGINES:
+            raise ConfigError(
+                f"Unsupported http_engine '{self.http_engine}', "
+                f"supported values are: {', '.join(HTTP_ENGINES)}"
+            )
+        if self.transfer_encoding and self.transfer_encoding not in TRANSFER_ENCODINGS:
+            raise ConfigError(
+                f"Unsupported transfer_encoding '{self.transfer_encoding}', "
+                f"supported values are: {', '.join(TRANSFER_ENCODINGS)}"
+            )
+        if self.archive_format not in ARCHIVE_FORMATS:
+            raise ConfigError(
+                f"Unsupported archive_format '{self.archive_format}', "
+                f"supported values are: {', '.join(ARCHIVE_FORMATS)}"
+            )
+        # consolidated archive must stay seekable, so it can't be compressed as a whole
+        if self.archive_format == INDEXED_FORMAT and self.compression in COMPRESSORS:
+            raise ConfigError(
+                f"Compression '{self.compression}' is not supported with "
+                f"'{INDEXED_FORMAT}' archive format"
+            )
+        if self.concurrency not in CONCURRENCY_MODES:
+            raise ConfigError(
+                f"Unsupported concurrency '{self.concurrency}', "
+                f"supported values are: {', '.join(CONCURRENCY_MODES)}"
+            )
+        if self.layout not in LAYOUTS:
+            raise ConfigError(
+                f"Unsupported layout '{self.layout}', "
+                f"supported values are: {', '.join(LAYOUTS)}"
+            )
+        if self.output not in OUTPUTS:
+            raise ConfigError(
+                f"Unsupported output '{self.output}', "
+                f"supported values are: {', '.join(OUTPUTS)}"
+            )
+        if self.output == "http" and not self.ingest_url:
+            raise ConfigError("Output 'http' requires 'ingest_url'")
+        # streamed archive is not stored, so it can't be compressed or laid out afterwards
+        if self.output != "file" and (
+            self.compression
+            or self.archive_format != "tar"
+            or self.layout != "flat"
+            or self.deterministic
+        ):
+            raise ConfigError(
+                f"Output '{self.output}' supports only uncompressed, non-deterministic "
+                "'tar' archive with 'flat' layout"
+            )
 
 
 @dataclass
 class _ConfigTarget(_BaseConfig):
-    """Definition for 'target' subsection of main config."""
+    """Definition for 'target' subsection of main config.
+
+    With named Juju controllers, `model` is the label of the model, see `Config.label_targets`.
+    """
 
     NAME = "target"
+    __slots__ = ("endpoint", "hostname", "customer", "site", "model")
 
     endpoint: str
     hostname: str
@@ -82,12 +331,63 @@ class _ConfigJujuController(_BaseConfig):
     ca_cert: str
     username: str
     password: str
+    name: str = ""
 
 
 @dataclass
 class Config(_BaseConfig):
-    """Object representation of a complete config file."""
+    """Object representation of a complete config file.
+
+    Juju controllers are defined either by a single 'juju_controller' section,
+    or by a list of 'juju_controllers', or both. Models of targets are labelled
+    like models of the controllers, so that data of a model end up together.
+    """
 
     settings: _ConfigSettings
-    targets: List[_ConfigTarget]
-    juju_controller: _ConfigJujuController
+    juju_controller: Optional[_ConfigJujuController] = None
+    juju_controllers: List[_ConfigJujuController] = field(default_factory=list)
+    targets: List[_ConfigTarget] = field(default_factory=list)
+
+    def __post_init__(self) -> None:
+        """Validate definitions of Juju controllers."""
+        controllers = self.controllers
+        if not controllers:
+            raise ConfigMissingKeyError(_ConfigJujuController.NAME)
+        # names of controllers distinguish their models in the output
+        names = [controller.name for controller in controllers]
+        if len(controllers) > 1 and (not all(names) or len(set(names)) != len(names)):
+            raise ConfigError("Each of multiple Juju controllers must have a unique 'name'")
+        self.label_targets(self.targets)
+
+    def label_targets(self, targets: List[_ConfigTarget]) -> None:
+        """Replace models of targets by their labels, see `model_label`.
+
+        Model of a target is either a plain model name of the only Juju controller,
+        or a label '<controller>.<model>', which is required with multiple controllers.
+        Labels are kept as they are, so targets can be labelled repeatedly.
+
+        :param targets: Targets from the config or from the target inventory
+        """
+        names = [controller.name for controller in self.controllers]
+        if names == [""]:
+            return
+        for target in targets:
+            controller_name, separator, _ = target.model.rpartition(".")
+            if separator and controller_name not in names:
+                raise ConfigError(
+                    f"Model '{target.model}' of target '{target.endpoint}' refers to "
+                    f"unknown Juju controller '{controller_name}'"
+                )
+            if not separator and len(names) > 1:
+                raise ConfigError(
+                    f"Model '{target.model}' of target '{target.endpoint}' must be "
+                    "'<controller>.<model>' with multiple Juju controllers"
+                )
+            if not separator:
+                target.model = model_label(names[0], target.model)
+
+    @property
+    def controllers(self) -> List[_ConfigJujuController]:
+        """Return definitions of all Juju controllers."""
+        single = [] if self.juju_controller is None else [self.juju_controller]
+        return single + self.juju_controllers
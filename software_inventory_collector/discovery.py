@@ -0,0 +1,62 @@
+"""Discovery of exporter targets from Juju model status."""
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from software_inventory_collector.config import _ConfigSettings, _ConfigTarget
+
+
+def _units(status: Dict) -> Iterator[Tuple[str, Dict, Dict]]:
+    """Yield all units from the model status, including subordinate units.
+
+    :param status: Model status as returned by Juju API
+    :return: Iterator of (unit name, unit status, status of the principal unit)
+    """
+    for application in (status.get("applications") or {}).values():
+        for unit_name, unit in (application.get("units") or {}).items():
+            yield unit_name, unit, unit
+            for subordinate_name, subordinate in (unit.get("subordinates") or {}).items():
+                yield subordinate_name, subordinate, unit
+
+
+def _find_machine(status: Dict, machine_id: str) -> Optional[Dict]:
+    """Find status of a machine or a container (e.g. '0/lxd/1') in the model status."""
+    machines = status.get("machines") or {}
+    parts = machine_id.split("/")
+    for depth in range(3, len(parts) + 1, 2):
+        machines = (machines.get("/".join(parts[: depth - 2])) or {}).get("containers") or {}
+    return machines.get(machine_id)
+
+
+def discover_targets(
+    status: Dict, model_name: str, settings: _ConfigSettings
+) -> List[_ConfigTarget]:
+    """Build exporter targets from units of the exporter application in the model status.
+
+    The exporter is usually deployed as a subordinate, so the address and hostname are
+    taken from the principal unit and the machine that hosts it.
+
+    :param status: Model status as returned by Juju API
+    :param model_name: Name of the model
+    :param settings: General collector settings
+    :return: List of discovered targets
+    """
+    targets = []
+    for unit_name, unit, principal in _units(status):
+        if unit_name.split("/")[0] != settings.exporter_application:
+            continue
+
+        machine = _find_machine(status, principal.get("machine") or "") or {}
+        address = unit.get("public-address") or machine.get("dns-name")
+        hostname = machine.get("hostname") or machine.get("instance-id")
+        if not address or not hostname:
+            continue
+
+        targets.append(
+            _ConfigTarget(
+                endpoint=f"{address}:{settings.exporter_port}",
+                hostname=hostname,
+                customer=settings.customer,
+                site=settings.site,
+                model=model_name,
+            )
+        )
+    return targets
@@ -0,0 +1,111 @@
+"""Content encodings of exporter responses negotiated with Accept-Encoding."""
+import zlib
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+import zstandard
+
+from software_inventory_collector.archive import DICTIONARY_COMPRESSION
+from software_inventory_collector.config import _ConfigSettings
+from software_inventory_collector.exception import HTTPClientError
+
+IDENTITY = "identity"
+# Encodings in which payloads are stored as-is, with suffix of their file names
+STORED_SUFFIXES: Dict[str, str] = {"zstd": ".zst"}
+# Archive compressions that store each payload in a content encoding
+_STORED_ENCODINGS: Dict[str, str] = {DICTIONARY_COMPRESSION: "zstd"}
+
+
+@dataclass(frozen=True)
+class EncodingPolicy:
+    """Content encoding requested from exporters and the one that is stored as-is.
+
+    With empty `accept`, responses are received with the default headers of the
+    HTTP client and decoded by it.
+    """
+
+    accept: str = ""
+    stored: str = ""
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        """Return headers of requests to exporters."""
+        return {"Accept-Encoding": f"{self.accept}, {IDENTITY}"} if self.accept else {}
+
+
+def encoding_policy(settings: _ConfigSettings) -> EncodingPolicy:
+    """Return encoding policy according to the settings.
+
+    Responses are stored in the requested encoding only if the archive compresses
+    each payload with the same codec, other responses are decoded.
+    """
+    accept = settings.transfer_encoding
+    stored = accept if _STORED_ENCODINGS.get(settings.compression) == accept else ""
+    return EncodingPolicy(accept, stored)
+
+
+class EncodedBody:
+    """Incremental decoder of a response body in a content encoding.
+
+    Body in the encoding stored by the archive is passed through unchanged, and
+    decoded only if decoded data are needed by `parse` callback (e.g. for the
+    package index).
+    """
+
+    def __init__(
+        self,
+        encoding: str,
+        policy: EncodingPolicy,
+        parse: Optional[Callable[[bytes], None]] = None,
+    ) -> None:
+        """Initiate decoder.
+
+        :param encoding: Value of Content-Encoding header of the response
+        :param policy: Encoding policy of the run
+        :param parse: Callback receiving decoded chunks of the body
+        """
+        encoding = encoding.strip().lower() or IDENTITY
+        self.encoding = encoding
+        self.stored = encoding == policy.stored
+        self.suffix = STORED_SUFFIXES[encoding] if self.stored else ""
+        self._parse = parse
+        self._decompressor: Any = None
+        if encoding == "gzip":
+            self._decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+        elif encoding == "zstd":
+            self._decompressor = zstandard.ZstdDecompressor().decompressobj()
+        elif encoding != IDENTITY:
+            raise HTTPClientError(f"Unsupported content encoding '{encoding}'")
+
+    def _decode(self, chunk: bytes, final: bool = False) -> bytes:
+        """Return decoded chunk, checking that the body is complete if it's the final one."""
+        if self._decompressor is None:
+            return chunk
+        try:
+            # decompressor of zstd must not be used after the end of its frame
+            data = self._decompressor.decompress(chunk) if chunk else b""
+        except (zlib.error, zstandard.ZstdError) as exc:
+            raise HTTPClientError(f"Malformed '{self.encoding}' response body: {exc}") from exc
+        if final and not self._decompressor.eof:
+            raise HTTPClientError(f"Malformed '{self.encoding}' response body: truncated")
+        return data
+
+    def write(self, chunk: bytes, final: bool = False) -> bytes:
+        """Process chunk of the body.
+
+        :param chunk: Chunk of the body as received
+        :param final: True if it's the last chunk of the body
+        :return: Data that should be stored
+        """
+        if self.stored and self._parse is None:
+            return chunk
+        data = self._decode(chunk, final)
+        if self._parse is not None:
+            self._parse(data)
+        return chunk if self.stored else data
+
+    def decode(self, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """Yield data that should be stored from chunks of the body."""
+        for chunk in chunks:
+            yield self.write(chunk)
+        yield self.write(b"", final=True)
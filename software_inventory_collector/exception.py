@@ -14,5 +14,23 @@ class ConfigMissingKeyError(ConfigError):
         self.key_name = key_name
 
 
+class ConfigInvalidValueError(ConfigError):
+    """Config file contains a value of unexpected type."""
+
+    def __init__(self, key_name: str, reason: str) -> None:
+        """Initiate exception instance."""
+        super().__init__(f"Invalid value of '{key_name}': {reason}")
+        self.key_name = key_name
+        self.reason = reason
+
+
 class CollectionError(Exception):
     """Error occurred while collecting data from exporter."""
+
+
+class HTTPClientError(Exception):
+    """Exporter returned unexpected or malformed HTTP response."""
+
+
+class ArchiveError(Exception):
+    """Archive is malformed or its content doesn't match its index."""
@@ -0,0 +1,103 @@
+"""Fast health check of exporters, used as a pre-flight check before collection."""
+import asyncio
+import time
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from typing import Dict, List, Sequence
+
+from software_inventory_collector.async_http import fetch_pipelined
+from software_inventory_collector.config import _ConfigTarget
+from software_inventory_collector.exception import HTTPClientError
+
+CHECK_CONCURRENCY = 256
+CHECK_TIMEOUT = 3.0
+# Upper bounds of histogram buckets in seconds, the last bucket is unbounded
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+HISTOGRAM_WIDTH = 40
+
+
+def _format_latency(seconds: float) -> str:
+    """Format latency in milliseconds or seconds."""
+    return f"{seconds * 1000:.0f} ms" if seconds < 1 else f"{seconds:.1f} s"
+
+
+@dataclass
+class HealthReport:
+    """Results of a health check of exporters."""
+
+    latencies: Dict[str, float] = field(default_factory=dict)
+    failures: Dict[str, str] = field(default_factory=dict)
+
+    def histogram(self) -> List[str]:
+        """Return lines of latency histogram of reachable exporters."""
+        counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        for latency in self.latencies.values():
+            counts[bisect_right(LATENCY_BUCKETS, latency)] += 1
+
+        labels = [f"<{_format_latency(bound)}" for bound in LATENCY_BUCKETS]
+        labels.append(f">={_format_latency(LATENCY_BUCKETS[-1])}")
+        scale = HISTOGRAM_WIDTH / max(*counts, 1)
+        return [
+            f"{label:>9} |{'#' * round(count * scale):<{HISTOGRAM_WIDTH}}| {count}"
+            for label, count in zip(labels, counts)
+        ]
+
+    def percentiles(self) -> str:
+        """Return summary of latency percentiles of reachable exporters."""
+        latencies = sorted(self.latencies.values())
+        summary = []
+        for name, quantile in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99)):
+            index = min(int(quantile * len(latencies)), len(latencies) - 1)
+            summary.append(f"{name} {_format_latency(latencies[index])}")
+        summary.append(f"max {_format_latency(latencies[-1])}")
+        return ", ".join(summary)
+
+    def format(self) -> str:
+        """Return human readable report."""
+        total = len(self.latencies) + len(self.failures)
+        lines = [f"Reachable targets: {len(self.latencies)}/{total}"]
+        if self.latencies:
+            lines.append(f"Latency: {self.percentiles()}")
+            lines.extend(self.histogram())
+        if self.failures:
+            lines.append(f"Unreachable targets ({len(self.failures)}):")
+            lines.extend(f"  {name}: {error}" for name, error in sorted(self.failures.items()))
+        return "\n".join(lines)
+
+
+async def _probe(target: _ConfigTarget, timeout: float) -> float:
+    """Fetch small 'kernel' endpoint of an exporter and return latency of the request."""
+    start = time.perf_counter()
+    async for _, _, body in fetch_pipelined(target.endpoint, ["/kernel"], timeout):
+        async for _ in body:
+            pass
+    return time.perf_counter() - start
+
+
+async def check_targets(
+    targets: Sequence[_ConfigTarget],
+    concurrency: int = CHECK_CONCURRENCY,
+    timeout: float = CHECK_TIMEOUT,
+) -> HealthReport:
+    """Probe all exporters concurrently.
+
+    :param targets: Exporters to probe
+    :param concurrency: Maximum number of exporters probed at once
+    :param timeout: Timeout of connecting to an exporter and of each read
+    :return: Latencies of reachable exporters and errors of unreachable ones
+    """
+    report = HealthReport()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def check(target: _ConfigTarget) -> None:
+        name = f"{target.hostname} ({target.endpoint})"
+        async with semaphore:
+            try:
+                report.latencies[name] = await _probe(target, timeout)
+            except asyncio.TimeoutError:
+                report.failures[name] = "timed out"
+            except (OSError, EOFError, HTTPClientError) as exc:
+                report.failures[name] = str(exc) or type(exc).__name__
+
+    await asyncio.gather(*(check(target) for target in targets))
+    return report
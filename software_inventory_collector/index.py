@@ -0,0 +1,392 @@
+"""Fleet-wide SQLite index of packages, kernels and charms built during collection."""
+import codecs
+import json
+import re
+import sqlite3
+import threading
+from types import TracebackType
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Type
+
+from typing_extensions import Self
+
+from software_inventory_collector.config import _ConfigSettings, _ConfigTarget
+from software_inventory_collector.exception import CollectionError
+
+BATCH_SIZE = 5000
+# Longest item of a list (or kernel response) held by the parser, as the response
+# is not covered by the memory budget; responses with longer ones are not indexed
+MAX_ITEM_SIZE = 64 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS packages (
+    run TEXT NOT NULL,
+    customer TEXT NOT NULL,
+    site TEXT NOT NULL,
+    model TEXT NOT NULL,
+    host TEXT NOT NULL,
+    source TEXT NOT NULL,
+    package TEXT NOT NULL,
+    version TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS packages_package ON packages (package, version);
+CREATE INDEX IF NOT EXISTS packages_host ON packages (host);
+CREATE INDEX IF NOT EXISTS packages_model ON packages (model);
+CREATE INDEX IF NOT EXISTS packages_run ON packages (run);
+
+CREATE TABLE IF NOT EXISTS kernels (
+    run TEXT NOT NULL,
+    customer TEXT NOT NULL,
+    site TEXT NOT NULL,
+    model TEXT NOT NULL,
+    host TEXT NOT NULL,
+    kernel TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS kernels_kernel ON kernels (kernel);
+CREATE INDEX IF NOT EXISTS kernels_host ON kernels (host);
+CREATE INDEX IF NOT EXISTS kernels_run ON kernels (run);
+
+CREATE TABLE IF NOT EXISTS applications (
+    run TEXT NOT NULL,
+    customer TEXT NOT NULL,
+    site TEXT NOT NULL,
+    model TEXT NOT NULL,
+    application TEXT NOT NULL,
+    charm TEXT NOT NULL,
+    revision INTEGER
+);
+CREATE INDEX IF NOT EXISTS applications_charm ON applications (charm, revision);
+CREATE INDEX IF NOT EXISTS applications_model ON applications (model);
+CREATE INDEX IF NOT EXISTS applications_run ON applications (run);
+"""
+
+TABLE_COLUMNS = {
+    "packages": ("run", "customer", "site", "model", "host", "source", "package", "version"),
+    "kernels": ("run", "customer", "site", "model", "host", "kernel"),
+    "applications": ("run", "customer", "site", "model", "application", "charm", "revision"),
+}
+
+# e.g. 'cs:focal/nova-compute-123', 'ch:amd64/focal/ubuntu-21' or 'ubuntu'
+_CHARM_URL = re.compile(r"^(?:[\w-]+:)?(?:.*/)?(?P<name>.+?)(?:-(?P<revision>\d+))?$")
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_JSON = json.JSONDecoder()
+
+
+class _Incomplete(Exception):
+    """More data are needed to decode the next JSON value."""
+
+
+class _JsonListReader:  # pylint: disable=R0903
+    """Incremental reader of items of a JSON list, received in chunks.
+
+    The list is either the whole document, or the value of `key` in the top-level
+    object (e.g. 'result' of snapd responses). Only a single item is buffered at
+    a time, and reading stops at the end of the list or at malformed data.
+    """
+
+    def __init__(self, key: Optional[str] = None) -> None:
+        """Initiate reader of list at the top level, or under `key` of top-level object."""
+        self.key = key
+        self._decoder = codecs.getincrementaldecoder("UTF-8")("replace")
+        self._buffer = ""
+        self._state = "start"
+        self._current_key: Optional[str] = None
+
+    def write(self, chunk: bytes, final: bool = False) -> List[Any]:
+        """Read next chunk of the document and return list items completed by it.
+
+        :param chunk: Next chunk of the document
+        :param final: True if the chunk is the last one
+        """
+        if self._state == "done":
+            return []
+
+        self._buffer += self._decoder.decode(chunk, final)
+        items: List[Any] = []
+        position = 0
+        try:
+            while self._state != "done":
+                whitespace = _WHITESPACE.match(self._buffer, position)
+                position = whitespace.end() if whitespace else position
+                if position == len(self._buffer):
+                    break
+                position = self._step(position, final, items)
+        except _Incomplete:
+            if final or len(self._buffer) - position > MAX_ITEM_SIZE:
+                self._state = "done"
+        self._buffer = "" if self._state == "done" else self._buffer[position:]
+        return items
+
+    def _step(self, position: int, final: bool, items: List[Any]) -> int:
+        """Process next token at `position` in the current state, return position after it."""
+        char = self._buffer[position]
+        if self._state == "start":
+            self._state = "list" if char == "[" else "done"
+            if char == "{" and self.key is not None:
+                self._state = "key"
+            return position + 1
+        if self._state == "list":
+            return self._step_list(char, position, final, items)
+        if self._state == "colon":
+            self._state = "value" if char == ":" else "done"
+            return position + 1
+        return self._step_object(char, position, final)
+
+    def _step_list(self, char: str, position: int, final: bool, items: List[Any]) -> int:
+        """Read next item of the list."""
+        if char == "]":
+            self._state = "done"
+        elif char == ",":
+            position += 1
+        else:
+            item, position = self._decode(position, final)
+            items.append(item)
+        return position
+
+    def _step_object(self, char: str, position: int, final: bool) -> int:
+        """Read next key of the top-level object, or its value."""
+        if self._state == "key":
+            if char == ",":
+                return position + 1
+            if char != '"':
+                self._state = "done"
+                return position
+            self._current_key, position = self._decode(position, final)
+            self._state = "colon"
+        elif self._current_key == self.key:
+            # the list is entered, values of other keys are skipped
+            self._state = "list" if char == "[" else "done"
+            position += 1
+        else:
+            _, position = self._decode(position, final)
+            self._state = "key"
+        return position
+
+    def _decode(self, position: int, final: bool) -> Tuple[Any, int]:
+        """Decode JSON value at `position`, raise `_Incomplete` if it's not received yet.
+
+        Value ending at the end of received data may continue in the next chunk
+        (e.g. a number), so it's decoded only once the data are final.
+        """
+        try:
+            value, end = _JSON.raw_decode(self._buffer, position)
+        except ValueError as exc:
+            raise _Incomplete() from exc
+        if end == len(self._buffer) and not final:
+            raise _Incomplete()
+        return value, end
+
+
+def _parse_dpkg(items: Iterable[Any]) -> Iterator[Tuple[str, str]]:
+    """Yield (package, version) from items of exporter response ({"package", "version"})."""
+    for package in items:
+        if isinstance(package, dict) and package.get("package"):
+            # architecture qualifier is not part of the name, e.g. 'libssl3:amd64'
+            yield str(package["package"]).split(":", maxsplit=1)[0], str(
+                package.get("version", "")
+            )
+
+
+def _parse_snap(items: Iterable[Any]) -> Iterator[Tuple[str, str]]:
+    """Yield (snap, version) from items of the list of snaps in snapd response."""
+    for snap in items:
+        if isinstance(snap, dict) and snap.get("name"):
+            yield str(snap["name"]), str(snap.get("version", ""))
+
+
+def _parse_kernel(data: Any, text: str) -> Optional[str]:
+    """Return kernel release from JSON response ({"kernel": ...}), or from plain text."""
+    if isinstance(data, dict):
+        data = data.get("kernel")
+    if isinstance(data, str):
+        return data.strip() or None
+    return text.strip() or None
+
+
+def _parse_charm(application: Dict) -> Tuple[str, Optional[int]]:
+    """Return charm name and revision of an application from Juju status."""
+    match = _CHARM_URL.match(str(application.get("charm") or ""))
+    name = match.group("name") if match else ""
+    revision = application.get("charm-rev")
+    if revision is None and match and match.group("revision"):
+        revision = int(match.group("revision"))
+    return name, revision
+
+
+class PayloadParser:
+    """Incremental parser of a single exporter response.
+
+    Chunks of the response are passed to `write` as they are received. Lists of
+    packages and snaps are parsed item by item as they stream in, so the response
+    is never held in memory as a whole. Short kernel response is parsed once it ends.
+    """
+
+    def __init__(self, endpoint: str) -> None:
+        """Initiate parser of response from exporter `endpoint` (e.g. 'dpkg')."""
+        self.endpoint = endpoint
+        self.packages: List[Tuple[str, str]] = []
+        self.kernel: Optional[str] = None
+        self._parts: List[bytes] = []
+        self._size = 0
+        self._items: Optional[_JsonListReader] = None
+        if endpoint == "dpkg":
+            self._items = _JsonListReader()
+        elif endpoint == "snap":
+            self._items = _JsonListReader(key="result")
+
+    def write(self, chunk: bytes) -> None:
+        """Parse next chunk of the response."""
+        if self._items is not None:
+            self._add_items(self._items.write(chunk))
+        elif self._size <= MAX_ITEM_SIZE:
+            self._parts.append(chunk)
+            self._size += len(chunk)
+
+    def close(self) -> None:
+        """Parse remaining data after the whole response was received.
+
+        Malformed responses are ignored, as they are still archived as they are.
+        """
+        if self._items is not None:
+            self._add_items(self._items.write(b"", final=True))
+            return
+
+        text = b"".join(self._parts).decode("UTF-8", "replace")
+        self._parts = []
+        if self.endpoint != "kernel" or self._size > MAX_ITEM_SIZE:
+            return
+        try:
+            data = json.loads(text)
+        except ValueError:
+            data = None
+        self.kernel = _parse_kernel(data, text)
+
+    def _add_items(self, items: List[Any]) -> None:
+        """Add packages or snaps from parsed list items."""
+        if self.endpoint == "dpkg":
+            self.packages.extend(_parse_dpkg(items))
+        else:
+            self.packages.extend(_parse_snap(items))
+
+
+class PackageIndex:
+    """SQLite database of packages, kernels and charms across all collected hosts.
+
+    Rows are buffered and inserted in batches of `batch_size`, each in a single
+    transaction. The index can be updated from multiple threads.
+    """
+
+    def __init__(self, path: str, run: str, batch_size: int = BATCH_SIZE) -> None:
+        """Open (or create) index database.
+
+        :param path: Path to the SQLite database file
+        :param run: Identifier of the collection run stored with every row
+        :param batch_size: Number of rows inserted in a single transaction
+        """
+        self.run = run
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._batches: Dict[str, List[Tuple]] = {table: [] for table in TABLE_COLUMNS}
+        try:
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            # readers can query the index while the collection is running
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript(SCHEMA)
+        except sqlite3.Error as exc:
+            raise CollectionError(f"Failed to open package index '{path}': {exc}") from exc
+
+    def __enter__(self) -> Self:
+        """Return the index."""
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        """Insert remaining rows and close the database."""
+        try:
+            self.flush()
+        finally:
+            self._connection.close()
+
+    def add_payload(self, target: _ConfigTarget, parser: PayloadParser) -> None:
+        """Add rows parsed from exporter response of a host."""
+        prefix = (self.run, target.customer, target.site, target.model, target.hostname)
+        if parser.kernel is not None:
+            self._add("kernels", [prefix + (parser.kernel,)])
+        self._add(
+            "packages",
+            [prefix + (parser.endpoint, package, version) for package, version in parser.packages],
+        )
+
+    def add_status(self, settings: _ConfigSettings, model_name: str, status: Dict) -> None:
+        """Add applications and their charms from Juju model status."""
+        prefix = (self.run, settings.customer, settings.site, model_name)
+        self._add(
+            "applications",
+            [
+                prefix + (name,) + _parse_charm(application)
+                for name, application in (status.get("applications") or {}).items()
+            ],
+        )
+
+    def find_package(
+        self, package: str, version: Optional[str] = None, run: Optional[str] = None
+    ) -> List[Tuple]:
+        """Return (run, model, host, source, version) of hosts that have the package installed.
+
+        Buffered rows are inserted before the query. Rows of all runs are kept in
+        the index, so only hosts from a single run are returned.
+
+        :param package: Name of the package or snap
+        :param version: Only return hosts with this version of the package
+        :param run: Identifier of the run, defaults to the latest run in the index
+        """
+        query = "SELECT run, model, host, source, version FROM packages WHERE package = ?"
+        params: Tuple[str, ...] = (package,)
+        if run is None:
+            # run identifiers are timestamps, so the latest one sorts last
+            query += " AND run = (SELECT MAX(run) FROM packages)"
+        else:
+            query += " AND run = ?"
+            params += (run,)
+        if version is not None:
+            query += " AND version = ?"
+            params += (version,)
+        self.flush()
+        with self._lock:
+            return self._connection.execute(
+                query + " ORDER BY run, model, host", params
+            ).fetchall()
+
+    def flush(self) -> None:
+        """Insert all buffered rows."""
+        with self._lock:
+            for table in TABLE_COLUMNS:
+                self._insert(table)
+
+    def _add(self, table: str, rows: List[Tuple]) -> None:
+        """Buffer rows, inserting them once the batch is full."""
+        with self._lock:
+            batch = self._batches[table]
+            batch.extend(rows)
+            if len(batch) >= self.batch_size:
+                self._insert(table)
+
+    def _insert(self, table: str) -> None:
+        """Insert buffered rows of a table in single transaction. Caller holds the lock."""
+        rows, self._batches[table] = self._batches[table], []
+        if not rows:
+            return
+
+        columns = TABLE_COLUMNS[table]
+        query = (
+            f"INSERT INTO {table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * len(columns))})"
+        )
+        try:
+            with self._connection:
+                self._connection.executemany(query, rows)
+        except sqlite3.Error as exc:
+            raise CollectionError(f"Failed to update package index: {exc}") from exc
@@ -0,0 +1,108 @@
+"""Loading of exporter targets from inventory files outside of the main config."""
+import json
+import os
+from typing import Dict, List, NamedTuple
+
+import yaml
+
+from software_inventory_collector.config import _ConfigTarget
+from software_inventory_collector.exception import ConfigError
+
+YAML_EXTENSIONS = (".yaml", ".yml")
+JSON_LINES_EXTENSIONS = (".jsonl",)
+
+
+class _Fragment(NamedTuple):
+    """Targets parsed from a single inventory file."""
+
+    mtime: int
+    targets: List[_ConfigTarget]
+
+
+def _parse_fragment(fragment_path: str) -> List[_ConfigTarget]:
+    """Parse targets from a single inventory file.
+
+    YAML files contain list of targets, JSON-lines files contain one target per line.
+
+    :param fragment_path: Path to the inventory file
+    :return: List of targets defined in the file
+    """
+    name = os.path.basename(fragment_path)
+    try:
+        with open(fragment_path, "r", encoding="UTF-8") as fragment_file:
+            if fragment_path.endswith(JSON_LINES_EXTENSIONS):
+                items = {
+                    f"{name}:{line_number}": json.loads(line)
+                    for line_number, line in enumerate(fragment_file, start=1)
+                    if line.strip()
+                }
+            else:
+                data = yaml.safe_load(fragment_file) or []
+                if not isinstance(data, list):
+                    raise ConfigError(f"Inventory file '{fragment_path}' must contain a list")
+                items = {f"{name}[{index}]": item for index, item in enumerate(data)}
+    except (yaml.YAMLError, json.JSONDecodeError) as exc:
+        raise ConfigError(f"Failed to parse inventory file '{fragment_path}': {exc}") from exc
+    except IOError as exc:
+        raise ConfigError(f"Failed to read inventory file '{fragment_path}'") from exc
+
+    return [_ConfigTarget.from_dict(item, path) for path, item in items.items()]
+
+
+class TargetInventory:  # pylint: disable=R0903
+    """Exporter targets stored in a file or in a directory of fragment files.
+
+    Each fragment is cached together with its modification time, so repeated calls
+    to `load` re-read only the files that changed. Files are parsed as JSON-lines if
+    they have '.jsonl' extension, and as YAML otherwise. Only files with these
+    extensions are considered when loading a directory.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Initiate inventory located at `path`."""
+        self.path = path
+        self._fragments: Dict[str, _Fragment] = {}
+
+    def _fragment_mtimes(self) -> Dict[str, int]:
+        """Return modification times of all inventory files."""
+        try:
+            if not os.path.isdir(self.path):
+                return {self.path: os.stat(self.path).st_mtime_ns}
+
+            with os.scandir(self.path) as entries:
+                return {
+                    entry.path: entry.stat().st_mtime_ns
+                    for entry in entries
+                    if entry.name.endswith(YAML_EXTENSIONS + JSON_LINES_EXTENSIONS)
+                    and entry.is_file()
+                }
+        except OSError as exc:
+            raise ConfigError(f"Failed to read target inventory '{self.path}'") from exc
+
+    def load(self) -> List[_ConfigTarget]:
+        """Return all targets from the inventory, re-reading only changed fragments.
+
+        Targets are ordered by the name of their fragment file.
+        """
+        fragments = {}
+        for fragment_path, mtime in sorted(self._fragment_mtimes().items()):
+            fragment = self._fragments.get(fragment_path)
+            if fragment is None or fragment.mtime != mtime:
+                fragment = _Fragment(mtime, _parse_fragment(fragment_path))
+            fragments[fragment_path] = fragment
+
+        self._fragments = fragments
+        return [target for fragment in fragments.values() for target in fragment.targets]
+
+
+_INVENTORIES: Dict[str, TargetInventory] = {}
+
+
+def load_targets(path: str) -> List[_ConfigTarget]:
+    """Load targets from inventory at `path`.
+
+    Inventories are kept for the lifetime of the process, so that repeated loading
+    (e.g. on config reload) re-reads only changed fragments.
+    """
+    inventory = _INVENTORIES.setdefault(path, TargetInventory(path))
+    return inventory.load()
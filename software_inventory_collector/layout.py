@@ -0,0 +1,176 @@
+"""Layout of archives in the collection path and pruning of old runs."""
+import datetime
+import glob
+import os
+import re
+import shutil
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from software_inventory_collector.config import _ConfigSettings
+
+FLAT = "flat"
+
+# e.g. 'customer_@_site_@_model_@_20230101120000.tar.gz' or dictionary used to
+# compress the run 'zstd_dictionary_@_20230101120000.dict', the group is the run timestamp
+_ARCHIVE_NAME = re.compile(r"^.+_@_(\d{14})\.(?:tar(?:\.\w+)?|dict)$")
+_DATE_DIR = re.compile(r"^\d{8}$")
+
+
+def _dir_name(name: str) -> str:
+    """Return name usable as a single directory (e.g. customer name)."""
+    return name.replace(os.sep, "_")
+
+
+def archive_dir(settings: _ConfigSettings, customer: str, site: str, run: str) -> str:
+    """Return directory for archives of a customer and site, creating it if needed.
+
+    :param settings: General collector settings
+    :param customer: Name of the customer
+    :param site: Name of the site
+    :param run: Timestamp of the run (YYYYmmddHHMMSS)
+    :return: `collection_path` with flat layout, or
+        `collection_path/<customer>/<site>/<YYYYmmdd>` with sharded layout
+    """
+    if settings.layout == FLAT:
+        return settings.collection_path
+
+    path = os.path.join(settings.collection_path, _dir_name(customer), _dir_name(site), run[:8])
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def archive_pattern(settings: _ConfigSettings, run: str) -> str:
+    """Return glob pattern matching uncompressed archives of a run."""
+    collection_path = glob.escape(settings.collection_path)
+    if settings.layout == FLAT:
+        return os.path.join(collection_path, f"*_@_{run}.tar")
+    return os.path.join(collection_path, "*", "*", run[:8], f"*_@_{run}.tar")
+
+
+def _subdirs(path: str) -> Iterator[os.DirEntry]:
+    """Yield subdirectories of a directory, or nothing if it doesn't exist."""
+    try:
+        with os.scandir(path) as entries:
+            yield from [entry for entry in entries if entry.is_dir(follow_symlinks=False)]
+    except FileNotFoundError:
+        pass
+
+
+def _archive_dirs(settings: _ConfigSettings) -> List[Tuple[str, List[str]]]:
+    """Return directories with archives grouped by date, newest first.
+
+    All archives are in a single undated group with flat layout.
+    """
+    if settings.layout == FLAT:
+        return [("", [settings.collection_path])]
+
+    date_dirs: Dict[str, List[str]] = {}
+    for customer in _subdirs(settings.collection_path):
+        for site in _subdirs(customer.path):
+            for date in _subdirs(site.path):
+                if _DATE_DIR.match(date.name):
+                    date_dirs.setdefault(date.name, []).append(date.path)
+    return sorted(date_dirs.items(), reverse=True)
+
+
+def _list_runs(paths: List[str]) -> Dict[str, List[str]]:
+    """Return archives in directories grouped by run, without stat-ing them."""
+    runs: Dict[str, List[str]] = {}
+    for path in paths:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                match = _ARCHIVE_NAME.match(entry.name)
+                if match:
+                    runs.setdefault(match.group(1), []).append(entry.path)
+    return runs
+
+
+class _Retention:
+    """Decisions about which runs to keep, made from the newest run to the oldest.
+
+    Once a run is dropped, all older runs are dropped as well. Run of the current
+    collection is always kept and counts towards the limits.
+    """
+
+    def __init__(self, settings: _ConfigSettings, current_run: str, today: datetime.date):
+        """Initiate retention policy from settings."""
+        self.settings = settings
+        self.current_run = current_run
+        self.cutoff = ""
+        if settings.retention_days:
+            cutoff = today - datetime.timedelta(days=settings.retention_days - 1)
+            self.cutoff = cutoff.strftime("%Y%m%d")
+        self.exhausted = False
+        self.kept_runs = 1
+        self.kept_bytes = 0
+
+    def _full(self) -> bool:
+        """Return True if no more runs fit into the limits on count and size."""
+        return bool(
+            (self.settings.retention_runs and self.kept_runs >= self.settings.retention_runs)
+            or (self.settings.retention_bytes and self.kept_bytes >= self.settings.retention_bytes)
+        )
+
+    def keep_date(self, date: str) -> bool:
+        """Return False if all runs from the date are dropped."""
+        if date == self.current_run[:8]:
+            return True
+        return not (self.exhausted or self._full() or date < self.cutoff)
+
+    def keep(self, run: str, paths: List[str]) -> bool:
+        """Decide whether to keep archives of a run.
+
+        :param run: Timestamp of the run
+        :param paths: All archives of the run
+        """
+        if run != self.current_run and (self.exhausted or run[:8] < self.cutoff or self._full()):
+            self.exhausted = True
+            return False
+
+        if self.settings.retention_bytes:
+            self.kept_bytes += sum(os.path.getsize(path) for path in paths)
+        if run == self.current_run:
+            return True
+        if self.settings.retention_bytes and self.kept_bytes > self.settings.retention_bytes:
+            self.exhausted = True
+            return False
+
+        self.kept_runs += 1
+        return True
+
+
+def prune_archives(
+    settings: _ConfigSettings, current_run: str, today: Optional[datetime.date] = None
+) -> List[str]:
+    """Remove archives of old runs according to the retention settings.
+
+    Runs are kept while they fit all the limits: `retention_runs` newest runs,
+    runs from the last `retention_days` days and `retention_bytes` total size.
+    With sharded layout, whole date directories are removed once they contain
+    only dropped runs, without listing or stat-ing their files. Files are stat-ed
+    only if the total size is limited, and only until the limit is reached.
+
+    :param settings: General collector settings
+    :param current_run: Timestamp of the current run, which is always kept
+    :param today: Current date, used to apply `retention_days`
+    :return: Removed files and directories
+    """
+    if not (settings.retention_runs or settings.retention_days or settings.retention_bytes):
+        return []
+
+    retention = _Retention(settings, current_run, today or datetime.date.today())
+    removed = []
+    for date, paths in _archive_dirs(settings):
+        if date and not retention.keep_date(date):
+            for path in paths:
+                shutil.rmtree(path)
+            removed.extend(paths)
+            continue
+
+        runs = _list_runs(paths)
+        for run in sorted(runs, reverse=True):
+            if not retention.keep(run, runs[run]):
+                for path in runs[run]:
+                    os.remove(path)
+                removed.extend(runs[run])
+    return removed
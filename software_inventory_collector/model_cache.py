@@ -0,0 +1,147 @@
+"""Cache of connected Juju models reused by repeated collections."""
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, List, Tuple, TypeVar
+
+from juju.controller import Controller
+from juju.errors import JujuConnectionError
+from juju.model import Model
+from websockets.exceptions import ConnectionClosed
+
+DEFAULT_MAX_SIZE = 64
+# Connections unused for longer than this number of seconds are closed
+DEFAULT_IDLE_TIMEOUT = 300.0
+# Errors of broken connections, other errors are not fixed by reconnecting
+CONNECTION_ERRORS = (ConnectionClosed, JujuConnectionError)
+
+_T = TypeVar("_T")
+
+
+class ModelCache:
+    """LRU cache of model connections, keyed by controller and model names.
+
+    Each login to a model is a websocket handshake with the controller, which takes
+    a large share of collection of many small models. Models checked in to the
+    cache stay connected and are reused by the next collection, unless they were
+    idle for longer than `idle_timeout` or fell out of the `max_size` most recently
+    used ones. Closed connections are replaced transparently when they're checked
+    out, and connections that failed while in use are not reused. With `max_size`
+    of 0, every model is disconnected as soon as its collection is finished.
+
+    Idle timeout is enforced lazily, when models are checked out or in, there is
+    no timer. Programs pausing between collections for longer than `idle_timeout`
+    can call `evict` to close expired connections before the next collection.
+    """
+
+    def __init__(
+        self, max_size: int = DEFAULT_MAX_SIZE, idle_timeout: float = DEFAULT_IDLE_TIMEOUT
+    ) -> None:
+        """Initiate empty cache.
+
+        :param max_size: Maximum number of models kept connected between collections
+        :param idle_timeout: Seconds after which unused connection is closed
+        """
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.hits = self.misses = 0
+        self._idle: "OrderedDict[Tuple[str, str], Tuple[Model, float]]" = OrderedDict()
+        self._in_use = 0
+
+    def __len__(self) -> int:
+        """Return number of connected models, including the ones in use."""
+        return len(self._idle) + self._in_use
+
+    def _expired(self) -> List[Model]:
+        """Remove and return idle models exceeding the idle timeout or the size limit."""
+        deadline = time.monotonic() - self.idle_timeout
+        expired = [key for key, (_, last_used) in self._idle.items() if last_used < deadline]
+        models = [self._idle.pop(key)[0] for key in expired]
+        # the least recently used models are at the start
+        while self._idle and len(self) > self.max_size:
+            models.append(self._idle.popitem(last=False)[1][0])
+        return models
+
+    async def evict(self) -> None:
+        """Disconnect idle models exceeding the idle timeout or the size limit."""
+        await _disconnect_models(self._expired())
+
+    async def run(
+        self,
+        controller: Controller,
+        controller_name: str,
+        model_name: str,
+        function: Callable[[Model], Awaitable[_T]],
+    ) -> _T:
+        """Call `function` with checked out model and return its result.
+
+        Cached connection closed by the controller may still report that it's
+        connected, which shows only once it's used. If `function` fails with
+        a connection error (`CONNECTION_ERRORS`) over a cached connection, it's called
+        once more over a new one before the error is raised.
+
+        :param controller: Connected controller of the model
+        :param controller_name: Name of the controller in the config
+        :param model_name: Name of the model
+        :param function: Coroutine function collecting data of the model
+        """
+        key = (controller_name, model_name)
+        reused = False
+        try:
+            async with self._checked_out(controller, *key) as (model, reused):
+                return await function(model)
+        except CONNECTION_ERRORS:
+            if not reused:
+                raise
+        async with self._checked_out(controller, *key) as (model, _):
+            return await function(model)
+
+    @asynccontextmanager
+    async def _checked_out(
+        self, controller: Controller, controller_name: str, model_name: str
+    ) -> AsyncIterator[Tuple[Model, bool]]:
+        """Check out connected model, connecting to it if it's not cached.
+
+        :param controller: Connected controller of the model
+        :param controller_name: Name of the controller in the config
+        :param model_name: Name of the model
+        :return: Model together with a flag whether it was cached
+        """
+        key = (controller_name, model_name)
+        model, _ = self._idle.pop(key, (None, 0.0))
+        await self.evict()
+        if model is not None and not model.is_connected():
+            await _disconnect_models([model])
+            model = None
+        reused = model is not None
+        if reused:
+            self.hits += 1
+        else:
+            self.misses += 1
+            model = await controller.get_model(model_name)
+        self._in_use += 1
+        try:
+            yield model, reused
+        except BaseException:
+            await _disconnect_models([model])
+            raise
+        finally:
+            self._in_use -= 1
+        if key in self._idle:
+            # the same model was checked out twice, only one connection is kept
+            await _disconnect_models([model])
+        else:
+            self._idle[key] = (model, time.monotonic())
+        await self.evict()
+
+    async def close(self) -> None:
+        """Disconnect all idle models."""
+        models = [model for model, _ in self._idle.values()]
+        self._idle.clear()
+        await _disconnect_models(models)
+
+
+async def _disconnect_models(models: List[Model]) -> None:
+    """Disconnect models, ignoring errors of connections that are already broken."""
+    await asyncio.gather(*(model.disconnect() for model in models), return_exceptions=True)
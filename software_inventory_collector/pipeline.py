@@ -0,0 +1,264 @@
+"""Memory-bounded pipeline between data fetchers and the archive writer."""
+import asyncio
+import io
+import queue
+import threading
+from dataclasses import dataclass
+from tempfile import TemporaryFile
+from types import TracebackType
+from typing import IO, Callable, Iterable, Optional, Type
+
+from typing_extensions import Self
+
+from software_inventory_collector.concurrency import AsyncWaiters
+from software_inventory_collector.exception import CollectionError
+
+SPOOL_SIZE = 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+
+class MemoryBudget:
+    """Byte-counting semaphore limiting amount of collected data held in memory.
+
+    Threads wait for the budget with `acquire`, and tasks on an event loop with
+    `acquire_async` (see `AsyncWaiters`).
+    """
+
+    def __init__(self, limit: int) -> None:
+        """Initiate budget of `limit` bytes."""
+        self.limit = limit
+        self.used = 0
+        self.peak = 0
+        self._condition = threading.Condition()
+        self._async_waiters = AsyncWaiters()
+
+    def _try_acquire(self, size: int) -> bool:
+        """Reserve `size` bytes if they fit, must be called with the lock held."""
+        if self.used + size > self.limit:
+            return False
+        self.used += size
+        self.peak = max(self.peak, self.used)
+        return True
+
+    def acquire(self, size: int) -> int:
+        """Block until `size` bytes fit into the budget and reserve them.
+
+        Requests larger than the whole budget are capped to its limit, so they are
+        admitted once every other reservation is released.
+
+        :param size: Number of bytes to reserve
+        :return: Number of bytes actually reserved
+        """
+        size = min(size, self.limit)
+        with self._condition:
+            self._condition.wait_for(lambda: self._try_acquire(size))
+        return size
+
+    async def acquire_async(self, size: int) -> int:
+        """Wait on the running event loop until `size` bytes fit into the budget and reserve them.
+
+        :param size: Number of bytes to reserve, capped like in `acquire`
+        :return: Number of bytes actually reserved
+        """
+        size = min(size, self.limit)
+        await self._async_waiters.wait_for(self._condition, lambda: self._try_acquire(size))
+        return size
+
+    def release(self, size: int) -> None:
+        """Return previously reserved bytes to the budget and wake up all waiters."""
+        with self._condition:
+            self.used -= size
+            self._condition.notify_all()
+            self._async_waiters.wake_up()
+
+
+class SpooledPayload:
+    """Writable buffer that keeps data in memory up to `max_size` bytes.
+
+    Once the data exceeds `max_size`, they are moved to a temporary file on disk
+    together with all the data written afterwards.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        """Initiate empty buffer."""
+        self.max_size = max_size
+        self.file: IO[bytes] = io.BytesIO()
+
+    def write(self, chunk: bytes) -> None:
+        """Append chunk of data to the buffer."""
+        if isinstance(self.file, io.BytesIO) and self.file.tell() + len(chunk) > self.max_size:
+            spilled = TemporaryFile()
+            spilled.write(self.file.getbuffer())
+            self.file.close()
+            self.file = spilled
+        self.file.write(chunk)
+
+    def getfile(self) -> IO[bytes]:
+        """Return file object positioned at the start of collected data."""
+        self.file.seek(0)
+        return self.file
+
+
+def spool(chunks: Iterable[bytes], max_size: int) -> IO[bytes]:
+    """Collect chunks of data into a file object.
+
+    Data is kept in memory until it exceeds `max_size` bytes, then it's moved to
+    a temporary file on disk together with the rest of the chunks.
+
+    :param chunks: Iterable of data chunks
+    :param max_size: Maximum number of bytes kept in memory
+    :return: File object positioned at the start of collected data
+    """
+    payload = SpooledPayload(max_size)
+    for chunk in chunks:
+        payload.write(chunk)
+    return payload.getfile()
+
+
+@dataclass
+class _ArchiveItem:
+    """Single collected file waiting to be written into a tarball."""
+
+    tar_path: str
+    file_name: str
+    payload: IO[bytes]
+    reserved: int
+
+
+class ArchivePipeline:
+    """Bounded queue connecting data fetchers with a single archive writer thread.
+
+    Fetchers reserve part of the memory budget before they start receiving data and
+    hand the result over with `submit`. Reservations are released only after the
+    writer stores the data in its tarball, so fetchers block whenever the writer
+    falls behind, and the data held in memory never exceeds the budget.
+    """
+
+    def __init__(
+        self,
+        writer: Callable[[str, IO[bytes], str], None],
+        memory_budget: int,
+        queue_size: int,
+    ) -> None:
+        """Initiate pipeline.
+
+        :param writer: Function that stores payload (file_name, payload, tar_path)
+        :param memory_budget: Maximum number of bytes held in memory by the pipeline
+        :param queue_size: Maximum number of items waiting for the writer
+        """
+        self.budget = MemoryBudget(memory_budget)
+        self._write = writer
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._error: Optional[Exception] = None
+
+    def __enter__(self) -> Self:
+        """Start the writer thread."""
+        self._thread.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        """Wait for the writer to store all queued data.
+
+        Writer errors are re-raised unless another exception is already propagating.
+        """
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is not None and exc_type is None:
+            raise CollectionError(
+                f"Failed to write collected data: {self._error}"
+            ) from self._error
+
+    def reserve(self) -> int:
+        """Reserve memory for receiving single payload.
+
+        :return: Number of reserved bytes, payloads larger than this should spill to disk.
+        """
+        return self.budget.acquire(SPOOL_SIZE)
+
+    async def reserve_async(self, size: int = SPOOL_SIZE) -> int:
+        """Asyncio variant of `reserve` that waits on the event loop instead of a thread.
+
+        :param size: Number of bytes to reserve, capped at the budget
+        :return: Number of reserved bytes
+        """
+        return await self.budget.acquire_async(size)
+
+    def submit(self, tar_path: str, file_name: str, payload: IO[bytes], reserved: int) -> None:
+        """Queue payload to be written into a tarball.
+
+        :param tar_path: Path to tarball to which the file will be added
+        :param file_name: Resulting name of the file in tarball
+        :param payload: File object with the content
+        :param reserved: Bytes reserved for the payload, released once it's written
+        :return: None
+        """
+        if self._error is not None:
+            payload.close()
+            self.budget.release(reserved)
+            raise CollectionError(f"Failed to write collected data: {self._error}")
+        self._queue.put(_ArchiveItem(tar_path, file_name, payload, reserved))
+
+    def submit_data(self, tar_path: str, file_name: str, data: bytes) -> None:
+        """Queue data that were already fully loaded into memory.
+
+        Data are accounted for with their full size (capped at the budget), so the
+        call blocks until the writer makes enough room for them.
+        """
+        reserved = self.budget.acquire(len(data))
+        self.submit(tar_path, file_name, io.BytesIO(data), reserved)
+
+    async def submit_data_async(
+        self, tar_path: str, file_name: str, data: bytes, reserved: int = 0
+    ) -> int:
+        """Asyncio variant of `submit_data` that waits for the budget on the event loop.
+
+        Data can be covered by bytes reserved before they were fetched. If they don't
+        fit into the reservation, it's replaced by one of their full size, as waiting
+        for the rest while holding it could deadlock with other holders. Only queueing
+        of the data runs in the default executor, as it can't wait for anything but
+        the writer thread.
+
+        :param tar_path: Path to tarball to which the file will be added
+        :param file_name: Resulting name of the file in tarball
+        :param data: Content of the file
+        :param reserved: Bytes reserved in advance, owned by the call from now on
+        :return: Bytes of the reservation not needed by the data, to be released or
+            passed to the next call by the caller
+        """
+        size = min(len(data), self.budget.limit)
+        if size > reserved:
+            self.budget.release(reserved)
+            reserved = await self.budget.acquire_async(size)
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                None, self.submit, tar_path, file_name, io.BytesIO(data), size
+            )
+        except BaseException:
+            self.budget.release(reserved - size)
+            raise
+        return reserved - size
+
+    def _write_loop(self) -> None:
+        """Write queued items until the pipeline is closed.
+
+        After the first failure, remaining items are only discarded so that blocked
+        fetchers can finish.
+        """
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            try:
+                if self._error is None:
+                    self._write(item.file_name, item.payload, item.tar_path)
+            except Exception as exc:  # pylint: disable=W0718
+                self._error = exc
+            finally:
+                item.payload.close()
+                self.budget.release(item.reserved)
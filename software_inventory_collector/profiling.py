@@ -0,0 +1,157 @@
+"""Optional profiling of collection runs, enabled from the command line."""
+import cProfile
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from types import TracebackType
+from typing import Any, Iterator, List, Optional, Tuple, Type
+
+from typing_extensions import Self
+
+TOP_ALLOCATORS = 10
+
+_ACTIVE: Optional["Profiler"] = None
+
+
+class Profiler:
+    """CPU profile, memory snapshots and durations of a single collection run.
+
+    CPU profile covers all threads started during the run (exporter workers and
+    the archive writer) and is written into a '.pstats' file. Memory snapshots are
+    taken at the end of each phase and the allocators that grew the most since the
+    previous snapshot are reported. Durations of phases and tasks are reported
+    whenever any profiling is enabled.
+    """
+
+    def __init__(self, profile_path: str = "", trace_malloc: int = 0) -> None:
+        """Initiate profiler.
+
+        :param profile_path: Path to output '.pstats' file, CPU profiling is disabled if empty
+        :param trace_malloc: Number of top allocators to report after each phase,
+            memory tracing is disabled if 0
+        """
+        self.profile_path = profile_path
+        self.trace_malloc = trace_malloc
+        self.durations: List[Tuple[str, float]] = []
+        self._profiles: List[cProfile.Profile] = []
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """Return True if any kind of profiling is enabled."""
+        return bool(self.profile_path or self.trace_malloc)
+
+    def __enter__(self) -> Self:
+        """Start profiling."""
+        global _ACTIVE  # pylint: disable=W0603
+        if not self.enabled:
+            return self
+
+        _ACTIVE = self
+        if self.trace_malloc:
+            tracemalloc.start()
+            self._snapshot = self._take_snapshot()
+        if self.profile_path:
+            # Since Python 3.12, single profile covers all threads
+            if sys.version_info < (3, 12):
+                threading.setprofile(self._profile_thread)
+            self._start_profile()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        """Stop profiling, write the CPU profile and report durations."""
+        global _ACTIVE  # pylint: disable=W0603
+        if not self.enabled:
+            return
+
+        _ACTIVE = None
+        if self.profile_path:
+            if sys.version_info < (3, 12):
+                threading.setprofile(None)
+            with self._lock:
+                stats = pstats.Stats(*self._profiles)
+            stats.dump_stats(self.profile_path)
+            print(f"CPU profile written to '{self.profile_path}'")
+        if self.trace_malloc:
+            tracemalloc.stop()
+
+        print("Durations:")
+        for name, duration in self.durations:
+            print(f"  {name}: {duration:.3f} s")
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Measure a phase of the run, taking memory snapshot at its end."""
+        with self.task(f"phase {name}"):
+            yield
+        if self.trace_malloc:
+            self._report_memory(name)
+
+    @contextmanager
+    def task(self, name: str) -> Iterator[None]:
+        """Measure duration of a task, e.g. coroutine collecting a model."""
+        if not self.enabled:
+            yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.durations.append((name, time.perf_counter() - start))
+
+    def _profile_thread(self, *_: Any) -> None:  # pragma: no cover
+        """Start profiling a new thread, replacing this one-shot hook.
+
+        Runs as a profile hook, where coverage can't trace it.
+        """
+        sys.setprofile(None)
+        self._start_profile()
+
+    def _start_profile(self) -> None:
+        """Start CPU profile of the current thread."""
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profile)
+        profile.enable()
+
+    @staticmethod
+    def _take_snapshot() -> tracemalloc.Snapshot:
+        """Take memory snapshot without allocations made by tracemalloc itself."""
+        return tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__),)
+        )
+
+    def _report_memory(self, name: str) -> None:
+        """Print memory usage and top allocators since the previous snapshot."""
+        snapshot = self._take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        print(
+            f"Memory after phase {name}: current {current / 1024:.1f} KiB, "
+            f"peak {peak / 1024:.1f} KiB"
+        )
+        if self._snapshot is not None:
+            for stat in snapshot.compare_to(self._snapshot, "lineno")[: self.trace_malloc]:
+                print(f"  {stat}")
+        self._snapshot = snapshot
+
+
+@contextmanager
+def timed(name: str) -> Iterator[None]:
+    """Measure duration of a task if profiling of the current run is enabled."""
+    if _ACTIVE is None:
+        yield
+        return
+
+    with _ACTIVE.task(name):
+        yield
@@ -0,0 +1,114 @@
+"""Reader of consolidated archives produced with 'indexed' archive format."""
+import hashlib
+import json
+import mmap
+import os
+import re
+from types import TracebackType
+from typing import Dict, List, Optional, Type
+
+import zstandard
+from typing_extensions import Self
+
+from software_inventory_collector.archive import INDEX_VERSION, index_path
+from software_inventory_collector.exception import ArchiveError
+
+
+class IndexedArchive:
+    """Random access to members of a consolidated archive.
+
+    The archive is memory-mapped, so reading a member is a single slice of the map
+    at the offset stored in the index. Member names have the form
+    '<customer>_@_<site>_@_<model>_@_<run>/<endpoint>_@_<hostname>_@_<run>' (without
+    both '_@_<run>' suffixes in deterministic archives), with '.zst' suffix if they
+    are compressed with zstd dictionary.
+
+    Example:
+        with IndexedArchive("/path/to/output/run_@_20230101120000.tar") as archive:
+            for name in archive.find("dpkg", "host-1"):
+                print(archive.read_payload(name).decode())
+    """
+
+    def __init__(self, archive_path: str) -> None:
+        """Load index of the archive and map the archive into memory.
+
+        :param archive_path: Path to the consolidated archive
+        """
+        self.archive_path = archive_path
+        try:
+            with open(index_path(archive_path), "r", encoding="UTF-8") as index_file:
+                index = json.load(index_file)
+            if index["version"] != INDEX_VERSION:
+                raise ValueError(f"unsupported version {index['version']}")
+            self._members: Dict[str, Dict] = index["members"]
+            self.dictionary: str = index["dictionary"]
+        except (OSError, ValueError, KeyError, TypeError) as exc:
+            raise ArchiveError(f"Failed to load index of '{archive_path}': {exc}") from exc
+
+        self._decompressor: Optional[zstandard.ZstdDecompressor] = None
+        with open(archive_path, "rb") as archive_file:
+            self._map = mmap.mmap(archive_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __enter__(self) -> Self:
+        """Return the archive."""
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        """Unmap the archive."""
+        self.close()
+
+    def close(self) -> None:
+        """Unmap the archive."""
+        self._map.close()
+
+    def names(self) -> List[str]:
+        """Return names of all members."""
+        return list(self._members)
+
+    def find(self, endpoint: str, hostname: str) -> List[str]:
+        """Return names of members with data of an exporter endpoint of a host.
+
+        Names of members of deterministic archives, which don't contain the run
+        timestamp, are matched as well.
+        """
+        pattern = re.compile(rf"{re.escape(f'{endpoint}_@_{hostname}')}(_@_.*|\.zst)?")
+        return [name for name in self._members if pattern.fullmatch(name.rpartition("/")[2])]
+
+    def read(self, name: str) -> bytes:
+        """Return stored data of a member, verifying its checksum.
+
+        :param name: Name of the member
+        :return: Data of the member as stored in the archive
+        """
+        try:
+            entry = self._members[name]
+        except KeyError as exc:
+            raise ArchiveError(f"Member '{name}' not found in '{self.archive_path}'") from exc
+
+        start = entry["offset"]
+        end = start + entry["size"]
+        data = self._map[start:end]
+        if hashlib.sha256(data).hexdigest() != entry["sha256"]:
+            raise ArchiveError(f"Checksum mismatch of member '{name}' in '{self.archive_path}'")
+        return data
+
+    def read_payload(self, name: str) -> bytes:
+        """Return data of a member, decompressed if it's compressed with zstd."""
+        data = self.read(name)
+        if not name.endswith(".zst"):
+            return data
+
+        if self._decompressor is None:
+            dict_data = None
+            if self.dictionary:
+                directory = os.path.dirname(self.archive_path)
+                with open(os.path.join(directory, self.dictionary), "rb") as dictionary_file:
+                    dict_data = zstandard.ZstdCompressionDict(dictionary_file.read())
+            self._decompressor = zstandard.ZstdDecompressor(dict_data=dict_data)
+        # frames received from exporters don't have to record their content size
+        return self._decompressor.decompressobj().decompress(data)
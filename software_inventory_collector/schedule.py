@@ -0,0 +1,199 @@
+"""Scheduling of collection jobs based on durations from previous runs."""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Mapping, Optional, Sequence, TypeVar
+
+from software_inventory_collector.exception import CollectionError
+
+TARGETS = "target"
+MODELS = "model"
+COLLECTED = "collected"
+SIZES = "size"
+
+# Weight of the latest duration in the estimate, older runs are smoothed out
+SMOOTHING = 0.5
+# Runs started by cron are not exactly periodic, so artifacts that would be due
+# within this number of seconds are collected in the current run
+INTERVAL_TOLERANCE = 60
+
+_T = TypeVar("_T")
+
+
+class RunSchedule:  # pylint: disable=R0902
+    """Order of collection jobs and deadline of the whole run.
+
+    Durations of finished jobs (exporter targets and Juju models) are stored in
+    a history file and used as estimates in the next runs. Jobs are then started
+    longest first (LPT), so that the slowest ones don't define the tail of the run.
+    Jobs that would not finish before the deadline are skipped.
+
+    Times of the last collection of each artifact (exporter endpoint, model status
+    or bundle) are stored in the history file as well, so that artifacts with
+    a collection interval are collected only when they are due. Sizes of Juju
+    artifacts are kept too, so that memory can be reserved before they're fetched.
+    """
+
+    def __init__(
+        self,
+        history_path: str = "",
+        deadline: float = 0,
+        intervals: Optional[Mapping[str, float]] = None,
+    ) -> None:
+        """Initiate schedule of a run starting now.
+
+        :param history_path: Path to file with durations of jobs from previous runs,
+            durations are not persisted if empty
+        :param deadline: Maximum duration of the run in seconds, unlimited if 0
+        :param intervals: Minimum number of seconds between collections of each
+            artifact, artifacts without interval are collected in every run
+        """
+        self.history_path = history_path
+        self.deadline = deadline
+        self.intervals = dict(intervals or {})
+        self.skipped: List[str] = []
+        self._start = time.monotonic()
+        self._started_at = time.time()
+        self._lock = threading.Lock()
+        self._history: Dict[str, Dict[str, float]] = {
+            TARGETS: {},
+            MODELS: {},
+            COLLECTED: {},
+            SIZES: {},
+        }
+        if history_path:
+            self._load()
+
+    def _load(self) -> None:
+        """Load durations from the history file.
+
+        History is only an optimization, so missing or malformed file is ignored.
+        """
+        try:
+            with open(self.history_path, "r", encoding="UTF-8") as history_file:
+                data = json.load(history_file)
+        except (OSError, ValueError):
+            return
+
+        for kind, durations in self._history.items():
+            saved = data.get(kind) if isinstance(data, dict) else None
+            if isinstance(saved, dict):
+                durations.update(
+                    (key, float(value))
+                    for key, value in saved.items()
+                    if isinstance(value, (int, float))
+                )
+
+    def save(self) -> None:
+        """Write durations into the history file, replacing it atomically."""
+        if not self.history_path:
+            return
+
+        temp_path = f"{self.history_path}.tmp"
+        try:
+            with self._lock, open(temp_path, "w", encoding="UTF-8") as history_file:
+                json.dump(self._history, history_file, indent=2, sort_keys=True)
+            os.replace(temp_path, self.history_path)
+        except OSError as exc:
+            raise CollectionError(
+                f"Failed to save run history '{self.history_path}': {exc}"
+            ) from exc
+
+    def estimate(self, kind: str, key: str) -> Optional[float]:
+        """Return expected duration of a job, or None if it was never measured."""
+        return self._history[kind].get(key)
+
+    def order(self, kind: str, items: Sequence[_T], key: Callable[[_T], str]) -> List[_T]:
+        """Return items ordered from the longest expected duration to the shortest.
+
+        Items that were never measured go first, as they might be the longest.
+        Otherwise, the original order is kept.
+        """
+
+        def expected_duration(item: _T) -> float:
+            estimate = self.estimate(kind, key(item))
+            return float("inf") if estimate is None else estimate
+
+        return sorted(items, key=expected_duration, reverse=True)
+
+    def skip(self, kind: str, key: str) -> bool:
+        """Return True if job can't finish before the deadline and record it as skipped.
+
+        Job is skipped if the deadline passed, or if its expected duration exceeds
+        the remaining time.
+        """
+        if not self.deadline:
+            return False
+
+        remaining = self.deadline - (time.monotonic() - self._start)
+        if remaining > 0 and (self.estimate(kind, key) or 0) <= remaining:
+            return False
+
+        with self._lock:
+            self.skipped.append(f"{kind} {key}")
+        return True
+
+    @contextmanager
+    def timed(self, kind: str, key: str, full: bool = True) -> Iterator[None]:
+        """Measure duration of a job and update its estimate if it succeeds.
+
+        :param kind: Kind of the job, TARGETS or MODELS
+        :param key: Endpoint of the exporter or name of the model
+        :param full: False if only some artifacts of the job are collected, such
+            job is faster than the estimate of the whole job and doesn't update it
+        """
+        start = time.monotonic()
+        yield
+        if not full:
+            return
+        duration = time.monotonic() - start
+        with self._lock:
+            previous = self._history[kind].get(key)
+            if previous is not None:
+                duration = SMOOTHING * duration + (1 - SMOOTHING) * previous
+            self._history[kind][key] = duration
+
+    def due(self, key: str, artifacts: Sequence[str]) -> List[str]:
+        """Return artifacts of an exporter or a model that should be collected in this run.
+
+        Artifact is due if it has no interval, if it was never collected, or if its
+        interval elapsed since the last collection.
+
+        :param key: Endpoint of the exporter or name of the model
+        :param artifacts: Names of all artifacts, e.g. exporter endpoints
+        """
+        due = []
+        for artifact in artifacts:
+            interval = self.intervals.get(artifact, 0)
+            last = self.last_collected(key, artifact)
+            if not interval or last is None:
+                due.append(artifact)
+            elif self._started_at - last >= interval - INTERVAL_TOLERANCE:
+                due.append(artifact)
+        return due
+
+    def collected(self, key: str, artifacts: Sequence[str]) -> None:
+        """Record that artifacts of an exporter or a model were collected in this run."""
+        with self._lock:
+            for artifact in artifacts:
+                self._history[COLLECTED][f"{key}/{artifact}"] = self._started_at
+
+    def last_collected(self, key: str, artifact: str) -> Optional[float]:
+        """Return Unix time of the last collection of an artifact, or None if it's unknown."""
+        return self._history[COLLECTED].get(f"{key}/{artifact}")
+
+    def record_size(self, key: str, artifact: str, size: int) -> None:
+        """Record size of an artifact of a model collected in this run.
+
+        :param key: Name of the model
+        :param artifact: Name of the artifact, e.g. 'status'
+        :param size: Number of collected bytes
+        """
+        with self._lock:
+            self._history[SIZES][f"{key}/{artifact}"] = size
+
+    def size(self, key: str, artifact: str) -> Optional[float]:
+        """Return size of an artifact from the previous run, or None if it's unknown."""
+        return self._history[SIZES].get(f"{key}/{artifact}")
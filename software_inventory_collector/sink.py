@@ -0,0 +1,223 @@
+"""Output sinks that stream collected data as a single tar archive."""
+import os
+import queue
+import sys
+import tarfile
+import threading
+import time
+from contextlib import suppress
+from types import TracebackType
+from typing import IO, Iterator, Optional, Type, Union
+
+import requests
+from typing_extensions import Self
+
+from software_inventory_collector.config import _ConfigSettings
+from software_inventory_collector.exception import CollectionError
+
+STDOUT_OUTPUT = "stdout"
+HTTP_OUTPUT = "http"
+
+# Number of chunks of the tar stream waiting for the upload, each up to 10 KiB
+UPLOAD_QUEUE_SIZE = 64
+UPLOAD_TIMEOUT = 60
+
+_END = object()
+
+
+def member_info(file_name: str, content: IO[bytes]) -> tarfile.TarInfo:
+    """Return tar header of a collected file, leaving the content positioned at its start.
+
+    :param file_name: Name of the member in tar archive
+    :param content: File object with the content of the file
+    :return: Header of the member
+    """
+    tar_info = tarfile.TarInfo(file_name)
+    tar_info.size = content.seek(0, os.SEEK_END)
+    tar_info.mtime = int(time.time())
+    tar_info.mode = 0o600
+    tar_info.uid = os.getuid()
+    tar_info.gid = os.getgid()
+    content.seek(0)
+    return tar_info
+
+
+class TarStreamSink:
+    """Writer of collected files into a single tar stream, e.g. stdout or a pipe.
+
+    Each file is stored as '<tarball stem>/<file name>' member, where the stem is
+    the name of the tarball it would be written into by the file output, the same
+    as in consolidated archives. Files are written by the archive pipeline, one at
+    a time, so nothing is stored on disk beyond the payloads that exceed their
+    part of the memory budget.
+    """
+
+    def __init__(self, stream: IO[bytes]) -> None:
+        """Start tar stream.
+
+        :param stream: Binary stream to which the tar archive is written
+        """
+        self._stream = stream
+        # tar file is closed by `close`, as it spans the whole run
+        self._tar = tarfile.open(  # pylint: disable=R1732
+            fileobj=stream, mode="w|", encoding="UTF-8"
+        )
+
+    def __enter__(self) -> Self:
+        """Return the sink."""
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        """Finish the stream, or abort it if an exception is propagating."""
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, file_name: str, content: IO[bytes], tar_path: str) -> None:
+        """Add content of a file object to the stream, same as `_add_file_to_tar`.
+
+        :param file_name: Name of the file in the tarball
+        :param content: File object with the content of the file
+        :param tar_path: Path to tarball in which the file would be stored
+        """
+        prefix = os.path.splitext(os.path.basename(tar_path))[0]
+        self._tar.addfile(member_info(f"{prefix}/{file_name}", content), content)
+
+    def close(self) -> None:
+        """Write the end of the archive."""
+        self._tar.close()
+        self._stream.flush()
+
+    def abort(self) -> None:
+        """Stop the stream without the end of the archive, so it's seen as incomplete."""
+        self._stream.flush()
+
+
+class _ChunkQueue:
+    """Binary stream that passes written data to an iterator in another thread.
+
+    Writes block while the queue is full, so data held in memory are bounded.
+    """
+
+    def __init__(self, size: int) -> None:
+        """Initiate empty queue of up to `size` chunks."""
+        self._queue: queue.Queue = queue.Queue(maxsize=size)
+        self._ended = False
+
+    def write(self, data: bytes) -> int:
+        """Queue a chunk of data."""
+        self._queue.put(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        """Do nothing, data are passed to the iterator as they are written."""
+
+    def end(self, error: Optional[Exception] = None) -> None:
+        """Stop the iterator, raising `error` in it if it's provided."""
+        self._queue.put(_END if error is None else error)
+
+    def __iter__(self) -> Iterator[bytes]:
+        """Yield queued chunks until the end."""
+        while True:
+            chunk: Union[bytes, Exception, object] = self._queue.get()
+            if chunk is _END or isinstance(chunk, Exception):
+                self._ended = True
+                if isinstance(chunk, Exception):
+                    raise chunk
+                return
+            yield chunk  # type: ignore[misc]
+
+    def drain(self) -> None:
+        """Discard chunks until the end, so writers are not blocked."""
+        if self._ended:
+            return
+        with suppress(Exception):
+            for _ in self:
+                pass
+
+
+class HTTPUploadSink(TarStreamSink):
+    """Tar stream uploaded to an ingest URL by a single chunked HTTP POST request.
+
+    The request body is sent by a background thread as the archive is written, so
+    the data go from exporters to the ingest service without being stored.
+    """
+
+    def __init__(self, url: str, timeout: float = UPLOAD_TIMEOUT) -> None:
+        """Start the upload.
+
+        :param url: Ingest URL to which the archive is posted
+        :param timeout: Timeout of connection and of the response in seconds
+        """
+        self.url = url
+        self.timeout = timeout
+        self._chunks = _ChunkQueue(UPLOAD_QUEUE_SIZE)
+        self._error: Optional[Exception] = None
+        self._thread = threading.Thread(target=self._upload, daemon=True)
+        self._thread.start()
+        super().__init__(self._chunks)  # type: ignore[arg-type]
+
+    def _upload(self) -> None:
+        """Post the tar stream, then discard the rest of it if the upload failed."""
+        try:
+            with requests.post(
+                self.url,
+                data=iter(self._chunks),
+                headers={"Content-Type": "application/x-tar"},
+                timeout=self.timeout,
+            ) as response:
+                response.raise_for_status()
+        except Exception as exc:  # pylint: disable=W0718
+            self._error = exc
+        finally:
+            self._chunks.drain()
+
+    def _check(self) -> None:
+        """Raise error of the upload if it failed."""
+        if self._error is not None:
+            raise CollectionError(
+                f"Failed to upload collected data to '{self.url}': {self._error}"
+            ) from self._error
+
+    def write(self, file_name: str, content: IO[bytes], tar_path: str) -> None:
+        """Add content of a file object to the upload, failing early if the upload failed."""
+        self._check()
+        super().write(file_name, content, tar_path)
+
+    def close(self) -> None:
+        """Finish the archive and wait until the ingest service accepts it."""
+        super().close()
+        self._chunks.end()
+        self._thread.join()
+        self._check()
+
+    def abort(self) -> None:
+        """Interrupt the request, so the ingest service doesn't accept incomplete archive."""
+        self._chunks.end(CollectionError("Collection failed, upload aborted"))
+        self._thread.join()
+
+
+def _detach_stdout() -> IO[bytes]:
+    """Return binary stream of the original stdout and redirect stdout to stderr.
+
+    Messages printed during the run then can't corrupt the streamed archive.
+    """
+    sys.stdout.flush()
+    stream = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    return stream
+
+
+def new_sink(settings: _ConfigSettings) -> Optional[TarStreamSink]:
+    """Return streaming sink of the output set in the settings, or None for 'file' output."""
+    if settings.output == STDOUT_OUTPUT:
+        return TarStreamSink(_detach_stdout())
+    if settings.output == HTTP_OUTPUT:
+        return HTTPUploadSink(settings.ingest_url)
+    return None
@@ -0,0 +1,39 @@
+"""Benchmark of adaptive concurrency converging to capacity of a simulated site."""
+import asyncio
+import time
+
+import pytest
+
+from software_inventory_collector.concurrency import AdaptiveLimiter, record_response
+
+QUERIES = 2000
+# Site serves this many queries at once, further queries queue up and latency rises
+CAPACITY = 16
+LATENCY = 0.01
+MAX_WORKERS = 256
+
+
+@pytest.mark.asyncio
+async def test_adaptive_concurrency_converges():
+    """Test that the limit settles near capacity of the site without tuning."""
+    limiter = AdaptiveLimiter(initial=1, maximum=MAX_WORKERS)
+    in_service = 0
+
+    async def query() -> None:
+        nonlocal in_service
+        async with limiter.async_slot():
+            in_service += 1
+            try:
+                await asyncio.sleep(LATENCY * max(1.0, in_service / CAPACITY))
+                record_response()
+            finally:
+                in_service -= 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(query() for _ in range(QUERIES)))
+    duration = time.perf_counter() - start
+
+    ideal = QUERIES / CAPACITY * LATENCY
+    print(f"{limiter.report()}, {duration:.2f} s ({ideal / duration:.0%} of ideal throughput)")
+    assert CAPACITY / 2 <= limiter.limit <= CAPACITY * 4
+    assert duration < ideal * 2
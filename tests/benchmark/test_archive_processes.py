@@ -0,0 +1,58 @@
+"""Benchmark of tarball compression scaling with number of worker processes."""
+import os
+import random
+import time
+from pathlib import Path
+
+import pytest
+
+from software_inventory_collector import collector
+from software_inventory_collector.config import Config
+
+TARBALLS = 8
+TARBALL_SIZE = 16 * 1024 * 1024
+PROCESSES = min(os.cpu_count() or 1, TARBALLS)
+
+
+def _run_compression(tmp_path: Path, processes: int) -> float:
+    """Prepare tarballs, compress them with given number of processes and return the duration."""
+    output = tmp_path / str(processes)
+    output.mkdir()
+    words = [b"package-%d 1.%d.%d-ubuntu\n" % (i, i % 7, i % 13) for i in range(1000)]
+    rng = random.Random(processes)
+    for index in range(TARBALLS):
+        tar_path = output / f"customer_@_site_@_model-{index}_@_{collector.TIMESTAMP}.tar"
+        with open(tar_path, "wb") as tar_file:
+            while tar_file.tell() < TARBALL_SIZE:
+                tar_file.write(b"".join(rng.choices(words, k=1024)))
+
+    config = Config.from_dict(
+        {
+            "settings": {
+                "collection_path": str(output),
+                "customer": "customer",
+                "site": "site",
+                "compression": "xz",
+                "archive_processes": processes,
+            },
+            "juju_controller": {"endpoint": "", "ca_cert": "", "username": "", "password": ""},
+            "targets": [],
+        }
+    )
+    start = time.perf_counter()
+    collector.finalize_archives(config)
+    duration = time.perf_counter() - start
+
+    assert len(list(output.glob("*.tar.xz"))) == TARBALLS
+    return duration
+
+
+@pytest.mark.skipif(PROCESSES < 4, reason="Scaling benchmark requires at least 4 CPU cores")
+def test_archive_processes_scaling(tmp_path: Path):
+    """Test that compression throughput scales with number of worker processes."""
+    serial = _run_compression(tmp_path, 0)
+    parallel = _run_compression(tmp_path, PROCESSES)
+
+    speedup = serial / parallel
+    print(f"compression speedup with {PROCESSES} processes: {speedup:.2f}x")
+    assert speedup > PROCESSES / 2
@@ -0,0 +1,40 @@
+"""Benchmark of the health check of a large fleet of exporters."""
+import asyncio
+import time
+
+import pytest
+
+from software_inventory_collector.config import _ConfigTarget
+from software_inventory_collector.health import check_targets
+
+TARGETS = 2000
+MAX_DURATION = 5.0
+
+
+@pytest.mark.asyncio
+async def test_check_targets_large_fleet():
+    """Test that thousands of exporters are probed within seconds."""
+
+    async def handle(reader, writer):
+        await reader.readuntil(b"\r\n\r\n")
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Length: 13\r\n\r\n{"kernel": 1}')
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0, backlog=1024)
+    endpoint = f"127.0.0.1:{server.sockets[0].getsockname()[1]}"
+    targets = [
+        _ConfigTarget(endpoint, f"host-{index}", "customer", "site", "model")
+        for index in range(TARGETS)
+    ]
+    try:
+        start = time.perf_counter()
+        report = await check_targets(targets)
+        duration = time.perf_counter() - start
+    finally:
+        server.close()
+        await server.wait_closed()
+
+    print(f"probed {TARGETS} targets in {duration:.2f} s")
+    assert len(report.latencies) == TARGETS
+    assert duration < MAX_DURATION
@@ -0,0 +1,34 @@
+"""Benchmark of parsing config with large number of targets."""
+import time
+
+from software_inventory_collector.config import Config
+
+TARGETS = 10000
+# Generous limit that catches regressions such as per-item type introspection
+MAX_DURATION = 0.5
+
+
+def test_config_loading_many_targets():
+    """Test that config with thousands of targets is parsed and validated quickly."""
+    raw_config = {
+        "settings": {"collection_path": "/tmp", "customer": "customer", "site": "site"},
+        "juju_controller": {"endpoint": "", "ca_cert": "", "username": "", "password": ""},
+        "targets": [
+            {
+                "endpoint": f"10.0.{index // 256}.{index % 256}:8675",
+                "hostname": f"host-{index}",
+                "customer": "customer",
+                "site": "site",
+                "model": f"model-{index % 10}",
+            }
+            for index in range(TARGETS)
+        ],
+    }
+
+    start = time.perf_counter()
+    config = Config.from_dict(raw_config)
+    duration = time.perf_counter() - start
+
+    print(f"parsed {TARGETS} targets in {duration * 1000:.1f} ms")
+    assert len(config.targets) == TARGETS
+    assert duration < MAX_DURATION
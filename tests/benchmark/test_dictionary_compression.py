@@ -0,0 +1,89 @@
+"""Benchmark of size of archives compressed with trained zstd dictionary."""
+import json
+import random
+import time
+from io import BytesIO
+from pathlib import Path
+
+from software_inventory_collector import collector
+from software_inventory_collector.config import Config
+
+HOSTS = 300
+MODELS = 10
+PACKAGES = 2000
+
+
+def _payloads(host: int) -> dict:
+    """Return payloads of a host, mostly identical to payloads of other hosts.
+
+    Payloads have the shape of exporter responses: dpkg is a list of packages,
+    snap is the snapd response with a list of snaps.
+    """
+    rng = random.Random(host)
+    dpkg = [
+        {
+            "package": f"package-{index}:amd64",
+            "version": f"1.{index}.{rng.choice([0, 0, 0, 1])}-0ubuntu1",
+        }
+        for index in range(PACKAGES)
+        if rng.random() < 0.7
+    ]
+    snap = {
+        "type": "sync",
+        "status-code": 200,
+        "status": "OK",
+        "result": [
+            {
+                "name": f"snap-{index}",
+                "version": f"{index}.{rng.randint(0, 3)}",
+                "revision": str(rng.randint(100, 200)),
+                "channel": "latest/stable",
+            }
+            for index in range(20)
+        ],
+    }
+    kernel = {"kernel": f"5.15.0-{rng.randint(70, 80)}-generic"}
+    return {
+        endpoint: json.dumps(payload).encode()
+        for endpoint, payload in [("dpkg", dpkg), ("snap", snap), ("kernel", kernel)]
+    }
+
+
+def _compressed_size(tmp_path: Path, compression: str) -> int:
+    """Collect tarballs of the fleet, compress them and return total size of the output."""
+    output = tmp_path / compression
+    output.mkdir()
+    for host in range(HOSTS):
+        tar_path = output / f"customer_@_site_@_model-{host % MODELS}_@_{collector.TIMESTAMP}.tar"
+        for endpoint, payload in _payloads(host).items():
+            file_name = f"{endpoint}_@_host-{host}_@_{collector.TIMESTAMP}"
+            collector._add_file_to_tar(file_name, BytesIO(payload), str(tar_path))
+
+    config = Config.from_dict(
+        {
+            "settings": {
+                "collection_path": str(output),
+                "customer": "customer",
+                "site": "site",
+                "compression": compression,
+            },
+            "juju_controller": {"endpoint": "", "ca_cert": "", "username": "", "password": ""},
+            "targets": [],
+        }
+    )
+    start = time.perf_counter()
+    collector.finalize_archives(config)
+    duration = time.perf_counter() - start
+
+    size = sum(path.stat().st_size for path in output.iterdir())
+    print(f"{compression}: {size / 1024:.0f} KiB in {duration:.2f} s")
+    return size
+
+
+def test_dictionary_compression_size(tmp_path: Path):
+    """Test that payloads compressed with trained dictionary are smaller than tar+gzip."""
+    gzip_size = _compressed_size(tmp_path, "gz")
+    dictionary_size = _compressed_size(tmp_path, "zstd-dict")
+
+    print(f"zstd-dict output is {gzip_size / dictionary_size:.2f}x smaller than tar+gzip")
+    assert dictionary_size < gzip_size
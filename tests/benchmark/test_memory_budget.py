@@ -0,0 +1,165 @@
+"""Benchmark asserting that collection stays within configured memory budget."""
+import asyncio
+import tarfile
+import threading
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+from software_inventory_collector import collector
+from software_inventory_collector.config import Config
+
+PAYLOAD_SIZE = 4 * 1024 * 1024
+MEMORY_BUDGET = 4 * 1024 * 1024
+TARGETS = 8
+WORKERS = 8
+STATUS_SIZE = 1024 * 1024
+MODELS = 8
+# Interpreter bookkeeping (threads, sockets, tarfile buffers) not covered by the budget
+OVERHEAD = 2 * 1024 * 1024
+
+PAYLOAD = b"x" * PAYLOAD_SIZE
+
+
+class _ExporterHandler(BaseHTTPRequestHandler):
+    """Exporter stand-in responding with large payload on every endpoint."""
+
+    def do_GET(self):  # noqa: N802
+        self.send_response(200)
+        self.send_header("Content-Length", str(PAYLOAD_SIZE))
+        self.end_headers()
+        view = memoryview(PAYLOAD)
+        chunk = 64 * 1024
+        for start, end in zip(
+            range(0, PAYLOAD_SIZE, chunk), range(chunk, PAYLOAD_SIZE + chunk, chunk)
+        ):
+            self.wfile.write(view[start:end])
+
+    def log_message(self, *args):
+        pass
+
+
+class _Status:
+    """Model status stand-in producing large JSON document."""
+
+    def to_json(self):
+        return "x" * STATUS_SIZE
+
+
+class _Model:
+    """Model stand-in that builds its status only when it's queried, like Juju client."""
+
+    def is_connected(self):
+        return True
+
+    async def get_status(self):
+        await asyncio.sleep(0.01)
+        return _Status()
+
+    async def export_bundle(self):
+        return "applications: {}"
+
+    async def disconnect(self):
+        pass
+
+
+class _Controller:
+    """Controller stand-in with `MODELS` models."""
+
+    async def model_uuids(self):
+        return {f"model-{index}": index for index in range(MODELS)}
+
+    async def get_model(self, _):
+        return _Model()
+
+    async def disconnect(self):
+        pass
+
+
+@pytest.fixture()
+def exporter():
+    """Run local exporter stand-in and return its endpoint."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ExporterHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def _config(tmp_path: Path, targets):
+    """Return config of collection into `tmp_path` limited by `MEMORY_BUDGET`."""
+    return Config.from_dict(
+        {
+            "settings": {
+                "collection_path": str(tmp_path),
+                "customer": "customer",
+                "site": "site",
+                "memory_budget": MEMORY_BUDGET,
+                "workers": WORKERS,
+            },
+            "juju_controller": {"endpoint": "", "ca_cert": "", "username": "", "password": ""},
+            "targets": targets,
+        }
+    )
+
+
+def test_exporter_collection_memory_bound(exporter, tmp_path: Path):
+    """Test that peak memory stays under the budget regardless of payload sizes."""
+    config = _config(
+        tmp_path,
+        [
+            {
+                "endpoint": exporter,
+                "hostname": f"host-{index}",
+                "customer": "customer",
+                "site": "site",
+                "model": f"model-{index % 2}",
+            }
+            for index in range(TARGETS)
+        ],
+    )
+
+    tracemalloc.start()
+    try:
+        collector.fetch_exporter_data(config)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    collected = 0
+    for tar_path in tmp_path.glob("*.tar"):
+        with tarfile.open(tar_path) as tar_file:
+            collected += sum(member.size for member in tar_file.getmembers())
+
+    assert collected == TARGETS * len(collector.ENDPOINTS) * PAYLOAD_SIZE
+    assert peak < MEMORY_BUDGET + OVERHEAD, f"peak memory {peak} exceeded the budget"
+
+
+def test_juju_collection_memory_bound(tmp_path: Path):
+    """Test that peak memory stays under the budget while models are collected concurrently.
+
+    The first run doesn't know sizes of the statuses, the second one reserves their
+    sizes from the first run.
+    """
+    config = _config(tmp_path, [])
+    schedule = collector.RunSchedule()
+
+    for _ in range(2):
+        tracemalloc.start()
+        try:
+            asyncio.run(collector.fetch_juju_data(config, {"": _Controller()}, schedule))
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        assert peak < MEMORY_BUDGET + OVERHEAD, f"peak memory {peak} exceeded the budget"
+
+    collected = 0
+    for tar_path in tmp_path.glob("*.tar"):
+        with tarfile.open(tar_path) as tar_file:
+            collected += sum(
+                member.size for member in tar_file.getmembers() if "status" in member.name
+            )
+    assert collected == 2 * MODELS * STATUS_SIZE
@@ -0,0 +1,40 @@
+"""Benchmark of fleet-wide queries against the package index."""
+import json
+import time
+
+from software_inventory_collector.config import _ConfigTarget
+from software_inventory_collector.index import PackageIndex, PayloadParser
+
+HOSTS = 300
+PACKAGES = 1000
+# Indexed lookup should take milliseconds regardless of the fleet size
+MAX_QUERY_DURATION = 0.05
+
+DPKG_OUTPUT = json.dumps(
+    [{"package": f"package-{index}", "version": f"1.{index}-1"} for index in range(PACKAGES)]
+).encode()
+
+
+def test_package_index_fleet_query(tmp_path):
+    """Test that lookup of a package across the whole fleet is fast."""
+    with PackageIndex(str(tmp_path / "index.db"), run="run") as index:
+        start = time.perf_counter()
+        for host in range(HOSTS):
+            parser = PayloadParser("dpkg")
+            parser.write(DPKG_OUTPUT)
+            parser.close()
+            target = _ConfigTarget("", f"host-{host}", "customer", "site", f"model-{host % 10}")
+            index.add_payload(target, parser)
+        index.flush()
+        insert_duration = time.perf_counter() - start
+
+        start = time.perf_counter()
+        hosts = index.find_package("package-500", version="1.500-1")
+        query_duration = time.perf_counter() - start
+
+    print(
+        f"indexed {HOSTS * PACKAGES} packages in {insert_duration:.1f} s, "
+        f"queried in {query_duration * 1000:.2f} ms"
+    )
+    assert len(hosts) == HOSTS
+    assert query_duration < MAX_QUERY_DURATION
@@ -0,0 +1,173 @@
+"""Tests for software_inventory_collector.archive module."""
+import hashlib
+import io
+import json
+import os
+import tarfile
+from pathlib import Path
+
+import pytest
+import zstandard
+
+from software_inventory_collector import archive
+
+
+def _payload(host):
+    """Return dpkg-like payload of a host, similar to payloads of other hosts."""
+    return "".join(
+        f"ii  package-{index}  1.{index}.{(host + index) % 3}-1  amd64  Package {index}\n"
+        for index in range(host % 7, 400, 2)
+    ).encode()
+
+
+def _write_tarball(tar_path, hosts):
+    """Write tarball with payloads of the hosts."""
+    with tarfile.open(tar_path, "w") as tar_file:
+        for host in hosts:
+            payload = _payload(host)
+            member = tarfile.TarInfo(f"dpkg_@_host-{host}")
+            member.size = len(payload)
+            tar_file.addfile(member, io.BytesIO(payload))
+
+
+def test_train_dictionary_and_compress_members(tmp_path):
+    """Test that payloads compressed with trained dictionary can be decompressed."""
+    tar_paths = [str(tmp_path / f"model-{index}.tar") for index in range(2)]
+    _write_tarball(tar_paths[0], range(0, 40))
+    _write_tarball(tar_paths[1], range(40, 80))
+
+    dictionary = archive.train_dictionary(tar_paths)
+    assert archive.compress_members(tar_paths[1], dictionary) == tar_paths[1]
+
+    assert dictionary
+    decompressor = zstandard.ZstdDecompressor(dict_data=zstandard.ZstdCompressionDict(dictionary))
+    with tarfile.open(tar_paths[1]) as tar_file:
+        members = tar_file.getmembers()
+        assert [member.name for member in members] == [
+            f"dpkg_@_host-{host}.zst" for host in range(40, 80)
+        ]
+        for host, member in zip(range(40, 80), members):
+            compressed = tar_file.extractfile(member).read()
+            assert decompressor.decompress(compressed) == _payload(host)
+            assert len(compressed) < len(_payload(host)) / 4
+
+
+def test_train_dictionary_not_enough_data(tmp_path):
+    """Test that members are compressed without dictionary if it can't be trained."""
+    tar_path = str(tmp_path / "model.tar")
+    _write_tarball(tar_path, [1])
+    with tarfile.open(tar_path, "a") as tar_file:
+        directory = tarfile.TarInfo("directory")
+        directory.type = tarfile.DIRTYPE
+        tar_file.addfile(directory)
+
+    dictionary = archive.train_dictionary([tar_path])
+    archive.compress_members(tar_path, dictionary)
+
+    assert dictionary == b""
+    with tarfile.open(tar_path) as tar_file:
+        assert tar_file.getmember("directory").isdir()
+        member = tar_file.getmember("dpkg_@_host-1.zst")
+        compressed = tar_file.extractfile(member).read()
+    assert zstandard.ZstdDecompressor().decompress(compressed) == _payload(1)
+
+
+def test_stored_zstd_members(tmp_path):
+    """Test that members stored as zstd frames received from exporters are kept as-is."""
+    run = "20240101120000"
+    tar_path = str(tmp_path / "model.tar")
+    _write_tarball(tar_path, range(40))
+    stored = zstandard.ZstdCompressor().compress(_payload(40))
+    with tarfile.open(tar_path, "a") as tar_file:
+        member = tarfile.TarInfo(f"dpkg_@_host-40_@_{run}.zst")
+        member.size = len(stored)
+        tar_file.addfile(member, io.BytesIO(stored))
+
+    archive.compress_members(tar_path, archive.train_dictionary([tar_path]))
+    archive.normalize_tarball(tar_path, run)
+
+    with tarfile.open(tar_path) as tar_file:
+        assert "dpkg_@_host-1.zst" in tar_file.getnames()
+        assert tar_file.extractfile("dpkg_@_host-40.zst").read() == stored
+
+
+def test_consolidate_tarballs(tmp_path):
+    """Test that tarballs are merged into one archive with index pointing to member data."""
+    tar_paths = [str(tmp_path / f"model-{index}.tar") for index in range(2)]
+    _write_tarball(tar_paths[0], [1, 2])
+    _write_tarball(tar_paths[1], [3])
+    with tarfile.open(tar_paths[1], "a") as tar_file:
+        directory = tarfile.TarInfo("directory")
+        directory.type = tarfile.DIRTYPE
+        tar_file.addfile(directory)
+    archive_path = archive.consolidated_path(str(tmp_path), "20240101120000")
+
+    index_path = archive.consolidate_tarballs(tar_paths, archive_path, "dictionary.dict")
+
+    with open(index_path, encoding="UTF-8") as index_file:
+        index = json.load(index_file)
+    assert index["archive"] == "run_@_20240101120000.tar"
+    assert index["dictionary"] == "dictionary.dict"
+    with open(archive_path, "rb") as archive_file, tarfile.open(archive_path) as tar_file:
+        for name, host in [("model-0/dpkg_@_host-1", 1), ("model-1/dpkg_@_host-3", 3)]:
+            entry = index["members"][name]
+            archive_file.seek(entry["offset"])
+            data = archive_file.read(entry["size"])
+            assert data == _payload(host) == tar_file.extractfile(name).read()
+            assert entry["sha256"] == hashlib.sha256(data).hexdigest()
+        assert len(tar_file.getmembers()) == len(index["members"]) == 3
+    assert not any(os.path.exists(tar_path) for tar_path in tar_paths)
+
+
+def test_normalize_tarball(tmp_path):
+    """Test that the same data produce the same tarball in different runs."""
+    tarballs = []
+    for run, hosts in [("20240101120000", [2, 1]), ("20240102120000", [1, 2])]:
+        tar_path = str(tmp_path / f"model_@_{run}.tar")
+        with tarfile.open(tar_path, "w") as tar_file:
+            for host in hosts:
+                payload = _payload(host)
+                member = tarfile.TarInfo(f"dpkg_@_host-{host}_@_{run}")
+                member.size = len(payload)
+                member.mtime = int(run) % 1000
+                member.uid = 1000 + host
+                tar_file.addfile(member, io.BytesIO(payload))
+            directory = tarfile.TarInfo("directory")
+            directory.type = tarfile.DIRTYPE
+            tar_file.addfile(directory)
+        archive.normalize_tarball(tar_path, run)
+        tarballs.append(tar_path)
+
+    members = []
+    for tar_path in tarballs:
+        with tarfile.open(tar_path) as tar_file:
+            manifest = json.load(tar_file.extractfile(archive.MANIFEST_NAME))
+            assert manifest["run"] in tar_path
+            assert tar_file.getnames() == [archive.MANIFEST_NAME, "dpkg_@_host-1", "dpkg_@_host-2"]
+            assert tar_file.extractfile("dpkg_@_host-1").read() == _payload(1)
+            members.append(
+                [
+                    (member.name, member.mtime, member.uid, member.mode)
+                    for member in tar_file
+                    if member.name != archive.MANIFEST_NAME
+                ]
+            )
+    assert members[0] == members[1]
+
+    # tarballs differ only in the run recorded in the manifest
+    data = [Path(tar_path).read_bytes() for tar_path in tarballs]
+    assert len(data[0]) == len(data[1])
+    assert sum(left != right for left, right in zip(*data)) == 1
+
+
+@pytest.mark.parametrize("compression", ["gz", "bz2", "xz"])
+def test_compress_tarball_reproducible(compression, tmp_path):
+    """Test that compressed tarball doesn't depend on name and time of the tarball."""
+    compressed = []
+    for run in ["20240101120000", "20240102120000"]:
+        tar_path = str(tmp_path / f"model_@_{run}.tar")
+        _write_tarball(tar_path, [1, 2])
+        with open(archive.compress_tarball(tar_path, compression), "rb") as compressed_file:
+            compressed.append(compressed_file.read())
+
+    assert compressed[0] == compressed[1]
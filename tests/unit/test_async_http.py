@@ -0,0 +1,165 @@
+"""Tests for software_inventory_collector.async_http module."""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import List, Tuple
+
+import pytest
+
+from software_inventory_collector import async_http
+from software_inventory_collector.exception import HTTPClientError
+
+PATHS = ["/dpkg", "/snap", "/kernel"]
+
+
+def _response(body: bytes, version: str = "HTTP/1.1", headers: str = "") -> bytes:
+    """Return raw HTTP response with Content-Length framing."""
+    return f"{version} 200 OK\r\nContent-Length: {len(body)}\r\n{headers}\r\n".encode() + body
+
+
+def _chunked_response(chunks: List[bytes]) -> bytes:
+    """Return raw HTTP response with chunked transfer encoding."""
+    body = b"".join(b"%x;ext=1\r\n%s\r\n" % (len(chunk), chunk) for chunk in chunks)
+    return b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n" + body + b"0\r\nX: y\r\n\r\n"
+
+
+@asynccontextmanager
+async def exporter(scripts: List[Tuple[int, bytes]]):
+    """Run server that answers each connection with the next scripted data and closes it.
+
+    Each script is a tuple of number of requests to wait for and the raw response data.
+    Yields server endpoint and list of requests received by each connection.
+    """
+    received: List[List[bytes]] = []
+
+    async def handle(reader, writer):
+        expected, data = scripts[len(received)]
+        requests: List[bytes] = []
+        received.append(requests)
+        for _ in range(expected):
+            requests.append(await reader.readuntil(b"\r\n\r\n"))
+        writer.write(data)
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        yield f"127.0.0.1:{port}", received
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+async def _fetch_all(endpoint: str, paths=PATHS, timeout: float = 5):
+    """Fetch paths and return list of (path, body)."""
+    results = []
+    async for path, _, body in async_http.fetch_pipelined(endpoint, paths, timeout):
+        results.append((path, b"".join([chunk async for chunk in body])))
+    return results
+
+
+@pytest.mark.asyncio
+async def test_fetch_pipelined_single_connection():
+    """Test that all requests are sent at once and answered over one connection."""
+    large = b"x" * (async_http.CHUNK_SIZE * 2 + 1)
+    script = _response(b"dpkg data") + _chunked_response([b"snap ", large]) + _response(b"kernel")
+
+    async with exporter([(3, script)]) as (endpoint, received):
+        results = await _fetch_all(endpoint)
+
+    assert results == [
+        ("/dpkg", b"dpkg data"),
+        ("/snap", b"snap " + large),
+        ("/kernel", b"kernel"),
+    ]
+    assert len(received) == 1
+    assert [request.split(b"\r\n")[0] for request in received[0]] == [
+        b"GET /dpkg HTTP/1.1",
+        b"GET /snap HTTP/1.1",
+        b"GET /kernel HTTP/1.1",
+    ]
+    assert b"Connection: close" in received[0][-1]
+    assert b"Connection: keep-alive" in received[0][0]
+
+
+@pytest.mark.asyncio
+async def test_fetch_pipelined_reconnects_http10():
+    """Test fallback to new connection when server closes it after each response."""
+    scripts = [
+        (1, _response(b"dpkg", version="HTTP/1.0")),
+        (1, _response(b"snap", headers="Connection: close\r\n")),
+        (1, b"HTTP/1.0 200 OK\r\n\r\nkernel until EOF"),
+    ]
+
+    async with exporter(scripts) as (endpoint, received):
+        results = await _fetch_all(endpoint)
+
+    assert results == [("/dpkg", b"dpkg"), ("/snap", b"snap"), ("/kernel", b"kernel until EOF")]
+    assert [len(requests) for requests in received] == [1, 1, 1]
+
+
+@pytest.mark.asyncio
+async def test_fetch_pipelined_reconnects_after_unexpected_close():
+    """Test that remaining requests are retried if server closes keep-alive connection."""
+    keep_alive = _response(b"dpkg", version="HTTP/1.0", headers="Connection: keep-alive\r\n")
+    scripts = [(1, keep_alive), (2, _response(b"snap") + _response(b"kernel"))]
+
+    async with exporter(scripts) as (endpoint, received):
+        results = await _fetch_all(endpoint)
+
+    assert results == [("/dpkg", b"dpkg"), ("/snap", b"snap"), ("/kernel", b"kernel")]
+    assert len(received) == 2
+
+
+@pytest.mark.asyncio
+async def test_fetch_pipelined_unconsumed_body():
+    """Test that body not read by the caller is skipped."""
+    script = _response(b"dpkg data") + _response(b"snap data")
+
+    async with exporter([(2, script)]) as (endpoint, _):
+        paths = [path async for path, _, _ in async_http.fetch_pipelined(endpoint, PATHS[:2], 5)]
+
+    assert paths == PATHS[:2]
+
+
+@pytest.mark.parametrize(
+    "script, message",
+    [
+        (b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n", "Unexpected status 404"),
+        (b"", "Connection closed without response"),
+        (b"garbage\r\n\r\n", "Invalid status line"),
+        (b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\nzz\r\n", "Invalid chunk size"),
+        (b"HTTP/1.1 200 OK\r\nContent-Length: ten\r\n\r\n", "Invalid Content-Length 'ten'"),
+        (b"HTTP/1.1 200 OK\r\nContent-Length: -1\r\n\r\n", "Invalid Content-Length '-1'"),
+        (b"HTTP/1.1 200 OK\r\nServer: " + b"x" * 2**17 + b"\r\n\r\n", "exceeds the limit"),
+    ],
+)
+@pytest.mark.asyncio
+async def test_fetch_pipelined_invalid_response(script, message):
+    """Test handling of unexpected responses."""
+    async with exporter([(1, script)]) as (endpoint, _):
+        with pytest.raises(HTTPClientError, match=message):
+            await _fetch_all(endpoint)
+
+
+@pytest.mark.asyncio
+async def test_fetch_pipelined_truncated_body():
+    """Test that body shorter than announced length is reported."""
+    script = b"HTTP/1.1 200 OK\r\nContent-Length: 100\r\n\r\nshort"
+
+    async with exporter([(1, script)]) as (endpoint, _):
+        with pytest.raises(asyncio.IncompleteReadError):
+            await _fetch_all(endpoint)
+
+
+@pytest.mark.parametrize("endpoint", ["10.0.0.1:port", ":8675"])
+@pytest.mark.asyncio
+async def test_fetch_pipelined_invalid_endpoint(endpoint):
+    """Test handling of malformed endpoints."""
+    with pytest.raises(HTTPClientError, match="Invalid endpoint"):
+        await _fetch_all(endpoint)
+
+
+def test_parse_address_default_port():
+    """Test that port 80 is used if endpoint does not specify it."""
+    assert async_http._parse_address("exporter.local") == ("exporter.local", 80)
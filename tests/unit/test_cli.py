@@ -1,10 +1,13 @@
 """Tests for software_inventory_collector.cli module."""
-from unittest.mock import AsyncMock, MagicMock, mock_open, patch
+from unittest.mock import ANY, AsyncMock, MagicMock, mock_open, patch
 
 import pytest
 import yaml
 
 from software_inventory_collector import cli
+from software_inventory_collector.config import _ConfigIntervals, _ConfigTarget
+from software_inventory_collector.health import HealthReport
+from software_inventory_collector.schedule import TARGETS
 
 
 @pytest.mark.parametrize("dry_run", [True, False])
@@ -19,7 +22,28 @@ def test_parse_cli(dry_run, mocker):
     parsed_args = cli.parse_cli()
 
     assert parsed_args.dry_run == dry_run
+    assert parsed_args.check_targets is False
     assert parsed_args.config == conf_path
+    assert parsed_args.profile == ""
+    assert parsed_args.trace_malloc == 0
+
+
+@pytest.mark.parametrize(
+    "args, profile, trace_malloc",
+    [
+        (["--profile", "/tmp/run.pstats"], "/tmp/run.pstats", 0),
+        (["--trace-malloc"], "", cli.TOP_ALLOCATORS),
+        (["--trace-malloc", "3"], "", 3),
+    ],
+)
+def test_parse_cli_profiling(args, profile, trace_malloc, mocker):
+    """Test parsing of profiling arguments."""
+    mocker.patch("sys.argv", ["software-inventory-collector"] + args)
+
+    parsed_args = cli.parse_cli()
+
+    assert parsed_args.profile == profile
+    assert parsed_args.trace_malloc == trace_malloc
 
 
 def test_parse_config_success(mocker):
@@ -28,16 +52,40 @@ def test_parse_config_success(mocker):
     conf_file_content = {"option": "value"}
     conf_file_raw_content = yaml.dump(conf_file_content)
     expected_config = MagicMock()
+    expected_config.settings.targets_path = ""
     from_dict_mock = mocker.patch.object(cli.Config, "from_dict", return_value=expected_config)
+    load_targets_mock = mocker.patch.object(cli, "load_targets")
 
     with patch("builtins.open", mock_open(read_data=conf_file_raw_content)) as mock_file:
         config = cli.parse_config(conf_file_path)
 
     mock_file.assert_called_once_with(conf_file_path, "r", encoding="UTF-8")
     from_dict_mock.assert_called_once_with(conf_file_content)
+    load_targets_mock.assert_not_called()
     assert config is expected_config
 
 
+def test_parse_config_targets_inventory(collector_config, mocker):
+    """Test that targets from external inventory are added to the targets from config."""
+    inventory_targets = [
+        _ConfigTarget("10.0.0.1:8675", "host-1", "customer", "site", "model-1"),
+        _ConfigTarget("10.0.0.2:8675", "host-2", "customer", "site", "infra.model-2"),
+    ]
+    collector_config.juju_controller.name = "infra"
+    config_targets = list(collector_config.targets)
+    collector_config.settings.targets_path = "/path/to/targets.d"
+    mocker.patch.object(cli.Config, "from_dict", return_value=collector_config)
+    load_targets_mock = mocker.patch.object(cli, "load_targets", return_value=inventory_targets)
+
+    with patch("builtins.open", mock_open(read_data="option: value")):
+        config = cli.parse_config("/path/to/config")
+
+    load_targets_mock.assert_called_once_with("/path/to/targets.d")
+    assert config.targets == config_targets + inventory_targets
+    # models of inventory targets are labelled like models of the controller
+    assert [target.model for target in inventory_targets] == ["infra.model-1", "infra.model-2"]
+
+
 @pytest.mark.parametrize(
     "exception, expected_msg",
     [
@@ -63,6 +111,9 @@ def test_cli_main_success(dry_run, mocker):
     conf_path = "/path/to/conf"
     cli_args = MagicMock()
     cli_args.config = conf_path
+    cli_args.profile = ""
+    cli_args.check_targets = False
+    cli_args.trace_malloc = 0
     cli_args.dry_run = dry_run
 
     controller_disconnect = AsyncMock()
@@ -70,12 +121,18 @@ def test_cli_main_success(dry_run, mocker):
     controller.disconnect.side_effect = controller_disconnect
 
     config = MagicMock()
+    config.settings.history_path = ""
+    config.settings.intervals = _ConfigIntervals()
+    config.settings.run_deadline = 0
 
     parse_cli_mock = mocker.patch.object(cli, "parse_cli", return_value=cli_args)
     parse_config_mock = mocker.patch.object(cli, "parse_config", return_value=config)
-    get_controller_mock = mocker.patch.object(cli, "get_controller", return_value=controller)
+    get_controller_mock = mocker.patch.object(
+        cli, "get_controllers", return_value={"": controller}
+    )
     get_exporter_data_mock = mocker.patch.object(cli, "fetch_exporter_data")
     get_juju_data_mock = mocker.patch.object(cli, "fetch_juju_data")
+    finalize_archives_mock = mocker.patch.object(cli, "finalize_archives")
 
     with pytest.raises(SystemExit) as exc:
         cli.main()
@@ -84,11 +141,13 @@ def test_cli_main_success(dry_run, mocker):
     parse_config_mock.assert_called_once_with(conf_path)
     get_controller_mock.assert_called_once_with(config)
     if not dry_run:
-        get_exporter_data_mock.assert_called_once_with(config)
-        get_juju_data_mock.assert_called_once_with(config, controller)
+        get_exporter_data_mock.assert_called_once_with(config, ANY, None, None)
+        get_juju_data_mock.assert_called_once_with(config, {"": controller}, ANY, None)
+        finalize_archives_mock.assert_called_once_with(config)
     else:
         get_exporter_data_mock.assert_not_called()
         get_juju_data_mock.assert_not_called()
+        finalize_archives_mock.assert_not_called()
 
     controller_disconnect.assert_called_once()
 
@@ -100,10 +159,13 @@ def test_cli_main_config_error(mocker):
     conf_path = "/path/to/conf"
     cli_args = MagicMock()
     cli_args.config = conf_path
+    cli_args.profile = ""
+    cli_args.check_targets = False
+    cli_args.trace_malloc = 0
 
     mocker.patch.object(cli, "parse_cli", return_value=cli_args)
     parse_config_mock = mocker.patch.object(cli, "parse_config", side_effect=cli.ConfigError)
-    get_controller_mock = mocker.patch.object(cli, "get_controller")
+    get_controller_mock = mocker.patch.object(cli, "get_controllers")
     get_exporter_data_mock = mocker.patch.object(cli, "fetch_exporter_data")
     get_juju_data_mock = mocker.patch.object(cli, "fetch_juju_data")
 
@@ -122,11 +184,17 @@ def test_cli_main_juju_error(mocker):
     conf_path = "/path/to/conf"
     cli_args = MagicMock()
     cli_args.config = conf_path
+    cli_args.profile = ""
+    cli_args.check_targets = False
+    cli_args.trace_malloc = 0
     config = MagicMock()
+    config.settings.history_path = ""
+    config.settings.intervals = _ConfigIntervals()
+    config.settings.run_deadline = 0
 
     mocker.patch.object(cli, "parse_cli", return_value=cli_args)
     parse_config_mock = mocker.patch.object(cli, "parse_config", return_value=config)
-    get_controller_mock = mocker.patch.object(cli, "get_controller", side_effect=cli.JujuError)
+    get_controller_mock = mocker.patch.object(cli, "get_controllers", side_effect=cli.JujuError)
     get_exporter_data_mock = mocker.patch.object(cli, "fetch_exporter_data")
     get_juju_data_mock = mocker.patch.object(cli, "fetch_juju_data")
 
@@ -145,6 +213,9 @@ def test_cli_main_collection_error(mocker):
     conf_path = "/path/to/conf"
     cli_args = MagicMock()
     cli_args.config = conf_path
+    cli_args.profile = ""
+    cli_args.check_targets = False
+    cli_args.trace_malloc = 0
     cli_args.dry_run = False
 
     controller_disconnect = AsyncMock()
@@ -152,10 +223,15 @@ def test_cli_main_collection_error(mocker):
     controller.disconnect.side_effect = controller_disconnect
 
     config = MagicMock()
+    config.settings.history_path = ""
+    config.settings.intervals = _ConfigIntervals()
+    config.settings.run_deadline = 0
 
     parse_cli_mock = mocker.patch.object(cli, "parse_cli", return_value=cli_args)
     parse_config_mock = mocker.patch.object(cli, "parse_config", return_value=config)
-    get_controller_mock = mocker.patch.object(cli, "get_controller", return_value=controller)
+    get_controller_mock = mocker.patch.object(
+        cli, "get_controllers", return_value={"": controller}
+    )
     get_exporter_data_mock = mocker.patch.object(cli, "fetch_exporter_data", side_effect=Exception)
     get_juju_data_mock = mocker.patch.object(cli, "fetch_juju_data")
 
@@ -165,9 +241,157 @@ def test_cli_main_collection_error(mocker):
     parse_cli_mock.assert_called_once()
     parse_config_mock.assert_called_once_with(conf_path)
     get_controller_mock.assert_called_once_with(config)
-    get_exporter_data_mock.assert_called_once_with(config)
+    get_exporter_data_mock.assert_called_once_with(config, ANY, None, None)
     get_juju_data_mock.assert_not_called()
 
     controller_disconnect.assert_called_once()
 
     assert exc.value.code == 1
+
+
+def test_cli_main_profiling(collector_config, mocker, tmp_path, capsys):
+    """Test that the run is profiled if it's requested by CLI arguments."""
+    cli_args = MagicMock()
+    cli_args.dry_run = False
+    cli_args.profile = str(tmp_path / "run.pstats")
+    cli_args.check_targets = False
+    cli_args.trace_malloc = 2
+    controller = MagicMock()
+    controller.disconnect.side_effect = AsyncMock()
+    mocker.patch.object(cli, "parse_cli", return_value=cli_args)
+    mocker.patch.object(cli, "parse_config", return_value=collector_config)
+    mocker.patch.object(cli, "get_controllers", return_value={"": controller})
+    mocker.patch.object(cli, "fetch_exporter_data")
+    mocker.patch.object(cli, "fetch_juju_data")
+    mocker.patch.object(cli, "finalize_archives")
+
+    with pytest.raises(SystemExit) as exc:
+        cli.main()
+
+    output = capsys.readouterr().out
+    assert exc.value.code == 0
+    assert (tmp_path / "run.pstats").exists()
+    for phase in ["config", "controller", "exporters", "juju", "archives"]:
+        assert f"Memory after phase {phase}" in output
+        assert f"phase {phase}: " in output
+
+
+def test_cli_main_schedule(collector_config, mocker, tmp_path, capsys):
+    """Test that run history is saved and targets skipped due to deadline are reported."""
+    collector_config.settings.history_path = str(tmp_path / "history.json")
+    collector_config.settings.run_deadline = 60
+    cli_args = MagicMock()
+    cli_args.dry_run = False
+    cli_args.profile = ""
+    cli_args.check_targets = False
+    cli_args.trace_malloc = 0
+    controller = MagicMock()
+    controller.disconnect.side_effect = AsyncMock()
+
+    def fetch_exporter_data(config, schedule, limiter, sink):
+        assert limiter is None
+        assert schedule.deadline == 60
+        schedule.skipped.append("target 10.0.0.1:8675")
+        with schedule.timed(TARGETS, "10.0.0.2:8675"):
+            pass
+
+    mocker.patch.object(cli, "parse_cli", return_value=cli_args)
+    mocker.patch.object(cli, "parse_config", return_value=collector_config)
+    mocker.patch.object(cli, "get_controllers", return_value={"": controller})
+    mocker.patch.object(cli, "fetch_exporter_data", side_effect=fetch_exporter_data)
+    mocker.patch.object(cli, "fetch_juju_data")
+    mocker.patch.object(cli, "finalize_archives")
+
+    with pytest.raises(SystemExit) as exc:
+        cli.main()
+
+    assert exc.value.code == 0
+    assert "Skipped due to run deadline: target 10.0.0.1:8675" in capsys.readouterr().out
+    history = cli.RunSchedule(collector_config.settings.history_path)
+    assert history.estimate(TARGETS, "10.0.0.2:8675") is not None
+
+
+@pytest.mark.parametrize(
+    "failures, exit_code", [({}, 0), ({"host (10.0.0.1:8675)": "timed out"}, 1)]
+)
+def test_cli_main_check_targets(failures, exit_code, collector_config, mocker, capsys):
+    """Test that exporters are probed without connecting to the controller."""
+    cli_args = MagicMock()
+    cli_args.check_targets = True
+    cli_args.profile = ""
+    cli_args.trace_malloc = 0
+    report = HealthReport(latencies={"host (10.0.0.2:8675)": 0.02}, failures=failures)
+    mocker.patch.object(cli, "parse_cli", return_value=cli_args)
+    mocker.patch.object(cli, "parse_config", return_value=collector_config)
+    check_mock = mocker.patch.object(cli, "check_targets", return_value=report)
+    get_controller_mock = mocker.patch.object(cli, "get_controllers")
+    get_exporter_data_mock = mocker.patch.object(cli, "fetch_exporter_data")
+
+    with pytest.raises(SystemExit) as exc:
+        cli.main()
+
+    assert exc.value.code == exit_code
+    check_mock.assert_called_once_with(collector_config.targets)
+    get_controller_mock.assert_not_called()
+    get_exporter_data_mock.assert_not_called()
+    assert capsys.readouterr().out == report.format() + "\n"
+
+
+def test_cli_main_adaptive_concurrency(collector_config, mocker, capsys):
+    """Test that limits of adaptive concurrency are reported at the end of the run."""
+    collector_config.settings.concurrency = "adaptive"
+    collector_config.settings.max_workers = 8
+    cli_args = MagicMock()
+    cli_args.dry_run = False
+    cli_args.profile = ""
+    cli_args.check_targets = False
+    cli_args.trace_malloc = 0
+    controller = MagicMock()
+    controller.disconnect.side_effect = AsyncMock()
+
+    def fetch_exporter_data(config, schedule, limiter, sink):
+        limiter.observe(started=0, latency=0.01)
+
+    mocker.patch.object(cli, "parse_cli", return_value=cli_args)
+    mocker.patch.object(cli, "parse_config", return_value=collector_config)
+    mocker.patch.object(cli, "get_controllers", return_value={"": controller})
+    mocker.patch.object(cli, "fetch_exporter_data", side_effect=fetch_exporter_data)
+    mocker.patch.object(cli, "fetch_juju_data")
+    mocker.patch.object(cli, "finalize_archives")
+
+    with pytest.raises(SystemExit) as exc:
+        cli.main()
+
+    assert exc.value.code == 0
+    assert "Exporter concurrency: limit 2 (lowest 1, highest 2, 0 backoffs)" in (
+        capsys.readouterr().out
+    )
+
+
+def test_cli_main_streaming_output(collector_config, mocker):
+    """Test that streamed data are passed to the sink and archives are not finalized."""
+    cli_args = MagicMock()
+    cli_args.dry_run = False
+    cli_args.profile = ""
+    cli_args.check_targets = False
+    cli_args.trace_malloc = 0
+    controller = MagicMock()
+    controller.disconnect.side_effect = AsyncMock()
+    sink = MagicMock()
+
+    mocker.patch.object(cli, "parse_cli", return_value=cli_args)
+    mocker.patch.object(cli, "parse_config", return_value=collector_config)
+    mocker.patch.object(cli, "get_controllers", return_value={"": controller})
+    mocker.patch.object(cli, "new_sink", return_value=sink)
+    fetch_exporter_data = mocker.patch.object(cli, "fetch_exporter_data")
+    fetch_juju_data = mocker.patch.object(cli, "fetch_juju_data")
+    finalize_archives = mocker.patch.object(cli, "finalize_archives")
+
+    with pytest.raises(SystemExit) as exc:
+        cli.main()
+
+    assert exc.value.code == 0
+    fetch_exporter_data.assert_called_once_with(collector_config, ANY, None, sink)
+    fetch_juju_data.assert_called_once_with(collector_config, {"": controller}, ANY, sink)
+    sink.__exit__.assert_called_once_with(None, None, None)
+    finalize_archives.assert_not_called()
@@ -1,35 +1,54 @@
 """Tests for software_inventory_collector.collector module."""
+import asyncio
+import datetime
+import gzip
+import json
 import os.path
+import tarfile
+import threading
 from collections import defaultdict
-from tempfile import NamedTemporaryFile
-from unittest.mock import AsyncMock, MagicMock, call, patch
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from unittest.mock import ANY, AsyncMock, MagicMock, call
 
 import pytest
+import zstandard
+from juju.errors import JujuConnectionError
 
 from software_inventory_collector import collector
+from software_inventory_collector.config import _ConfigJujuController
+from software_inventory_collector.pipeline import SPOOL_SIZE, MemoryBudget
+from software_inventory_collector.reader import IndexedArchive
+from software_inventory_collector.sink import TarStreamSink
 
 
-def test_add_file_to_tar(mocker):
-    """Test function that writes content to temp file and adds it to tar."""
+def test_add_file_to_tar(tmp_path):
+    """Test function that adds content of a file object to tar."""
     file_name = "collected_data_file"
-    file_content = "collected data"
-    tar_file_path = "/path/to/tarball"
+    file_content = b"collected data"
+    tar_file_path = str(tmp_path / "output.tar")
 
-    opened_tar = MagicMock()
-    tar_object_mock = MagicMock()
-    tar_object_mock.__enter__.return_value = opened_tar
+    collector._add_file_to_tar(file_name, BytesIO(file_content), tar_file_path)
+    collector._add_file_to_tar("other_file", BytesIO(b"other data"), tar_file_path)
 
-    temp_file = NamedTemporaryFile()
-    temp_file_write_mock = mocker.patch.object(temp_file, "write")
+    with tarfile.open(tar_file_path) as tar_file:
+        assert tar_file.getnames() == [file_name, "other_file"]
+        member = tar_file.getmember(file_name)
+        assert member.size == len(file_content)
+        assert member.mode == 0o600
+        assert tar_file.extractfile(member).read() == file_content
 
-    mocker.patch.object(collector, "NamedTemporaryFile", return_value=temp_file)
 
-    with patch.object(collector.tarfile, "open", return_value=tar_object_mock) as tar_file_mock:
-        collector._add_file_to_tar(file_name, file_content, tar_file_path)
+def _stored_payloads(mocker):
+    """Patch `_add_file_to_tar` and return list that collects its calls with read content."""
+    stored = []
 
-    temp_file_write_mock.assert_called_once_with(file_content.encode("UTF-8"))
-    tar_file_mock.assert_called_once_with(tar_file_path, "a", encoding="UTF-8")
-    opened_tar.add.assert_called_once_with(temp_file.name, arcname=file_name)
+    def store(file_name, content, tar_path):
+        stored.append(call(file_name, content.read(), tar_path))
+
+    mocker.patch.object(collector, "_add_file_to_tar", side_effect=store)
+    return stored
 
 
 def test_fetch_exporter_data_success(collector_config, mocker):
@@ -44,19 +63,43 @@ def test_fetch_exporter_data_success(collector_config, mocker):
         for endpoint in collector.ENDPOINTS:
             url = f"http://{target.endpoint}/{endpoint}"
             file_path = f"{endpoint}_@_{target.hostname}_@_{ts}"
+            data = f"{target.endpoint}/{endpoint} response".encode()
             response = MagicMock()
-            response.text = f"{target.endpoint}/{endpoint} response"
+            response.__enter__.return_value = response
+            response.iter_content.return_value = [data[:5], data[5:]]
             expected_responses.append(response)
-            expected_requests.append(call(url, timeout=60))
-            expected_tar_calls.append(call(file_path, response.text, tar_path))
+            expected_requests.append(call(url, headers={}, timeout=60, stream=True))
+            expected_tar_calls.append(call(file_path, data, tar_path))
 
     get_mock = mocker.patch.object(collector.requests, "get", side_effect=expected_responses)
-    add_tar_mock = mocker.patch.object(collector, "_add_file_to_tar")
+    stored = _stored_payloads(mocker)
 
     collector.fetch_exporter_data(collector_config)
 
     get_mock.assert_has_calls(expected_requests)
-    add_tar_mock.assert_has_calls(expected_tar_calls)
+    assert stored == expected_tar_calls
+
+
+def test_fetch_exporter_data_sink(collector_config, mocker):
+    """Test that data are streamed into the sink instead of tarballs."""
+    add_tar_mock = mocker.patch.object(collector, "_add_file_to_tar")
+    response = MagicMock()
+    response.__enter__.return_value = response
+    response.iter_content.side_effect = lambda _: [b"exporter data"]
+    mocker.patch.object(collector.requests, "get", return_value=response)
+    stream = BytesIO()
+
+    with TarStreamSink(stream) as sink:
+        collector.fetch_exporter_data(collector_config, sink=sink)
+
+    add_tar_mock.assert_not_called()
+    stream.seek(0)
+    with tarfile.open(fileobj=stream) as tar_file:
+        names = tar_file.getnames()
+    target = collector_config.targets[0]
+    tarball = f"{target.customer}_@_{target.site}_@_{target.model}_@_{collector.TIMESTAMP}"
+    assert len(names) == len(collector_config.targets) * len(collector.ENDPOINTS)
+    assert f"{tarball}/dpkg_@_{target.hostname}_@_{collector.TIMESTAMP}" in names
 
 
 def test_fetch_exporter_data_error(collector_config, mocker):
@@ -72,6 +115,270 @@ def test_fetch_exporter_data_error(collector_config, mocker):
     add_tar_mock.assert_not_called()
 
 
+def _fake_fetch_pipelined(responses):
+    """Return stand-in of async_http.fetch_pipelined serving `responses` by endpoint."""
+
+    async def fetch_pipelined(endpoint, paths, timeout, accept_encoding):
+        for path in paths:
+            data = responses[endpoint][path]
+            if isinstance(data, Exception):
+                raise data
+
+            async def body(data=data):
+                yield data[:5]
+                yield data[5:]
+
+            yield path, "", body()
+
+    return fetch_pipelined
+
+
+def test_fetch_exporter_data_asyncio(collector_config, mocker):
+    """Test gathering data from exporters with asyncio HTTP engine."""
+    collector_config.settings.http_engine = "asyncio"
+    responses = {}
+    expected_tar_calls = []
+    ts = collector.TIMESTAMP
+    output_dir = collector_config.settings.collection_path
+    for target in collector_config.targets:
+        tar_path = f"{output_dir}/{target.customer}_@_{target.site}_@_{target.model}_@_{ts}.tar"
+        for endpoint in collector.ENDPOINTS:
+            data = f"{target.endpoint}/{endpoint} response".encode()
+            responses.setdefault(target.endpoint, {})[f"/{endpoint}"] = data
+            expected_tar_calls.append(
+                call(f"{endpoint}_@_{target.hostname}_@_{ts}", data, tar_path)
+            )
+
+    mocker.patch.object(collector, "fetch_pipelined", _fake_fetch_pipelined(responses))
+    get_mock = mocker.patch.object(collector.requests, "get")
+    stored = _stored_payloads(mocker)
+
+    collector.fetch_exporter_data(collector_config)
+
+    get_mock.assert_not_called()
+    assert sorted(stored) == sorted(expected_tar_calls)
+
+
+@pytest.mark.parametrize(
+    "exception", [collector.HTTPClientError("Unexpected status 500"), ConnectionRefusedError()]
+)
+def test_fetch_exporter_data_asyncio_error(exception, collector_config, mocker):
+    """Test handling of error during collection with asyncio HTTP engine."""
+    collector_config.settings.http_engine = "asyncio"
+    responses = {
+        target.endpoint: {f"/{endpoint}": exception for endpoint in collector.ENDPOINTS}
+        for target in collector_config.targets
+    }
+    mocker.patch.object(collector, "fetch_pipelined", _fake_fetch_pipelined(responses))
+    add_tar_mock = mocker.patch.object(collector, "_add_file_to_tar")
+
+    with pytest.raises(collector.CollectionError):
+        collector.fetch_exporter_data(collector_config)
+
+    add_tar_mock.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_fetch_target_async_body_error(collector_config, mocker):
+    """Test that reserved memory is released if reading of response body fails."""
+    target = collector_config.targets[0]
+
+    async def broken_body():
+        yield b"partial"
+        raise asyncio.TimeoutError
+
+    async def fetch_pipelined(endpoint, paths, timeout, accept_encoding):
+        yield paths[0], "", broken_body()
+
+    mocker.patch.object(collector, "fetch_pipelined", fetch_pipelined)
+    pipeline = collector._new_pipeline(collector_config)
+
+    with pipeline, pytest.raises(collector.CollectionError):
+        await collector._fetch_target_async(target, "/output", pipeline)
+
+    assert pipeline.budget.used == 0
+
+
+@pytest.mark.parametrize("http_engine", ["sync", "asyncio"])
+def test_fetch_exporter_data_index(http_engine, collector_config, mocker, tmp_path):
+    """Test that collected exporter data are added to the package index."""
+    collector_config.settings.http_engine = http_engine
+    collector_config.settings.index_path = str(tmp_path / "index.db")
+    data = {
+        "/dpkg": b'[{"package": "openssl:amd64", "version": "3.0.2"}]',
+        "/snap": b'[{"name": "lxd", "version": "5.0.2"}]',
+        "/kernel": b'{"kernel": "5.15.0-76-generic"}',
+    }
+    responses = []
+    for _ in collector_config.targets:
+        for endpoint in collector.ENDPOINTS:
+            response = MagicMock()
+            response.__enter__.return_value = response
+            response.iter_content.return_value = [data[f"/{endpoint}"]]
+            responses.append(response)
+    mocker.patch.object(collector.requests, "get", side_effect=responses)
+    mocker.patch.object(
+        collector,
+        "fetch_pipelined",
+        _fake_fetch_pipelined({target.endpoint: data for target in collector_config.targets}),
+    )
+    _stored_payloads(mocker)
+
+    collector.fetch_exporter_data(collector_config)
+
+    with collector.PackageIndex(collector_config.settings.index_path, "") as index:
+        assert sorted(index.find_package("openssl")) == [
+            (collector.TIMESTAMP, target.model, target.hostname, "dpkg", "3.0.2")
+            for target in collector_config.targets
+        ]
+        assert len(index.find_package("lxd", "5.0.2")) == len(collector_config.targets)
+
+
+class _CompressingExporter(BaseHTTPRequestHandler):
+    """Exporter that compresses responses in the first encoding accepted by the request."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):  # noqa: N802
+        """Respond with the data of the endpoint."""
+        data = _exporter_data(self.path)
+        accepted = self.headers.get("Accept-Encoding", "")
+        encoding = "zstd" if accepted.startswith("zstd") else "gzip"
+        if encoding == "zstd":
+            # streamed frame, without content size in its header
+            body = BytesIO()
+            with zstandard.ZstdCompressor().stream_writer(body, closefd=False) as writer:
+                writer.write(data)
+            data = body.getvalue()
+        else:
+            data = gzip.compress(data)
+        self.send_response(200)
+        self.send_header("Content-Encoding", encoding)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *_):
+        """Don't log requests."""
+
+
+def _exporter_data(path):
+    """Return data of exporter endpoint."""
+    return f"{path} response\n".encode() * 100
+
+
+class _ExporterServer(ThreadingHTTPServer):
+    """Server that accepts connections of many concurrently queried exporters."""
+
+    request_queue_size = 256
+    daemon_threads = True
+
+
+@pytest.fixture()
+def compressing_exporter():
+    """Return endpoint of local exporter running in a thread."""
+    server = _ExporterServer(("127.0.0.1", 0), _CompressingExporter)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize("http_engine", ["sync", "asyncio"])
+@pytest.mark.parametrize("transfer_encoding", ["gzip", "zstd"])
+def test_fetch_exporter_data_transfer_encoding(
+    http_engine, transfer_encoding, compressing_exporter, collector_config, mocker
+):
+    """Test that responses in the encoding of the archive are stored as received."""
+    collector_config.settings.http_engine = http_engine
+    collector_config.settings.transfer_encoding = transfer_encoding
+    collector_config.settings.compression = "zstd-dict"
+    collector_config.targets = [
+        collector._ConfigTarget(compressing_exporter, "host-1", "customer", "site", "model")
+    ]
+    stored = _stored_payloads(mocker)
+
+    collector.fetch_exporter_data(collector_config)
+
+    assert len(stored) == len(collector.ENDPOINTS)
+    for endpoint, (file_name, content, _) in zip(collector.ENDPOINTS, [c.args for c in stored]):
+        expected_name = f"{endpoint}_@_host-1_@_{collector.TIMESTAMP}"
+        if transfer_encoding == "zstd":
+            assert file_name == f"{expected_name}.zst"
+            content = zstandard.ZstdDecompressor().decompressobj().decompress(content)
+        else:
+            assert file_name == expected_name
+        assert content == _exporter_data(f"/{endpoint}")
+
+
+def test_fetch_exporter_data_asyncio_budget_exhausted(
+    compressing_exporter, collector_config, mocker
+):
+    """Test that asyncio engine finishes when waiting exporters exceed the executor threads.
+
+    Only two payloads fit into the memory budget, and more exporters wait for it than
+    there are threads in the default executor, which queues the payloads to the writer.
+    """
+    collector_config.settings.http_engine = "asyncio"
+    collector_config.settings.workers = 40
+    collector_config.settings.memory_budget = 2 * SPOOL_SIZE
+    collector_config.targets = [
+        collector._ConfigTarget(compressing_exporter, f"host-{index}", "customer", "site", "m")
+        for index in range(collector_config.settings.workers)
+    ]
+    stored = _stored_payloads(mocker)
+    collection = threading.Thread(
+        target=collector.fetch_exporter_data, args=(collector_config,), daemon=True
+    )
+
+    collection.start()
+    collection.join(timeout=60)
+
+    assert not collection.is_alive()
+    assert len(stored) == len(collector_config.targets) * len(collector.ENDPOINTS)
+
+
+@pytest.mark.parametrize("http_engine", ["sync", "asyncio"])
+def test_fetch_exporter_data_deadline(http_engine, collector_config, mocker):
+    """Test that targets which can't finish before the deadline are skipped."""
+    collector_config.settings.http_engine = http_engine
+    slow, fast = collector_config.targets
+    schedule = collector.RunSchedule(deadline=60)
+    schedule._history[collector.TARGETS][slow.endpoint] = 120
+    fetch_mock = mocker.patch.object(collector, "_fetch_target")
+    fetch_async_mock = mocker.patch.object(collector, "_fetch_target_async")
+
+    collector.fetch_exporter_data(collector_config, schedule)
+
+    fetch_target = fetch_mock if http_engine == "sync" else fetch_async_mock
+    fetch_target.assert_called_once_with(
+        fast, ANY, ANY, None, collector.ENDPOINTS, collector.EncodingPolicy()
+    )
+    assert schedule.skipped == [f"target {slow.endpoint}"]
+    assert schedule.estimate(collector.TARGETS, fast.endpoint) is not None
+
+
+@pytest.mark.parametrize(
+    "workers, concurrency, expected_order",
+    [(1, "fixed", [0, 1, 2]), (2, "fixed", [2, 1, 0]), (1, "adaptive", [2, 1, 0])],
+)
+def test_scheduled_targets(workers, concurrency, expected_order, collector_config):
+    """Test that the longest targets go first if they are collected concurrently."""
+    collector_config.settings.workers = workers
+    collector_config.settings.concurrency = concurrency
+    collector_config.targets.append(
+        collector._ConfigTarget("10.10.10.3:8765", "exporter-host-3", "c", "s", "model 3")
+    )
+    schedule = collector.RunSchedule()
+    for duration, target in enumerate(collector_config.targets):
+        schedule._history[collector.TARGETS][target.endpoint] = duration
+
+    ordered = collector._scheduled_targets(collector_config, schedule)
+
+    assert ordered == [collector_config.targets[index] for index in expected_order]
+
+
 @pytest.mark.asyncio
 async def test_get_controller(collector_config, mocker):
     """Test getting and connecting to the controller."""
@@ -92,6 +399,52 @@ async def test_get_controller(collector_config, mocker):
     )
 
 
+@pytest.mark.asyncio
+async def test_get_controllers(collector_config, mocker):
+    """Test that all configured controllers are connected."""
+    infra = collector_config.juju_controller
+    infra.name = "infra"
+    workloads = _ConfigJujuController("10.0.0.2:17070", "cert", "admin", "admin", "workloads")
+    collector_config.juju_controllers = [workloads]
+    controllers = [MagicMock(spec=collector.Controller), MagicMock(spec=collector.Controller)]
+    get_controller = mocker.patch.object(collector, "get_controller", side_effect=controllers)
+
+    connected = await collector.get_controllers(collector_config)
+
+    assert connected == {"infra": controllers[0], "workloads": controllers[1]}
+    get_controller.assert_has_calls(
+        [call(collector_config, infra), call(collector_config, workloads)]
+    )
+
+
+@pytest.mark.asyncio
+async def test_get_controllers_error(collector_config, mocker):
+    """Test that established connections are closed if any controller fails to connect."""
+    collector_config.juju_controller.name = "infra"
+    collector_config.juju_controllers = [
+        _ConfigJujuController("10.0.0.2:17070", "cert", "admin", "admin", "workloads")
+    ]
+    controller = MagicMock(spec=collector.Controller)
+    controller.disconnect.side_effect = AsyncMock()
+    mocker.patch.object(
+        collector, "get_controller", side_effect=[controller, ConnectionError("refused")]
+    )
+
+    with pytest.raises(ConnectionError, match="refused"):
+        await collector.get_controllers(collector_config)
+
+    controller.disconnect.assert_called_once()
+
+
+def _juju_pipeline(reserved=100):
+    """Return pipeline mock that reserves `reserved` bytes for each Juju artifact."""
+    pipeline = MagicMock(spec=collector.ArchivePipeline)
+    pipeline.budget = MagicMock(spec=MemoryBudget)
+    pipeline.reserve_async.return_value = reserved
+    pipeline.submit_data_async.return_value = 0
+    return pipeline
+
+
 @pytest.mark.parametrize(
     "exported_bundle",
     [
@@ -100,33 +453,41 @@ async def test_get_controller(collector_config, mocker):
     ],
 )
 @pytest.mark.asyncio
-async def test_save_bundle_data(exported_bundle, mocker):
+async def test_save_bundle_data(exported_bundle):
     """Test function that saves exported juju bundles.
 
     This tests has two scenarios:
       * Export of a regular model bundle
       * Export of a bundle with Cross Model Relations. CMR data is expected to be skipped
     """
-    expected_saved_bundle = '{"bundle": "bundle_data"}'
-    add_to_tar_mock = mocker.patch.object(collector, "_add_file_to_tar")
+    expected_saved_bundle = b'{"bundle": "bundle_data"}'
+    pipeline = _juju_pipeline()
     bundle_name = "juju_bundle.json"
     tar_file = "/path/to.tar"
     model_mock = MagicMock()
     model_mock.export_bundle.side_effect = AsyncMock(return_value=exported_bundle)
 
-    await collector._save_bundle_data(model_mock, bundle_name, tar_file)
+    size = await collector._save_bundle_data(
+        model_mock, bundle_name, tar_file, pipeline, reserve=2048
+    )
 
     model_mock.export_bundle.assert_called_once()
-    add_to_tar_mock.assert_called_once_with(bundle_name, expected_saved_bundle, tar_file)
+    pipeline.reserve_async.assert_called_once_with(2048)
+    pipeline.submit_data_async.assert_called_once_with(
+        tar_file, bundle_name, expected_saved_bundle, 100
+    )
+    # the rest of the reservation is returned by the pipeline
+    pipeline.budget.release.assert_called_once_with(0)
+    assert size == len(expected_saved_bundle)
 
 
 @pytest.mark.asyncio
-async def test_save_bundle_data_empty_model(mocker):
+async def test_save_bundle_data_empty_model():
     """Test that _save_bundle_data function handles errors when exporting empty model."""
-    add_to_tar_mock = mocker.patch.object(collector, "_add_file_to_tar")
+    pipeline = _juju_pipeline()
     bundle_name = "empty_bundle.json"
     tar_path = "/path/to.tar"
-    expected_bundle_data = "{}"
+    expected_bundle_data = b"{}"
 
     juju_err = defaultdict(str)
     juju_err["error"] = "nothing to export as there are no applications"
@@ -135,16 +496,18 @@ async def test_save_bundle_data_empty_model(mocker):
     model_mock = MagicMock()
     model_mock.export_bundle.side_effect = AsyncMock(side_effect=empty_model_err)
 
-    await collector._save_bundle_data(model_mock, bundle_name, tar_path)
+    await collector._save_bundle_data(model_mock, bundle_name, tar_path, pipeline)
 
     model_mock.export_bundle.assert_called_once()
-    add_to_tar_mock.assert_called_once_with(bundle_name, expected_bundle_data, tar_path)
+    pipeline.submit_data_async.assert_called_once_with(
+        tar_path, bundle_name, expected_bundle_data, 100
+    )
 
 
 @pytest.mark.asyncio
-async def test_save_bundle_data_err(mocker):
+async def test_save_bundle_data_err():
     """Test that _save_bundle_data function re-raises general JujuErrors."""
-    add_to_tar_mock = mocker.patch.object(collector, "_add_file_to_tar")
+    pipeline = _juju_pipeline()
 
     juju_err = defaultdict(str)
     juju_err["error"] = "Something bad happened"
@@ -154,14 +517,15 @@ async def test_save_bundle_data_err(mocker):
     model_mock.export_bundle.side_effect = AsyncMock(side_effect=empty_model_err)
 
     with pytest.raises(collector.JujuAPIError):
-        await collector._save_bundle_data(model_mock, "bundle_name", "tar_path")
+        await collector._save_bundle_data(model_mock, "bundle_name", "tar_path", pipeline)
 
-    add_to_tar_mock.assert_not_called()
+    pipeline.submit_data_async.assert_not_called()
+    pipeline.budget.release.assert_called_once_with(100)
 
 
 @pytest.mark.asyncio
-async def test_save_status_data(mocker):
-    add_to_tar_mock = mocker.patch.object(collector, "_add_file_to_tar")
+async def test_save_status_data():
+    pipeline = _juju_pipeline()
     status_name = "model_status.json"
     tar_path = "/path/to.tar"
     status_data = "{'status': 'data'}"
@@ -172,9 +536,41 @@ async def test_save_status_data(mocker):
     model_mock = MagicMock()
     model_mock.get_status.side_effect = AsyncMock(return_value=status_mock)
 
-    await collector._save_status_data(model_mock, status_name, tar_path)
+    saved = await collector._save_status_data(model_mock, status_name, tar_path, pipeline)
 
-    add_to_tar_mock.assert_called_once_with(status_name, status_data, tar_path)
+    assert saved == status_data.encode()
+    pipeline.submit_data_async.assert_called_once_with(
+        tar_path, status_name, status_data.encode(), 100
+    )
+    pipeline.budget.release.assert_called_once_with(0)
+
+
+@pytest.mark.asyncio
+async def test_save_status_data_err():
+    """Test that memory reserved for the status is released if the query fails."""
+    pipeline = _juju_pipeline()
+    model_mock = MagicMock()
+    model_mock.get_status.side_effect = AsyncMock(side_effect=ConnectionError)
+
+    with pytest.raises(ConnectionError):
+        await collector._save_status_data(model_mock, "status", "/path/to.tar", pipeline)
+
+    pipeline.submit_data_async.assert_not_called()
+    pipeline.budget.release.assert_called_once_with(100)
+
+
+def test_juju_collection_reservation(collector_config):
+    """Test that artifacts reserve their size from history, or the whole budget."""
+    pipeline = _juju_pipeline()
+    pipeline.budget.limit = 4096
+    schedule = collector.RunSchedule()
+    schedule.record_size("model_1", "status", 100)
+    collection = collector._JujuCollection(
+        collector_config, pipeline, MagicMock(), schedule=schedule
+    )
+
+    assert collection.reservation("model_1", "status") == 100 * collector.JUJU_COPIES
+    assert collection.reservation("model_1", "bundle") == 4096
 
 
 @pytest.mark.asyncio
@@ -192,8 +588,10 @@ async def test_fetch_juju_data(collector_config, mocker):
         model_mock.disconnect.side_effect = AsyncMock()
         models.append(model_mock)
 
-    save_status_mock = mocker.patch.object(collector, "_save_status_data")
-    save_bundle_mock = mocker.patch.object(collector, "_save_bundle_data")
+    save_status_mock = mocker.patch.object(collector, "_save_status_data", return_value=b"{}")
+    save_bundle_mock = mocker.patch.object(collector, "_save_bundle_data", return_value=2)
+    # sizes of artifacts are unknown, so each of them reserves the whole budget
+    budget = collector_config.settings.memory_budget
 
     controller = MagicMock()
     controller.model_uuids.side_effect = AsyncMock(return_value=model_uuids)
@@ -208,10 +606,10 @@ async def test_fetch_juju_data(collector_config, mocker):
         status_name = f"juju_status_@_{model_name}_@_{ts}"
         tar_path = tar_path_template.format(model=model_name)
 
-        expected_status_calls.append(call(model, status_name, tar_path))
-        expected_bundle_calls.append(call(model, bundle_name, tar_path))
+        expected_status_calls.append(call(model, status_name, tar_path, ANY, budget))
+        expected_bundle_calls.append(call(model, bundle_name, tar_path, ANY, None, budget))
 
-    await collector.fetch_juju_data(collector_config, controller)
+    await collector.fetch_juju_data(collector_config, {"": controller})
 
     save_status_mock.assert_has_calls(expected_status_calls)
     save_bundle_mock.assert_has_calls(expected_bundle_calls)
@@ -242,11 +640,532 @@ async def test_fetch_juju_data_error(collector_config, mocker):
     model = MagicMock()
     model.get_status.side_effect = AsyncMock(return_value=status_mock)
     model.export_bundle.side_effect = AsyncMock(side_effect=collector.JujuAPIError(juju_error))
+    model.disconnect.side_effect = AsyncMock()
 
     controller.get_model.side_effect = AsyncMock(return_value=model)
     controller.model_uuids.side_effect = AsyncMock(return_value={"Broken model": "model UUID"})
 
     with pytest.raises(collector.JujuAPIError) as exc:
-        await collector.fetch_juju_data(collector_config, controller)
+        await collector.fetch_juju_data(collector_config, {"": controller})
 
     assert str(exc.value) == juju_error["error"]
+    model.disconnect.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_save_bundle_data_process_pool():
+    """Test that bundle is parsed in process pool when it's enabled."""
+    pipeline = _juju_pipeline()
+    model_mock = MagicMock()
+    model_mock.export_bundle.side_effect = AsyncMock(return_value="bundle: bundle_data")
+
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        await collector._save_bundle_data(model_mock, "bundle", "/path/to.tar", pipeline, pool)
+
+    pipeline.submit_data_async.assert_called_once_with(
+        "/path/to.tar", "bundle", b'{"bundle": "bundle_data"}', 100
+    )
+
+
+@pytest.mark.asyncio
+async def test_fetch_juju_data_concurrent(collector_config, mocker):
+    """Test that models are collected concurrently up to configured number of workers."""
+    collector_config.settings.workers = 2
+    running = []
+    peak = []
+
+    async def save_status(*_):
+        running.append(1)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.pop()
+        return b"{}"
+
+    mocker.patch.object(collector, "_save_status_data", side_effect=save_status)
+    mocker.patch.object(collector, "_save_bundle_data")
+    model = MagicMock()
+    model.disconnect.side_effect = AsyncMock()
+    controller = MagicMock()
+    controller.model_uuids.side_effect = AsyncMock(return_value={f"m{i}": i for i in range(4)})
+    controller.get_model.side_effect = AsyncMock(return_value=model)
+    controller.disconnect.side_effect = AsyncMock()
+
+    await collector.fetch_juju_data(collector_config, {"": controller})
+
+    assert max(peak) == 2
+    assert model.disconnect.call_count == 4
+
+
+@pytest.mark.parametrize(
+    "controller_name, model_name, expected_label",
+    [("", "default", "default"), ("prod", "east-default", "prod.east-default")],
+)
+def test_model_label(controller_name, model_name, expected_label):
+    """Test that labels of models don't collide across controllers."""
+    assert collector.model_label(controller_name, model_name) == expected_label
+    assert collector.model_label("prod-east", "default") != expected_label
+
+
+@pytest.mark.asyncio
+async def test_fetch_juju_data_multiple_controllers(collector_config, mocker):
+    """Test that models with the same name on different controllers are kept distinct."""
+    collector_config.settings.workers = 2
+    save_status_mock = mocker.patch.object(collector, "_save_status_data")
+    mocker.patch.object(collector, "_save_bundle_data")
+    controllers = {}
+    for name in ["infra", "workloads"]:
+        model = MagicMock()
+        model.disconnect.side_effect = AsyncMock()
+        controllers[name] = MagicMock()
+        controllers[name].model_uuids.side_effect = AsyncMock(return_value={"default": name})
+        controllers[name].get_model.side_effect = AsyncMock(return_value=model)
+        controllers[name].disconnect.side_effect = AsyncMock()
+
+    await collector.fetch_juju_data(collector_config, controllers)
+
+    status_files = {args[1] for args, _ in save_status_mock.call_args_list}
+    assert status_files == {
+        f"juju_status_@_infra.default_@_{collector.TIMESTAMP}",
+        f"juju_status_@_workloads.default_@_{collector.TIMESTAMP}",
+    }
+    for controller in controllers.values():
+        controller.get_model.assert_called_once_with("default")
+        controller.disconnect.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_fetch_juju_data_model_cache(collector_config, mocker):
+    """Test that repeated collections reuse model connections of the cache."""
+    mocker.patch.object(collector, "_save_status_data")
+    mocker.patch.object(collector, "_save_bundle_data")
+    model = MagicMock()
+    model.disconnect.side_effect = AsyncMock()
+    controller = MagicMock()
+    controller.model_uuids.side_effect = AsyncMock(return_value={"model_1": "UUID 1"})
+    controller.get_model.side_effect = AsyncMock(return_value=model)
+    controller.disconnect.side_effect = AsyncMock()
+    models = collector.ModelCache()
+
+    for _ in range(2):
+        await collector.fetch_juju_data(collector_config, {"": controller}, models=models)
+
+    controller.get_model.assert_called_once_with("model_1")
+    model.disconnect.assert_not_called()
+    # controllers of the cached models are disconnected by the caller
+    controller.disconnect.assert_not_called()
+    await models.close()
+    model.disconnect.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_fetch_juju_data_model_cache_retry(collector_config, mocker):
+    """Test that artifacts not collected over a broken cached connection are retried."""
+    save_status_mock = mocker.patch.object(collector, "_save_status_data")
+    save_bundle_mock = mocker.patch.object(
+        collector, "_save_bundle_data", side_effect=[None, JujuConnectionError("closed"), None]
+    )
+    stale, fresh = MagicMock(), MagicMock()
+    for model in (stale, fresh):
+        model.disconnect.side_effect = AsyncMock()
+    controller = MagicMock()
+    controller.model_uuids.side_effect = AsyncMock(return_value={"model_1": "UUID 1"})
+    controller.get_model.side_effect = AsyncMock(side_effect=[stale, fresh])
+    models = collector.ModelCache()
+
+    for _ in range(2):
+        await collector.fetch_juju_data(collector_config, {"": controller}, models=models)
+
+    assert [args[0] for args, _ in save_status_mock.call_args_list] == [stale, stale]
+    assert [args[0] for args, _ in save_bundle_mock.call_args_list] == [stale, stale, fresh]
+    stale.disconnect.assert_called_once()
+    await models.close()
+
+
+@pytest.mark.parametrize("processes", [0, 2])
+def test_finalize_archives(processes, collector_config, tmp_path):
+    """Test compression of tarballs produced by current run."""
+    collector_config.settings.collection_path = str(tmp_path)
+    collector_config.settings.compression = "gz"
+    collector_config.settings.archive_processes = processes
+    current = tmp_path / f"customer_@_site_@_model_@_{collector.TIMESTAMP}.tar"
+    previous = tmp_path / "customer_@_site_@_model_@_19700101000000.tar"
+    current.write_bytes(b"current run")
+    previous.write_bytes(b"previous run")
+
+    collector.finalize_archives(collector_config)
+
+    assert not current.exists()
+    assert previous.exists()
+    with gzip.open(f"{current}.gz") as compressed:
+        assert compressed.read() == b"current run"
+
+
+def test_finalize_archives_deterministic(collector_config, tmp_path):
+    """Test that tarballs are normalized before they are compressed."""
+    collector_config.settings.collection_path = str(tmp_path)
+    collector_config.settings.compression = "gz"
+    collector_config.settings.deterministic = True
+    tar_path = tmp_path / f"customer_@_site_@_model_@_{collector.TIMESTAMP}.tar"
+    collector._add_file_to_tar(
+        f"dpkg_@_host_@_{collector.TIMESTAMP}", BytesIO(b"dpkg"), str(tar_path)
+    )
+
+    collector.finalize_archives(collector_config)
+
+    with tarfile.open(f"{tar_path}.gz") as tar_file:
+        assert tar_file.getnames() == ["manifest.json", "dpkg_@_host"]
+        assert tar_file.getmember("dpkg_@_host").mtime == 0
+
+
+def test_finalize_archives_deterministic_indexed(collector_config, tmp_path):
+    """Test that member names of deterministic indexed archives don't contain the run."""
+    collector_config.settings.collection_path = str(tmp_path)
+    collector_config.settings.deterministic = True
+    collector_config.settings.archive_format = "indexed"
+    tar_path = tmp_path / f"customer_@_site_@_model_@_{collector.TIMESTAMP}.tar"
+    collector._add_file_to_tar(
+        f"dpkg_@_host_@_{collector.TIMESTAMP}", BytesIO(b"dpkg"), str(tar_path)
+    )
+
+    collector.finalize_archives(collector_config)
+
+    with IndexedArchive(str(tmp_path / f"run_@_{collector.TIMESTAMP}.tar")) as indexed:
+        assert indexed.find("dpkg", "host") == ["customer_@_site_@_model/dpkg_@_host"]
+    with tarfile.open(tmp_path / f"run_@_{collector.TIMESTAMP}.tar") as tar_file:
+        assert tar_file.getnames() == [
+            "customer_@_site_@_model/manifest.json",
+            "customer_@_site_@_model/dpkg_@_host",
+        ]
+
+
+@pytest.mark.parametrize("processes", [0, 2])
+def test_finalize_archives_dictionary(processes, collector_config, tmp_path):
+    """Test that payloads are compressed with dictionary saved next to the tarballs."""
+    collector_config.settings.collection_path = str(tmp_path)
+    collector_config.settings.compression = "zstd-dict"
+    collector_config.settings.archive_processes = processes
+    tar_path = tmp_path / f"customer_@_site_@_model_@_{collector.TIMESTAMP}.tar"
+    payloads = {
+        f"dpkg_@_host-{host}": "".join(
+            f"ii  package-{index}  1.{index}-{host % 3}  amd64\n" for index in range(host, 300)
+        ).encode()
+        for host in range(50)
+    }
+    for name, payload in payloads.items():
+        collector._add_file_to_tar(name, BytesIO(payload), str(tar_path))
+
+    collector.finalize_archives(collector_config)
+
+    dictionary = (tmp_path / f"zstd_dictionary_@_{collector.TIMESTAMP}.dict").read_bytes()
+    decompressor = zstandard.ZstdDecompressor(dict_data=zstandard.ZstdCompressionDict(dictionary))
+    with tarfile.open(tar_path) as tar_file:
+        for name, payload in payloads.items():
+            compressed = tar_file.extractfile(f"{name}.zst").read()
+            assert decompressor.decompress(compressed) == payload
+
+
+@pytest.mark.parametrize("compression", ["", "zstd-dict"])
+def test_finalize_archives_indexed(compression, collector_config, tmp_path):
+    """Test that tarballs of the run are merged into single archive readable by its index."""
+    collector_config.settings.collection_path = str(tmp_path)
+    collector_config.settings.compression = compression
+    collector_config.settings.archive_format = "indexed"
+    payloads = {}
+    for model in ["model_1", "model_2"]:
+        tar_path = tmp_path / f"customer_@_site_@_{model}_@_{collector.TIMESTAMP}.tar"
+        for host in range(30):
+            name = f"dpkg_@_{model}-host-{host}_@_{collector.TIMESTAMP}"
+            payloads[name] = f"ii  package-{host}  1.0-{host}  amd64\n".encode() * 20
+            collector._add_file_to_tar(name, BytesIO(payloads[name]), str(tar_path))
+
+    collector.finalize_archives(collector_config)
+
+    archive_path = str(tmp_path / f"run_@_{collector.TIMESTAMP}.tar")
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        [os.path.basename(archive_path), f"run_@_{collector.TIMESTAMP}.tar.index"]
+        + ([f"zstd_dictionary_@_{collector.TIMESTAMP}.dict"] if compression else [])
+    )
+    with IndexedArchive(archive_path) as archive:
+        name = archive.find("dpkg", "model_2-host-7")[0]
+        assert (
+            archive.read_payload(name)
+            == payloads[f"dpkg_@_model_2-host-7_@_{collector.TIMESTAMP}"]
+        )
+
+
+def test_finalize_archives_sharded(collector_config, tmp_path):
+    """Test compression of tarballs in sharded layout and pruning of old runs."""
+    collector_config.settings.collection_path = str(tmp_path)
+    collector_config.settings.compression = "gz"
+    collector_config.settings.layout = "sharded"
+    collector_config.settings.retention_runs = 1
+    site = tmp_path / "customer" / "site"
+    current = (
+        site / collector.TIMESTAMP[:8] / f"customer_@_site_@_model_@_{collector.TIMESTAMP}.tar"
+    )
+    previous = site / "19700101" / "customer_@_site_@_model_@_19700101000000.tar.gz"
+    for path in [current, previous]:
+        path.parent.mkdir(parents=True)
+        path.write_bytes(b"data")
+
+    collector.finalize_archives(collector_config)
+
+    assert os.path.exists(f"{current}.gz")
+    assert not previous.parent.exists()
+
+
+def test_finalize_archives_disabled(collector_config, mocker):
+    """Test that tarballs are left untouched if compression is not enabled."""
+    compress_mock = mocker.patch.object(collector, "compress_tarball")
+
+    collector.finalize_archives(collector_config)
+
+    compress_mock.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_fetch_juju_data_discovery(collector_config, mocker):
+    """Test that exporters discovered in model status are collected."""
+    collector_config.settings.discover_targets = True
+    known = collector_config.targets[0]
+    discovered = [
+        collector._ConfigTarget(known.endpoint, "known", "customer", "site", "model_1"),
+        collector._ConfigTarget("10.0.0.99:8675", "new", "customer", "site", "model_1"),
+    ]
+    mocker.patch.object(collector, "_save_status_data", return_value='{"applications": {}}')
+    mocker.patch.object(collector, "_save_bundle_data")
+    discover_mock = mocker.patch.object(collector, "discover_targets", return_value=discovered)
+    fetch_target_mock = mocker.patch.object(collector, "_fetch_target")
+    model = MagicMock()
+    model.disconnect.side_effect = AsyncMock()
+    controller = MagicMock()
+    controller.model_uuids.side_effect = AsyncMock(return_value={"model_1": "UUID 1"})
+    controller.get_model.side_effect = AsyncMock(return_value=model)
+    controller.disconnect.side_effect = AsyncMock()
+
+    await collector.fetch_juju_data(collector_config, {"": controller})
+
+    discover_mock.assert_called_once_with(
+        {"applications": {}}, "model_1", collector_config.settings
+    )
+    fetch_target_mock.assert_called_once_with(
+        discovered[1],
+        collector_config.settings.collection_path,
+        ANY,
+        None,
+        collector.ENDPOINTS,
+        collector.EncodingPolicy(),
+    )
+
+
+@pytest.mark.asyncio
+async def test_fetch_juju_data_discovery_error(collector_config, mocker):
+    """Test that failure of discovered exporter fails the collection."""
+    collector_config.settings.discover_targets = True
+    discovered = collector._ConfigTarget("10.0.0.99:8675", "new", "customer", "site", "model_1")
+    mocker.patch.object(collector, "_save_status_data", return_value="{}")
+    mocker.patch.object(collector, "_save_bundle_data")
+    mocker.patch.object(collector, "discover_targets", return_value=[discovered])
+    mocker.patch.object(collector, "_fetch_target", side_effect=collector.CollectionError)
+    model = MagicMock()
+    model.disconnect.side_effect = AsyncMock()
+    controller = MagicMock()
+    controller.model_uuids.side_effect = AsyncMock(return_value={"model_1": "UUID 1"})
+    controller.get_model.side_effect = AsyncMock(return_value=model)
+
+    with pytest.raises(collector.CollectionError):
+        await collector.fetch_juju_data(collector_config, {"": controller})
+
+
+@pytest.mark.asyncio
+async def test_fetch_juju_data_discovery_asyncio(collector_config, mocker):
+    """Test that discovered exporters are collected on the event loop with asyncio engine."""
+    collector_config.settings.discover_targets = True
+    collector_config.settings.http_engine = "asyncio"
+    discovered = collector._ConfigTarget("10.0.0.99:8675", "new", "customer", "site", "model_1")
+    mocker.patch.object(collector, "_save_status_data", return_value="{}")
+    mocker.patch.object(collector, "_save_bundle_data")
+    mocker.patch.object(collector, "discover_targets", return_value=[discovered])
+    fetch_target_mock = mocker.patch.object(collector, "_fetch_target")
+    fetch_async_mock = mocker.patch.object(collector, "_fetch_target_async")
+    model = MagicMock()
+    model.disconnect.side_effect = AsyncMock()
+    controller = MagicMock()
+    controller.model_uuids.side_effect = AsyncMock(return_value={"model_1": "UUID 1"})
+    controller.get_model.side_effect = AsyncMock(return_value=model)
+    controller.disconnect.side_effect = AsyncMock()
+
+    await collector.fetch_juju_data(collector_config, {"": controller})
+
+    fetch_target_mock.assert_not_called()
+    fetch_async_mock.assert_awaited_once_with(
+        discovered,
+        collector_config.settings.collection_path,
+        ANY,
+        None,
+        collector.ENDPOINTS,
+        collector.EncodingPolicy(),
+    )
+
+
+@pytest.mark.asyncio
+async def test_fetch_juju_data_index(collector_config, mocker, tmp_path):
+    """Test that applications from model status are added to the package index."""
+    collector_config.settings.index_path = str(tmp_path / "index.db")
+    status = '{"applications": {"ubuntu": {"charm": "ch:amd64/focal/ubuntu-21"}}}'
+    mocker.patch.object(collector, "_save_status_data", return_value=status)
+    mocker.patch.object(collector, "_save_bundle_data")
+    add_status_mock = mocker.spy(collector.PackageIndex, "add_status")
+    model = MagicMock()
+    model.disconnect.side_effect = AsyncMock()
+    controller = MagicMock()
+    controller.model_uuids.side_effect = AsyncMock(return_value={"model_1": "UUID 1"})
+    controller.get_model.side_effect = AsyncMock(return_value=model)
+    controller.disconnect.side_effect = AsyncMock()
+
+    await collector.fetch_juju_data(collector_config, {"": controller})
+
+    add_status_mock.assert_called_once_with(
+        ANY, collector_config.settings, "model_1", json.loads(status)
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "workers, concurrency, expected",
+    [(2, "fixed", ["medium", "small"]), (1, "adaptive", ["small", "medium"])],
+)
+async def test_fetch_juju_data_schedule(workers, concurrency, expected, collector_config, mocker):
+    """Test that concurrent models are collected longest first and skipped if they can't finish.
+
+    Adaptive concurrency doesn't apply to models, so a single worker keeps their order.
+    """
+    collector_config.settings.workers = workers
+    collector_config.settings.concurrency = concurrency
+    schedule = collector.RunSchedule(deadline=60)
+    schedule._history[collector.MODELS].update({"small": 1, "medium": 10, "huge": 600})
+    mocker.patch.object(collector, "_save_status_data", return_value="{}")
+    mocker.patch.object(collector, "_save_bundle_data")
+    model = MagicMock()
+    model.disconnect.side_effect = AsyncMock()
+    controller = MagicMock()
+    controller.model_uuids.side_effect = AsyncMock(
+        return_value={"small": "UUID 1", "huge": "UUID 2", "medium": "UUID 3"}
+    )
+    controller.get_model.side_effect = AsyncMock(return_value=model)
+    controller.disconnect.side_effect = AsyncMock()
+
+    await collector.fetch_juju_data(collector_config, {"": controller}, schedule)
+
+    assert controller.get_model.call_args_list == [call(name) for name in expected]
+    assert schedule.skipped == ["model huge"]
+
+
+@pytest.mark.parametrize(
+    "http_engine, fetch", [("sync", "_fetch_target"), ("asyncio", "_fetch_target_async")]
+)
+def test_fetch_exporter_data_intervals(http_engine, fetch, collector_config, mocker, tmp_path):
+    """Test that only endpoints which are due are collected and recorded."""
+    collector_config.settings.collection_path = str(tmp_path)
+    collector_config.settings.http_engine = http_engine
+    target = collector_config.targets[0]
+    collector_config.targets = [target]
+    schedule = collector.RunSchedule(intervals={"kernel": 3600})
+    schedule.collected(target.endpoint, ["kernel"])
+    fetch_mock = mocker.patch.object(collector, fetch)
+
+    collector.fetch_exporter_data(collector_config, schedule)
+    fetch_mock.assert_called_once_with(
+        target, ANY, ANY, None, ["dpkg", "snap"], collector.EncodingPolicy()
+    )
+    # partial collection doesn't update estimate of the whole target
+    assert schedule.estimate(collector.TARGETS, target.endpoint) is None
+    # endpoints that are not due are listed in the tarball
+    tar_path = collector._target_tar_path(target, str(tmp_path))
+    with tarfile.open(tar_path) as tar_file:
+        skipped = tar_file.extractfile(f"skipped_@_{target.hostname}_@_{collector.TIMESTAMP}")
+        assert json.load(skipped) == {
+            "kernel": datetime.datetime.fromtimestamp(
+                schedule.last_collected(target.endpoint, "kernel"), datetime.timezone.utc
+            ).isoformat()
+        }
+
+    schedule.collected(target.endpoint, ["dpkg", "snap"])
+    fetch_mock.reset_mock()
+    schedule.intervals.update({"dpkg": 3600, "snap": 3600})
+    collector.fetch_exporter_data(collector_config, schedule)
+    fetch_mock.assert_not_called()
+    assert schedule.skipped == []
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("discover_targets, saves_status", [(False, False), (True, True)])
+async def test_fetch_juju_data_intervals(
+    discover_targets, saves_status, collector_config, mocker, tmp_path
+):
+    """Test that model status is collected only when it's due or needed for discovery."""
+    collector_config.settings.collection_path = str(tmp_path)
+    collector_config.settings.discover_targets = discover_targets
+    schedule = collector.RunSchedule(intervals={"status": 3600, "bundle": 3600})
+    schedule.collected("model_1", ["status"])
+    schedule.collected("model_2", ["status", "bundle"])
+    save_status_mock = mocker.patch.object(collector, "_save_status_data", return_value="{}")
+    save_bundle_mock = mocker.patch.object(collector, "_save_bundle_data")
+    mocker.patch.object(collector, "discover_targets", return_value=[])
+    model = MagicMock()
+    model.disconnect.side_effect = AsyncMock()
+    controller = MagicMock()
+    controller.model_uuids.side_effect = AsyncMock(
+        return_value={"model_1": "UUID 1", "model_2": "UUID 2"}
+    )
+    controller.get_model.side_effect = AsyncMock(return_value=model)
+    controller.disconnect.side_effect = AsyncMock()
+
+    await collector.fetch_juju_data(collector_config, {"": controller}, schedule)
+
+    save_bundle_mock.assert_called_once()
+    expected_models = ["model_1", "model_2"] if saves_status else ["model_1"]
+    assert controller.get_model.call_args_list == [call(name) for name in expected_models]
+    assert save_status_mock.call_count == (2 if saves_status else 0)
+    # model_2 is skipped, or its status is collected for discovery only
+    assert schedule.estimate(collector.MODELS, "model_2") is None
+    # artifacts that are not due are listed in the tarballs
+    expected_skipped = {
+        "model_1": [] if saves_status else ["status"],
+        "model_2": ["bundle"] if saves_status else ["bundle", "status"],
+    }
+    for model_name, artifacts in expected_skipped.items():
+        tar_path = collector._model_tar_path(collector_config, model_name)
+        if not artifacts:
+            assert not os.path.exists(tar_path)
+            continue
+        with tarfile.open(tar_path) as tar_file:
+            skipped = tar_file.extractfile(f"juju_skipped_@_{model_name}_@_{collector.TIMESTAMP}")
+            assert sorted(json.load(skipped)) == artifacts
+
+
+@pytest.mark.parametrize("http_engine", ["sync", "asyncio"])
+def test_fetch_exporter_data_adaptive(http_engine, collector_config, mocker):
+    """Test that first responses of exporters are observed by the adaptive limiter."""
+    collector_config.settings.http_engine = http_engine
+    collector_config.settings.concurrency = "adaptive"
+    data = {f"/{endpoint}": b"response" for endpoint in collector.ENDPOINTS}
+    responses = []
+    for _ in range(len(collector_config.targets) * len(collector.ENDPOINTS)):
+        response = MagicMock()
+        response.__enter__.return_value = response
+        response.iter_content.return_value = [b"response"]
+        responses.append(response)
+    mocker.patch.object(collector.requests, "get", side_effect=responses)
+    mocker.patch.object(
+        collector,
+        "fetch_pipelined",
+        _fake_fetch_pipelined({target.endpoint: data for target in collector_config.targets}),
+    )
+    _stored_payloads(mocker)
+    limiter = collector.AdaptiveLimiter(initial=1, maximum=4)
+
+    collector.fetch_exporter_data(collector_config, limiter=limiter)
+
+    assert limiter.limit == 1 + len(collector_config.targets)
+    assert limiter.in_flight == 0
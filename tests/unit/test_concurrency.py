@@ -0,0 +1,138 @@
+"""Tests for software_inventory_collector.concurrency module."""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from software_inventory_collector import concurrency
+
+
+def test_adaptive_limiter_slow_start_and_backoff(mocker):
+    """Test that limit grows quickly until the first backoff and slowly after it."""
+    mocker.patch.object(concurrency.time, "monotonic", return_value=100)
+    limiter = concurrency.AdaptiveLimiter(initial=2, maximum=20)
+
+    for _ in range(4):
+        limiter.observe(started=0, latency=0.1)
+    assert limiter.limit == 6
+
+    # rising latency backs off only once for queries started before the backoff
+    limiter.observe(started=50, latency=1.0)
+    limiter.observe(started=60, latency=1.0)
+    assert limiter.limit == pytest.approx(6 * concurrency.BACKOFF)
+    assert limiter.backoffs == 1
+
+    limiter.observe(started=100, latency=0.1)
+    assert limiter.limit == pytest.approx(4.2 + 1 / 4.2)
+
+    limiter.observe(started=101, latency=0.1, failed=True)
+    assert limiter.backoffs == 2
+    assert limiter.report() == "Exporter concurrency: limit 3 (lowest 2, highest 6, 2 backoffs)"
+
+
+def test_adaptive_limiter_bounds():
+    """Test that limit stays within its bounds."""
+    limiter = concurrency.AdaptiveLimiter(initial=5, maximum=3, minimum=2)
+    assert limiter.limit == 3
+
+    limiter.observe(started=0, latency=0.1)
+    assert limiter.limit == 3
+
+    for started in range(1, 5):
+        limiter.observe(started=time.monotonic() + started, latency=0, failed=True)
+    assert limiter.limit == 2
+
+
+def test_adaptive_limiter_slot_threads():
+    """Test that threads hold at most `limit` slots at once."""
+    limiter = concurrency.AdaptiveLimiter(initial=2, maximum=2)
+    in_flight = []
+    lock = threading.Lock()
+
+    def query():
+        with limiter.slot():
+            with lock:
+                in_flight.append(limiter.in_flight)
+            time.sleep(0.01)
+            concurrency.record_response()
+
+    threads = [threading.Thread(target=query) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(in_flight) == 2
+    assert limiter.in_flight == 0
+
+
+def test_adaptive_limiter_slot_failure():
+    """Test that failed query backs off the limit and releases its slot."""
+    limiter = concurrency.AdaptiveLimiter(initial=4, maximum=4)
+
+    with pytest.raises(RuntimeError), limiter.slot():
+        raise RuntimeError
+
+    assert limiter.limit == pytest.approx(4 * concurrency.BACKOFF)
+    assert limiter.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_adaptive_limiter_async_slot():
+    """Test that tasks wait for a slot and only the first response is observed."""
+    limiter = concurrency.AdaptiveLimiter(initial=1, maximum=1)
+    order = []
+
+    async def query(name):
+        async with limiter.async_slot():
+            order.append(f"start {name}")
+            await asyncio.sleep(0.01)
+            concurrency.record_response()
+            concurrency.record_response()
+            order.append(f"end {name}")
+
+    waiting = asyncio.ensure_future(query("cancelled"))
+    async with limiter.async_slot():
+        await asyncio.sleep(0)
+        waiting.cancel()
+    await asyncio.gather(query("first"), query("second"))
+
+    assert order == ["start first", "end first", "start second", "end second"]
+    assert limiter.in_flight == 0
+    assert limiter.backoffs == 0
+    assert waiting.cancelled()
+
+
+def test_record_request(mocker):
+    """Test that latency is measured from the first request, not from taking the slot."""
+    limiter = concurrency.AdaptiveLimiter(initial=1, maximum=4)
+    observe = mocker.spy(limiter, "observe")
+    monotonic = mocker.patch.object(concurrency.time, "monotonic", return_value=100)
+
+    with limiter.slot():
+        # waiting for the memory budget
+        monotonic.return_value = 150
+        concurrency.record_request()
+        monotonic.return_value = 151
+        concurrency.record_response()
+        concurrency.record_request()
+
+    observe.assert_called_once_with(150, 1)
+
+
+def test_record_response_without_slot():
+    """Test that request and response outside of a slot are ignored."""
+    concurrency.record_request()
+    concurrency.record_response()
+
+
+def test_new_limiter(collector_config):
+    """Test that limiter is created only if adaptive concurrency is enabled."""
+    assert concurrency.new_limiter(collector_config.settings) is None
+
+    collector_config.settings.concurrency = "adaptive"
+    collector_config.settings.workers = 4
+    limiter = concurrency.new_limiter(collector_config.settings)
+
+    assert (limiter.limit, limiter.maximum) == (4, collector_config.settings.max_workers)
@@ -6,8 +6,11 @@ import pytest
 
 from software_inventory_collector.config import (
     Config,
+    ConfigError,
+    ConfigInvalidValueError,
     ConfigMissingKeyError,
     _BaseConfig,
+    _ConfigTarget,
 )
 
 
@@ -36,9 +39,57 @@ def test_config_parsing_missing(collector_config_data):
     """Test that exception is raised if required key is missing."""
     del collector_config_data["settings"]["site"]
 
-    with pytest.raises(ConfigMissingKeyError):
+    with pytest.raises(ConfigMissingKeyError) as exc:
         Config.from_dict(collector_config_data)
 
+    assert exc.value.key_name == "settings.site"
+
+
+def test_config_parsing_missing_in_list(collector_config_data):
+    """Test that missing key in list item is reported with its position."""
+    del collector_config_data["targets"][1]["endpoint"]
+
+    with pytest.raises(ConfigMissingKeyError) as exc:
+        Config.from_dict(collector_config_data)
+
+    assert exc.value.key_name == "targets[1].endpoint"
+
+
+@pytest.mark.parametrize(
+    "location, value, expected_key, reason",
+    [
+        (["targets"], "10.0.0.1:8675", "targets", "expected list, got str"),
+        (["targets", 1], ["host"], "targets[1]", "expected mapping, got list"),
+        (["targets", 1, "endpoint"], ["host"], "targets[1].endpoint", "expected str, got list"),
+        (["settings", "site"], True, "settings.site", "expected str, got bool"),
+        (["settings", "workers"], True, "settings.workers", "expected int, got bool"),
+        (["settings", "workers"], "4", "settings.workers", "expected int, got str"),
+    ],
+)
+def test_config_parsing_invalid_value(
+    location, value, expected_key, reason, collector_config_data
+):
+    """Test that values of unexpected type are reported with their path in config."""
+    parent = collector_config_data
+    for key in location[:-1]:
+        parent = parent[key]
+    parent[location[-1]] = value
+
+    with pytest.raises(ConfigInvalidValueError) as exc:
+        Config.from_dict(collector_config_data)
+
+    assert exc.value.key_name == expected_key
+    assert exc.value.reason == reason
+    assert str(exc.value) == f"Invalid value of '{expected_key}': {reason}"
+
+
+def test_config_target_slots(collector_config_data):
+    """Test that target objects don't carry per-instance attribute dictionary."""
+    config = Config.from_dict(collector_config_data)
+
+    assert isinstance(config.targets[0], _ConfigTarget)
+    assert not hasattr(config.targets[0], "__dict__")
+
 
 def test_config_parsing_basic_list():
     """Test parsing config object that contains list of basic objects (int/str/..).
@@ -56,3 +107,195 @@ def test_config_parsing_basic_list():
 
     config = ConfigWithList.from_dict(raw_config)
     verify_config(config, raw_config)
+
+
+def test_config_parsing_optional(collector_config_data):
+    """Test that optional keys fall back to their default values."""
+    config = Config.from_dict(collector_config_data)
+    assert config.settings.workers == 1
+
+    collector_config_data["settings"]["workers"] = 8
+    config = Config.from_dict(collector_config_data)
+    assert config.settings.workers == 8
+
+
+@pytest.mark.parametrize(
+    "name, value, minimum",
+    [
+        ("workers", 0, 1),
+        ("max_workers", 0, 1),
+        ("memory_budget", 0, 1),
+        ("archive_processes", -1, 0),
+        ("run_deadline", -1, 0),
+        ("retention_runs", -1, 0),
+        ("retention_days", -1, 0),
+        ("retention_bytes", -1, 0),
+    ],
+)
+def test_config_setting_minimum(name, value, minimum, collector_config_data):
+    """Test that numeric settings below their minimum are rejected."""
+    collector_config_data["settings"][name] = value
+
+    with pytest.raises(ConfigError, match=f"Setting '{name}' must be at least {minimum}"):
+        Config.from_dict(collector_config_data)
+
+
+def test_config_numeric_strings(collector_config_data):
+    """Test that numeric YAML scalars of string attributes are converted to strings."""
+    collector_config_data["settings"]["site"] = 2023
+    collector_config_data["settings"]["customer"] = 1234
+    collector_config_data["juju_controller"]["password"] = 12345
+    collector_config_data["targets"][0]["model"] = 1.5
+
+    config = Config.from_dict(collector_config_data)
+
+    assert (config.settings.site, config.settings.customer) == ("2023", "1234")
+    assert config.juju_controller.password == "12345"
+    assert config.targets[0].model == "1.5"
+
+
+def test_config_unsupported_compression(collector_config_data):
+    """Test that unknown compression format is rejected."""
+    collector_config_data["settings"]["compression"] = "rar"
+
+    with pytest.raises(ConfigError, match="Unsupported compression 'rar'"):
+        Config.from_dict(collector_config_data)
+
+
+def test_config_unsupported_http_engine(collector_config_data):
+    """Test that unknown HTTP engine is rejected."""
+    collector_config_data["settings"]["http_engine"] = "twisted"
+
+    with pytest.raises(ConfigError, match="Unsupported http_engine 'twisted'"):
+        Config.from_dict(collector_config_data)
+
+
+def test_config_unsupported_transfer_encoding(collector_config_data):
+    """Test that unknown transfer encoding is rejected."""
+    collector_config_data["settings"]["transfer_encoding"] = "br"
+
+    with pytest.raises(ConfigError, match="Unsupported transfer_encoding 'br'"):
+        Config.from_dict(collector_config_data)
+
+
+def test_config_unsupported_layout(collector_config_data):
+    """Test that unknown archive layout is rejected."""
+    collector_config_data["settings"]["layout"] = "nested"
+
+    with pytest.raises(ConfigError, match="Unsupported layout 'nested'"):
+        Config.from_dict(collector_config_data)
+
+
+def test_config_unsupported_archive_format(collector_config_data):
+    """Test that unknown archive format is rejected."""
+    collector_config_data["settings"]["archive_format"] = "zip"
+
+    with pytest.raises(ConfigError, match="Unsupported archive_format 'zip'"):
+        Config.from_dict(collector_config_data)
+
+
+def test_config_indexed_archive_compression(collector_config_data):
+    """Test that compression of whole archive is rejected with indexed archive format."""
+    collector_config_data["settings"]["archive_format"] = "indexed"
+    collector_config_data["settings"]["compression"] = "xz"
+
+    with pytest.raises(ConfigError, match="Compression 'xz' is not supported"):
+        Config.from_dict(collector_config_data)
+
+
+def test_config_unsupported_concurrency(collector_config_data):
+    """Test that unknown concurrency mode is rejected."""
+    collector_config_data["settings"]["concurrency"] = "unlimited"
+
+    with pytest.raises(ConfigError, match="Unsupported concurrency 'unlimited'"):
+        Config.from_dict(collector_config_data)
+
+
+def test_config_multiple_controllers(collector_config_data):
+    """Test that controllers from both single section and list are used."""
+    single = collector_config_data["juju_controller"]
+    single["name"] = "infra"
+    collector_config_data["juju_controllers"] = [dict(single, name="workloads")]
+    for target in collector_config_data["targets"]:
+        target["model"] = f"infra.{target['model']}"
+
+    config = Config.from_dict(collector_config_data)
+
+    assert [controller.name for controller in config.controllers] == ["infra", "workloads"]
+
+    del collector_config_data["juju_controller"]
+    for target in collector_config_data["targets"]:
+        target["model"] = target["model"].replace("infra.", "workloads.")
+    config = Config.from_dict(collector_config_data)
+
+    assert config.juju_controller is None
+    assert [controller.name for controller in config.controllers] == ["workloads"]
+
+
+def test_config_target_labels(collector_config_data):
+    """Test that models of targets are labelled like models of a named controller."""
+    collector_config_data["juju_controller"]["name"] = "infra"
+    collector_config_data["targets"][1]["model"] = "infra.k8s"
+
+    config = Config.from_dict(collector_config_data)
+
+    assert [target.model for target in config.targets] == ["infra.openstack", "infra.k8s"]
+    config.label_targets(config.targets)
+    assert [target.model for target in config.targets] == ["infra.openstack", "infra.k8s"]
+
+
+@pytest.mark.parametrize(
+    "models, error",
+    [
+        (["openstack", "infra.k8s"], "must be '<controller>.<model>' with multiple"),
+        (["infra.openstack", "other.k8s"], "unknown Juju controller 'other'"),
+    ],
+)
+def test_config_target_labels_invalid(models, error, collector_config_data):
+    """Test that models of targets must name a controller if it's ambiguous."""
+    controller = collector_config_data["juju_controller"]
+    controller["name"] = "infra"
+    collector_config_data["juju_controllers"] = [dict(controller, name="workloads")]
+    for target, model in zip(collector_config_data["targets"], models):
+        target["model"] = model
+
+    with pytest.raises(ConfigError, match=error):
+        Config.from_dict(collector_config_data)
+
+
+def test_config_missing_controller(collector_config_data):
+    """Test that at least one Juju controller is required."""
+    del collector_config_data["juju_controller"]
+
+    with pytest.raises(ConfigMissingKeyError) as exc:
+        Config.from_dict(collector_config_data)
+
+    assert exc.value.key_name == "juju_controller"
+
+
+@pytest.mark.parametrize("names", [["infra", ""], ["infra", "infra"]])
+def test_config_controller_names(names, collector_config_data):
+    """Test that multiple controllers must have unique names."""
+    controller = collector_config_data.pop("juju_controller")
+    collector_config_data["juju_controllers"] = [dict(controller, name=name) for name in names]
+
+    with pytest.raises(ConfigError, match="must have a unique 'name'"):
+        Config.from_dict(collector_config_data)
+
+
+@pytest.mark.parametrize(
+    "settings, message",
+    [
+        ({"output": "s3"}, "Unsupported output 's3'"),
+        ({"output": "http"}, "Output 'http' requires 'ingest_url'"),
+        ({"output": "stdout", "compression": "gz"}, "Output 'stdout' supports only"),
+        ({"output": "stdout", "layout": "sharded"}, "Output 'stdout' supports only"),
+        ({"output": "stdout", "deterministic": True}, "Output 'stdout' supports only"),
+    ],
+)
+def test_config_unsupported_output(settings, message, collector_config_data):
+    """Test that unknown output and settings that need stored archives are rejected."""
+    collector_config_data["settings"].update(settings)
+
+    with pytest.raises(ConfigError, match=message):
+        Config.from_dict(collector_config_data)
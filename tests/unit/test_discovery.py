@@ -0,0 +1,77 @@
+"""Tests for software_inventory_collector.discovery module."""
+import pytest
+
+from software_inventory_collector import discovery
+
+
+@pytest.fixture()
+def model_status() -> dict:
+    """Return status of a model with exporter deployed on machines and containers."""
+    exporter = "software-inventory-exporter"
+    return {
+        "applications": {
+            "ubuntu": {
+                "units": {
+                    "ubuntu/0": {
+                        "machine": "0",
+                        "public-address": "10.0.0.10",
+                        "subordinates": {f"{exporter}/0": {"public-address": "10.0.0.10"}},
+                    },
+                    "ubuntu/1": {
+                        "machine": "0/lxd/1",
+                        "public-address": "",
+                        "subordinates": {f"{exporter}/1": {}},
+                    },
+                    "ubuntu/2": {"machine": "2", "subordinates": {f"{exporter}/2": {}}},
+                },
+            },
+            "nrpe": {"units": None},
+            exporter: {"units": {f"{exporter}/3": {"machine": "3"}}},
+        },
+        "machines": {
+            "0": {
+                "hostname": "juju-0",
+                "dns-name": "10.0.0.10",
+                "containers": {
+                    "0/lxd/1": {
+                        "hostname": "",
+                        "instance-id": "juju-0-lxd-1",
+                        "dns-name": "10.0.1.1",
+                    }
+                },
+            },
+            "3": {"hostname": "juju-3", "dns-name": "10.0.0.13"},
+        },
+    }
+
+
+def test_discover_targets(model_status, collector_config):
+    """Test that targets are built from principal and subordinate exporter units."""
+    settings = collector_config.settings
+
+    targets = discovery.discover_targets(model_status, "model-1", settings)
+
+    assert [(target.endpoint, target.hostname) for target in targets] == [
+        ("10.0.0.10:8675", "juju-0"),
+        ("10.0.1.1:8675", "juju-0-lxd-1"),
+        ("10.0.0.13:8675", "juju-3"),
+    ]
+    for target in targets:
+        assert target.model == "model-1"
+        assert target.customer == settings.customer
+        assert target.site == settings.site
+
+
+def test_discover_targets_custom_application(model_status, collector_config):
+    """Test discovery of exporter deployed under different application name and port."""
+    collector_config.settings.exporter_application = "ubuntu"
+    collector_config.settings.exporter_port = 9000
+
+    targets = discovery.discover_targets(model_status, "model-1", collector_config.settings)
+
+    assert [target.endpoint for target in targets] == ["10.0.0.10:9000", "10.0.1.1:9000"]
+
+
+def test_discover_targets_empty_model(collector_config):
+    """Test discovery in a model without applications."""
+    assert discovery.discover_targets({}, "empty", collector_config.settings) == []
@@ -0,0 +1,97 @@
+"""Tests for software_inventory_collector.encoding module."""
+import gzip
+from io import BytesIO
+
+import pytest
+import zstandard
+
+from software_inventory_collector import encoding
+from software_inventory_collector.exception import HTTPClientError
+
+DATA = b"ii  openssl:amd64  3.0.2  amd64  Secure Sockets Layer toolkit\n" * 100
+
+
+@pytest.mark.parametrize(
+    "transfer_encoding, compression, expected",
+    [
+        ("", "", encoding.EncodingPolicy()),
+        ("", "zstd-dict", encoding.EncodingPolicy()),
+        ("gzip", "zstd-dict", encoding.EncodingPolicy("gzip")),
+        ("zstd", "xz", encoding.EncodingPolicy("zstd")),
+        ("zstd", "zstd-dict", encoding.EncodingPolicy("zstd", "zstd")),
+    ],
+)
+def test_encoding_policy(transfer_encoding, compression, expected, collector_config):
+    """Test that responses are stored as received only if the archive stores their encoding."""
+    collector_config.settings.transfer_encoding = transfer_encoding
+    collector_config.settings.compression = compression
+
+    policy = encoding.encoding_policy(collector_config.settings)
+
+    assert policy == expected
+    assert policy.headers == (
+        {"Accept-Encoding": f"{transfer_encoding}, identity"} if transfer_encoding else {}
+    )
+
+
+def _chunks(data, size=100):
+    """Split data into chunks of `size` bytes."""
+    chunks = BytesIO(data)
+    return list(iter(lambda: chunks.read(size), b""))
+
+
+@pytest.mark.parametrize(
+    "content_encoding, body",
+    [
+        ("", DATA),
+        ("identity", DATA),
+        ("gzip", gzip.compress(DATA)),
+        (" ZSTD", zstandard.ZstdCompressor().compress(DATA)),
+    ],
+)
+def test_encoded_body_decoded(content_encoding, body):
+    """Test that bodies in encodings that aren't stored are decoded."""
+    parsed = []
+    encoded = encoding.EncodedBody(content_encoding, encoding.EncodingPolicy(), parsed.append)
+
+    assert b"".join(encoded.decode(_chunks(body))) == DATA
+    assert b"".join(parsed) == DATA
+    assert encoded.suffix == ""
+
+
+@pytest.mark.parametrize("parse", [True, False])
+def test_encoded_body_stored(parse):
+    """Test that bodies in the stored encoding pass through, decoded only for the parser."""
+    body = zstandard.ZstdCompressor().compress(DATA)
+    parsed = []
+    policy = encoding.EncodingPolicy("zstd", "zstd")
+    encoded = encoding.EncodedBody("zstd", policy, parsed.append if parse else None)
+
+    assert b"".join(encoded.decode(_chunks(body))) == body
+    assert b"".join(parsed) == (DATA if parse else b"")
+    assert encoded.suffix == ".zst"
+
+
+def test_encoded_body_unsupported():
+    """Test that response in unsupported content encoding is rejected."""
+    with pytest.raises(HTTPClientError, match="Unsupported content encoding 'br'"):
+        encoding.EncodedBody("br", encoding.EncodingPolicy("gzip"))
+
+
+@pytest.mark.parametrize(
+    "content_encoding, body, message",
+    [
+        ("gzip", b"not compressed data", "incorrect header check"),
+        ("gzip", gzip.compress(DATA)[:50], "truncated"),
+        ("zstd", b"not compressed data", "Unknown frame descriptor"),
+        ("zstd", zstandard.ZstdCompressor().compress(DATA)[:50], "truncated"),
+    ],
+)
+def test_encoded_body_malformed(content_encoding, body, message):
+    """Test that malformed or truncated compressed body is reported as client error."""
+    encoded = encoding.EncodedBody(content_encoding, encoding.EncodingPolicy())
+
+    with pytest.raises(
+        HTTPClientError, match=f"Malformed '{content_encoding}' response body: .*{message}"
+    ):
+        list(encoded.decode([body]))
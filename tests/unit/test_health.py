@@ -0,0 +1,106 @@
+"""Tests for software_inventory_collector.health module."""
+import asyncio
+import socket
+
+import pytest
+
+from software_inventory_collector import health
+from software_inventory_collector.config import _ConfigTarget
+
+
+def _target(endpoint: str, hostname: str) -> _ConfigTarget:
+    """Return exporter target."""
+    return _ConfigTarget(endpoint, hostname, "customer", "site", "model")
+
+
+def _closed_port() -> int:
+    """Return local port on which nothing listens."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.mark.asyncio
+async def test_check_targets():
+    """Test that reachable and unreachable exporters are reported."""
+
+    async def handle(reader, writer):
+        request = await reader.readuntil(b"\r\n\r\n")
+        if b"Host: 127.0.0.1" in request and b"/kernel" in request:
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Length: 13\r\n\r\n{"kernel": 1}')
+        await writer.drain()
+        writer.close()
+
+    async def stall(reader, writer):
+        await asyncio.sleep(1)
+        writer.close()
+
+    async def malform(reader, writer):
+        await reader.readuntil(b"\r\n\r\n")
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: many\r\n\r\n")
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    stalled = await asyncio.start_server(stall, "127.0.0.1", 0)
+    malformed = await asyncio.start_server(malform, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    stalled_port = stalled.sockets[0].getsockname()[1]
+    malformed_port = malformed.sockets[0].getsockname()[1]
+    targets = [
+        _target(f"127.0.0.1:{port}", "healthy-1"),
+        _target(f"127.0.0.1:{port}", "healthy-2"),
+        _target(f"127.0.0.1:{_closed_port()}", "refused"),
+        _target(f"127.0.0.1:{stalled_port}", "stalled"),
+        _target(f"localhost:{port}", "empty"),
+        _target(f"127.0.0.1:{malformed_port}", "malformed"),
+    ]
+    try:
+        report = await health.check_targets(targets, concurrency=2, timeout=0.2)
+    finally:
+        for running in (server, stalled, malformed):
+            running.close()
+            await running.wait_closed()
+
+    assert sorted(report.latencies) == [
+        f"healthy-1 (127.0.0.1:{port})",
+        f"healthy-2 (127.0.0.1:{port})",
+    ]
+    assert sorted(report.failures) == [
+        f"empty (localhost:{port})",
+        f"malformed (127.0.0.1:{malformed_port})",
+        f"refused (127.0.0.1:{targets[2].endpoint.split(':')[1]})",
+        f"stalled (127.0.0.1:{stalled_port})",
+    ]
+    assert report.failures[f"stalled (127.0.0.1:{stalled_port})"] == "timed out"
+    assert report.failures[f"empty (localhost:{port})"] == "Connection closed without response"
+    assert report.failures[f"malformed (127.0.0.1:{malformed_port})"] == (
+        "Invalid Content-Length 'many'"
+    )
+
+
+def test_health_report_format():
+    """Test formatting of latency histogram, percentiles and unreachable exporters."""
+    latencies = {f"host-{index}": 0.001 * index for index in range(1, 101)}
+    latencies["slow"] = 3.0
+    report = health.HealthReport(latencies=latencies, failures={"down (10.0.0.1:8675)": "refused"})
+
+    lines = report.format().splitlines()
+
+    assert lines[0] == "Reachable targets: 101/102"
+    assert lines[1] == "Latency: p50 51 ms, p90 91 ms, p99 100 ms, max 3.0 s"
+    assert lines[2] == "   <10 ms |#######                                 | 9"
+    assert lines[7] == "  <500 ms |                                        | 0"
+    assert lines[10].startswith("  >=2.5 s |# ")
+    assert lines[11:] == ["Unreachable targets (1):", "  down (10.0.0.1:8675): refused"]
+
+
+def test_health_report_format_all_unreachable():
+    """Test report without any reachable exporter."""
+    report = health.HealthReport(failures={"down (10.0.0.1:8675)": "refused"})
+
+    assert report.format().splitlines() == [
+        "Reachable targets: 0/1",
+        "Unreachable targets (1):",
+        "  down (10.0.0.1:8675): refused",
+    ]
@@ -0,0 +1,226 @@
+"""Tests for software_inventory_collector.index module."""
+import json
+import sqlite3
+
+import pytest
+
+from software_inventory_collector import index
+from software_inventory_collector.config import _ConfigTarget
+from software_inventory_collector.exception import CollectionError
+
+# format of the exporter's 'dpkg' endpoint
+DPKG_OUTPUT = json.dumps(
+    [
+        {"package": "adduser", "version": "3.118ubuntu2"},
+        {"package": "libssl3:amd64", "version": "3.0.2-0ubuntu1.10"},
+        {"version": "missing name"},
+        {"package": "openssl", "version": "3.0.2-0ubuntu1.10"},
+    ]
+).encode()
+
+SNAP_OUTPUT = json.dumps(
+    {
+        "type": "sync",
+        "status-code": 200,
+        "result": [
+            {"name": "core20", "version": "20230126", "revision": "1828"},
+            {"name": "lxd", "version": "5.0.2", "revision": "24322"},
+            {"version": "missing name"},
+        ],
+    }
+).encode()
+
+TARGET = _ConfigTarget("10.0.0.1:8675", "host-1", "customer", "site", "model-1")
+
+
+def _parse(endpoint, data, chunk_size=7):
+    """Return parser that was fed `data` in small chunks."""
+    parser = index.PayloadParser(endpoint)
+    bounds = zip(
+        range(0, len(data), chunk_size), range(chunk_size, len(data) + chunk_size, chunk_size)
+    )
+    for start, end in bounds:
+        parser.write(data[start:end])
+    parser.close()
+    return parser
+
+
+def _rows(db_path, table):
+    """Return all rows of a table in index database."""
+    connection = sqlite3.connect(db_path)
+    try:
+        return connection.execute(f"SELECT * FROM {table} ORDER BY rowid").fetchall()
+    finally:
+        connection.close()
+
+
+def test_payload_parser_dpkg():
+    """Test parsing of installed packages from chunked 'dpkg' response."""
+    parser = _parse("dpkg", DPKG_OUTPUT)
+
+    assert parser.packages == [
+        ("adduser", "3.118ubuntu2"),
+        ("libssl3", "3.0.2-0ubuntu1.10"),
+        ("openssl", "3.0.2-0ubuntu1.10"),
+    ]
+    assert parser.kernel is None
+
+
+@pytest.mark.parametrize(
+    "data, expected",
+    [
+        (SNAP_OUTPUT, [("core20", "20230126"), ("lxd", "5.0.2")]),
+        (json.dumps([{"name": "lxd", "version": "5.0.2"}]).encode(), [("lxd", "5.0.2")]),
+        (b'{"type": "error"}', []),
+        (b'{"type": "error", "result": {"message": "failed"}}', []),
+        (b"not json", []),
+        (b'{"result": [{"name": "lxd", "version": "5.0.2"}, not json', [("lxd", "5.0.2")]),
+    ],
+)
+def test_payload_parser_snap(data, expected):
+    """Test parsing of installed snaps from snapd response."""
+    assert _parse("snap", data).packages == expected
+
+
+@pytest.mark.parametrize(
+    "data, expected",
+    [
+        (b'{"kernel": "5.15.0-76-generic"}', "5.15.0-76-generic"),
+        (b'"5.15.0-76-generic"', "5.15.0-76-generic"),
+        (b"5.15.0-76-generic\n", "5.15.0-76-generic"),
+        (b"", None),
+    ],
+)
+def test_payload_parser_kernel(data, expected):
+    """Test parsing of kernel release."""
+    parser = _parse("kernel", data)
+
+    assert parser.kernel == expected
+    assert parser.packages == []
+
+
+def test_payload_parser_streaming(mocker):
+    """Test that list items are parsed as they stream in, splitting multi-byte characters."""
+    mocker.patch.object(index, "MAX_ITEM_SIZE", 100)
+    data = json.dumps(
+        [
+            {"package": "pkg-\u00e9", "version": "1"},
+            {"package": "huge", "version": "x" * 200},
+            {"package": "after-huge", "version": "1"},
+        ],
+        ensure_ascii=False,
+    ).encode()
+    parser = index.PayloadParser("dpkg")
+
+    parsed = []
+    for byte in data:
+        parser.write(bytes([byte]))
+        parsed.append(len(parser.packages))
+    parser.close()
+
+    # first item is parsed as soon as the separator after it is received
+    assert parsed.index(1) == data.index(b"},") + 1
+
+    # responses with items over the size limit are indexed only up to them
+    assert parser.packages == [("pkg-\u00e9", "1")]
+
+
+def test_payload_parser_kernel_size_limit(mocker):
+    """Test that oversized kernel response is not indexed."""
+    mocker.patch.object(index, "MAX_ITEM_SIZE", 10)
+
+    assert _parse("kernel", b"5.15.0-76-generic" * 2, chunk_size=12).kernel is None
+
+
+def test_package_index_payloads(tmp_path):
+    """Test that parsed exporter responses are stored and can be queried."""
+    db_path = tmp_path / "index.db"
+    with index.PackageIndex(str(db_path), run="20230101000000") as package_index:
+        package_index.add_payload(TARGET, _parse("dpkg", DPKG_OUTPUT))
+        package_index.add_payload(TARGET, _parse("snap", SNAP_OUTPUT))
+        package_index.add_payload(TARGET, _parse("kernel", b'{"kernel": "5.15.0"}'))
+
+        assert package_index.find_package("openssl") == [
+            ("20230101000000", "model-1", "host-1", "dpkg", "3.0.2-0ubuntu1.10")
+        ]
+        assert package_index.find_package("lxd", version="5.0.1") == []
+        assert len(package_index.find_package("lxd", version="5.0.2")) == 1
+
+    prefix = ("20230101000000", "customer", "site", "model-1", "host-1")
+    assert len(_rows(db_path, "packages")) == 5
+    assert _rows(db_path, "packages")[3] == prefix + ("snap", "core20", "20230126")
+    assert _rows(db_path, "kernels") == [prefix + ("5.15.0",)]
+
+
+def test_package_index_runs(tmp_path):
+    """Test that packages are found in the latest run, unless another run is requested."""
+    db_path = str(tmp_path / "index.db")
+    adduser = b'[{"package": "adduser", "version": "3.118ubuntu2"}]'
+    for run, data in [("20230101000000", DPKG_OUTPUT), ("20230102000000", adduser)]:
+        with index.PackageIndex(db_path, run=run) as package_index:
+            package_index.add_payload(TARGET, _parse("dpkg", data))
+
+    with index.PackageIndex(db_path, run="20230103000000") as package_index:
+        assert package_index.find_package("openssl") == []
+        assert len(package_index.find_package("adduser")) == 1
+        assert package_index.find_package("openssl", run="20230101000000") == [
+            ("20230101000000", "model-1", "host-1", "dpkg", "3.0.2-0ubuntu1.10")
+        ]
+
+
+def test_package_index_status(collector_config, tmp_path):
+    """Test that applications and their charms are stored from Juju status."""
+    status = {
+        "applications": {
+            "nova": {"charm": "cs:focal/nova-compute-123"},
+            "ubuntu": {"charm": "ch:amd64/focal/ubuntu-21"},
+            "local": {"charm": "local:my-charm"},
+            "juju3": {"charm": "mysql", "charm-rev": 42},
+        }
+    }
+    db_path = tmp_path / "index.db"
+    settings = collector_config.settings
+    with index.PackageIndex(str(db_path), run="run") as package_index:
+        package_index.add_status(settings, "model-1", status)
+        package_index.add_status(settings, "empty-model", {})
+
+    prefix = ("run", settings.customer, settings.site, "model-1")
+    assert _rows(db_path, "applications") == [
+        prefix + ("nova", "nova-compute", 123),
+        prefix + ("ubuntu", "ubuntu", 21),
+        prefix + ("local", "my-charm", None),
+        prefix + ("juju3", "mysql", 42),
+    ]
+
+
+def test_package_index_batches(tmp_path):
+    """Test that rows are inserted once the batch is full."""
+    db_path = tmp_path / "index.db"
+    with index.PackageIndex(str(db_path), run="run", batch_size=2) as package_index:
+        package_index.add_payload(TARGET, _parse("dpkg", DPKG_OUTPUT))
+        assert len(_rows(db_path, "packages")) == 3
+        package_index.add_payload(TARGET, _parse("snap", b"[]"))
+        package_index.add_payload(TARGET, _parse("kernel", b"5.15.0"))
+        assert _rows(db_path, "kernels") == []
+
+    assert len(_rows(db_path, "kernels")) == 1
+
+
+def test_package_index_open_error(tmp_path):
+    """Test handling of database that can't be opened."""
+    with pytest.raises(CollectionError, match="Failed to open package index"):
+        index.PackageIndex(str(tmp_path / "missing" / "index.db"), run="run")
+
+
+def test_package_index_insert_error(tmp_path):
+    """Test handling of failed insert."""
+    db_path = tmp_path / "index.db"
+    package_index = index.PackageIndex(str(db_path), run="run")
+    package_index.add_payload(TARGET, _parse("dpkg", DPKG_OUTPUT))
+    connection = sqlite3.connect(db_path)
+    connection.execute("DROP TABLE packages")
+    connection.close()
+
+    with pytest.raises(CollectionError, match="Failed to update package index"):
+        with package_index:
+            pass
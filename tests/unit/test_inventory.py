@@ -0,0 +1,127 @@
+"""Tests for software_inventory_collector.inventory module."""
+import json
+import os
+
+import pytest
+import yaml
+
+from software_inventory_collector import inventory
+from software_inventory_collector.exception import ConfigError, ConfigMissingKeyError
+
+
+def _target(index: int, model: str = "model") -> dict:
+    """Return raw target definition."""
+    return {
+        "endpoint": f"10.0.0.{index}:8675",
+        "hostname": f"host-{index}",
+        "customer": "customer",
+        "site": "site",
+        "model": model,
+    }
+
+
+def _write_yaml(path, targets, mtime_ns=None):
+    path.write_text(yaml.safe_dump(targets))
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_load_single_yaml_file(tmp_path):
+    """Test loading targets from a single YAML file."""
+    targets_file = tmp_path / "targets.yaml"
+    _write_yaml(targets_file, [_target(1), _target(2)])
+
+    targets = inventory.TargetInventory(str(targets_file)).load()
+
+    assert [target.hostname for target in targets] == ["host-1", "host-2"]
+
+
+def test_load_directory(tmp_path):
+    """Test loading YAML and JSON-lines fragments from a directory, ignoring other files."""
+    _write_yaml(tmp_path / "b-model.yml", [_target(2, "b")])
+    lines = [json.dumps(_target(1, "a")), "", json.dumps(_target(3, "a"))]
+    (tmp_path / "a-model.jsonl").write_text("\n".join(lines))
+    (tmp_path / "README").write_text("not an inventory")
+    (tmp_path / "empty.yaml").write_text("")
+    (tmp_path / "subdir.yaml").mkdir()
+
+    targets = inventory.TargetInventory(str(tmp_path)).load()
+
+    assert [target.hostname for target in targets] == ["host-1", "host-3", "host-2"]
+
+
+def test_reload_only_changed_fragments(tmp_path, mocker):
+    """Test that only modified, new or removed fragments affect the reloaded targets."""
+    _write_yaml(tmp_path / "a.yaml", [_target(1)], mtime_ns=1_000)
+    _write_yaml(tmp_path / "b.yaml", [_target(2)], mtime_ns=1_000)
+    target_inventory = inventory.TargetInventory(str(tmp_path))
+    target_inventory.load()
+
+    parse_spy = mocker.spy(inventory, "_parse_fragment")
+    _write_yaml(tmp_path / "b.yaml", [_target(3)], mtime_ns=2_000)
+    _write_yaml(tmp_path / "c.yaml", [_target(4)])
+    (tmp_path / "a.yaml").unlink()
+
+    targets = target_inventory.load()
+
+    assert [target.hostname for target in targets] == ["host-3", "host-4"]
+    assert sorted(call.args[0] for call in parse_spy.call_args_list) == [
+        str(tmp_path / "b.yaml"),
+        str(tmp_path / "c.yaml"),
+    ]
+
+
+def test_load_targets_reuses_inventory(tmp_path, mocker):
+    """Test that inventories are reused across calls of `load_targets`."""
+    mocker.patch.dict(inventory._INVENTORIES, clear=True)
+    _write_yaml(tmp_path / "a.yaml", [_target(1)])
+    parse_spy = mocker.spy(inventory, "_parse_fragment")
+
+    inventory.load_targets(str(tmp_path))
+    targets = inventory.load_targets(str(tmp_path))
+
+    assert [target.hostname for target in targets] == ["host-1"]
+    parse_spy.assert_called_once()
+
+
+def test_load_invalid_target(tmp_path):
+    """Test that errors in targets report the file and position of the target."""
+    broken = _target(2)
+    del broken["endpoint"]
+    _write_yaml(tmp_path / "targets.yaml", [_target(1), broken])
+
+    with pytest.raises(ConfigMissingKeyError) as exc:
+        inventory.TargetInventory(str(tmp_path)).load()
+
+    assert exc.value.key_name == "targets.yaml[1].endpoint"
+
+
+@pytest.mark.parametrize(
+    "file_name, content, message",
+    [
+        ("targets.yaml", "endpoint: 10.0.0.1", "must contain a list"),
+        ("targets.yaml", "[unclosed", "Failed to parse inventory file"),
+        ("targets.jsonl", "{not json", "Failed to parse inventory file"),
+    ],
+)
+def test_load_malformed_file(file_name, content, message, tmp_path):
+    """Test handling of inventory files that can't be parsed."""
+    (tmp_path / file_name).write_text(content)
+
+    with pytest.raises(ConfigError, match=message):
+        inventory.TargetInventory(str(tmp_path)).load()
+
+
+def test_load_unreadable_fragment(tmp_path, mocker):
+    """Test handling of inventory file that can't be read."""
+    _write_yaml(tmp_path / "a.yaml", [_target(1)])
+    mocker.patch("builtins.open", side_effect=PermissionError)
+
+    with pytest.raises(ConfigError, match="Failed to read inventory file"):
+        inventory.TargetInventory(str(tmp_path)).load()
+
+
+def test_load_missing_inventory(tmp_path):
+    """Test handling of inventory path that does not exist."""
+    with pytest.raises(ConfigError, match="Failed to read target inventory"):
+        inventory.TargetInventory(str(tmp_path / "missing.yaml")).load()
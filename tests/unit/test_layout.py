@@ -0,0 +1,152 @@
+"""Tests for software_inventory_collector.layout module."""
+import datetime
+import glob
+import os
+
+import pytest
+
+from software_inventory_collector import layout
+
+CURRENT = "20240110120000"
+TODAY = datetime.date(2024, 1, 10)
+
+
+def _archive(directory, run, model="model", content=b"data"):
+    """Create archive of a run in the directory and return its path."""
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"customer_@_site_@_{model}_@_{run}.tar.gz"
+    path.write_bytes(content)
+    return path
+
+
+@pytest.fixture()
+def settings(collector_config, tmp_path):
+    """Return settings with collection path in a temporary directory."""
+    collector_config.settings.collection_path = str(tmp_path)
+    return collector_config.settings
+
+
+def test_archive_dir_flat(settings, tmp_path):
+    """Test that flat layout stores all archives directly in collection path."""
+    assert layout.archive_dir(settings, "customer", "site", CURRENT) == str(tmp_path)
+
+
+def test_archive_dir_sharded(settings, tmp_path):
+    """Test that sharded layout creates directory per customer, site and date."""
+    settings.layout = "sharded"
+
+    path = layout.archive_dir(settings, "customer/a", "site", CURRENT)
+
+    assert path == str(tmp_path / "customer_a" / "site" / "20240110")
+    assert os.path.isdir(path)
+
+
+@pytest.mark.parametrize("layout_name", ["flat", "sharded"])
+def test_archive_pattern(layout_name, settings, tmp_path):
+    """Test that pattern matches only uncompressed archives of the run."""
+    settings.layout = layout_name
+    directory = layout.archive_dir(settings, "customer", "site", CURRENT)
+    current = os.path.join(directory, f"customer_@_site_@_model_@_{CURRENT}.tar")
+    for path in [current, f"{current}.gz", current.replace(CURRENT, "20240110110000")]:
+        with open(path, "wb"):
+            pass
+
+    assert glob.glob(layout.archive_pattern(settings, CURRENT)) == [current]
+
+
+def test_prune_archives_disabled(settings, tmp_path):
+    """Test that nothing is removed without retention settings."""
+    old = _archive(tmp_path, "19700101000000")
+
+    assert layout.prune_archives(settings, CURRENT, TODAY) == []
+    assert old.exists()
+
+
+def test_prune_archives_flat_runs(settings, tmp_path):
+    """Test that only newest runs are kept in flat layout, with unrelated files untouched."""
+    settings.retention_runs = 2
+    current = _archive(tmp_path, CURRENT)
+    kept = [_archive(tmp_path, "20240109120000", model) for model in ["a", "b"]]
+    removed = [_archive(tmp_path, "20240108120000"), _archive(tmp_path, "20240101120000")]
+    removed.append(tmp_path / "zstd_dictionary_@_20240108120000.dict")
+    removed[-1].write_bytes(b"dictionary")
+    unrelated = tmp_path / "notes.txt"
+    unrelated.write_text("notes")
+
+    result = layout.prune_archives(settings, CURRENT, TODAY)
+
+    assert sorted(result) == sorted(str(path) for path in removed)
+    assert all(path.exists() for path in [current, unrelated, *kept])
+    assert not any(path.exists() for path in removed)
+
+
+def test_prune_archives_sharded_days(settings, tmp_path, mocker):
+    """Test that date directories older than retention are removed without stat-ing files."""
+    settings.layout = "sharded"
+    settings.retention_days = 2
+    site = tmp_path / "customer" / "site"
+    current = _archive(site / "20240110", CURRENT)
+    kept = _archive(site / "20240109", "20240109120000")
+    _archive(site / "20240108", "20240108120000")
+    _archive(tmp_path / "other" / "site" / "20231201", "20231201120000")
+    (site / "unrelated").mkdir()
+    getsize_mock = mocker.patch.object(layout.os.path, "getsize")
+
+    result = layout.prune_archives(settings, CURRENT, TODAY)
+
+    assert sorted(result) == [
+        str(site / "20240108"),
+        str(tmp_path / "other" / "site" / "20231201"),
+    ]
+    assert current.exists() and kept.exists() and (site / "unrelated").exists()
+    getsize_mock.assert_not_called()
+
+
+def test_prune_archives_sharded_runs(settings, tmp_path):
+    """Test that runs spread over customers are counted once and older dates are dropped."""
+    settings.layout = "sharded"
+    settings.retention_runs = 2
+    first = tmp_path / "customer_1" / "site"
+    second = tmp_path / "customer_2" / "site"
+    _archive(first / "20240110", CURRENT)
+    previous = [
+        _archive(first / "20240110", "20240110080000"),
+        _archive(second / "20240110", "20240110080000"),
+    ]
+    dropped = _archive(second / "20240110", "20240110060000")
+    _archive(first / "20240109", "20240109120000")
+
+    result = layout.prune_archives(settings, CURRENT, TODAY)
+
+    assert sorted(result) == [str(first / "20240109"), str(dropped)]
+    assert all(path.exists() for path in previous)
+
+
+def test_prune_archives_bytes(settings, tmp_path):
+    """Test that old runs are removed once total size exceeds the limit."""
+    settings.retention_bytes = 10
+    current = _archive(tmp_path, CURRENT, content=b"12345")
+    kept = _archive(tmp_path, "20240109120000", content=b"1234")
+    removed = _archive(tmp_path, "20240108120000", content=b"12")
+
+    assert layout.prune_archives(settings, CURRENT, TODAY) == [str(removed)]
+    assert current.exists() and kept.exists()
+
+
+def test_prune_archives_keeps_current_run(settings, tmp_path):
+    """Test that the current run is kept even if it exceeds the size limit."""
+    settings.retention_bytes = 1
+    current = _archive(tmp_path, CURRENT, content=b"12345")
+    previous = _archive(tmp_path, "20240109120000")
+
+    assert layout.prune_archives(settings, CURRENT, TODAY) == [str(previous)]
+    assert current.exists()
+
+
+def test_prune_archives_missing_collection_path(settings, tmp_path):
+    """Test that missing collection path with sharded layout is not an error."""
+    settings.layout = "sharded"
+    settings.retention_runs = 1
+    settings.collection_path = str(tmp_path / "missing")
+
+    assert layout.prune_archives(settings, CURRENT) == []
@@ -0,0 +1,185 @@
+"""Tests for software_inventory_collector.model_cache module."""
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from juju.errors import JujuConnectionError
+from websockets.exceptions import ConnectionClosed
+
+from software_inventory_collector import model_cache
+
+
+def _controller():
+    """Return controller mock that connects to a new model mock on each call."""
+
+    def connect(model_name):
+        model = MagicMock()
+        model.name = model_name
+        model.is_connected.return_value = True
+        model.disconnect.side_effect = AsyncMock()
+        return model
+
+    controller = MagicMock()
+    controller.get_model.side_effect = AsyncMock(side_effect=connect)
+    return controller
+
+
+class _ConnectionClosed(ConnectionClosed):
+    """Closed websocket, constructed the same way by all versions of websockets."""
+
+    def __init__(self):  # pylint: disable=W0231
+        Exception.__init__(self, "connection closed")
+
+
+async def _checked_out(model):
+    """Return model passed to `ModelCache.run`."""
+    return model
+
+
+async def _use(cache, controller, *model_names):
+    """Check out models one by one and return them."""
+    return [await cache.run(controller, "", name, _checked_out) for name in model_names]
+
+
+@pytest.mark.asyncio
+async def test_model_cache_reuse():
+    """Test that checked in models are reused and disconnected by `close`."""
+    cache = model_cache.ModelCache()
+    controller = _controller()
+
+    first = await _use(cache, controller, "model_1", "model_2")
+    second = await _use(cache, controller, "model_1", "model_2")
+
+    assert first == second
+    assert (cache.hits, cache.misses, len(cache)) == (2, 2, 2)
+    first[0].disconnect.assert_not_called()
+    await cache.close()
+    assert len(cache) == 0
+    for model in first:
+        model.disconnect.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_model_cache_lru_eviction():
+    """Test that the least recently used models are disconnected over the size limit."""
+    cache = model_cache.ModelCache(max_size=2)
+    controller = _controller()
+
+    model_1, model_2, _ = await _use(cache, controller, "model_1", "model_2", "model_1")
+    await _use(cache, controller, "model_3")
+
+    model_2.disconnect.assert_called_once()
+    model_1.disconnect.assert_not_called()
+    assert len(cache) == 2
+
+
+@pytest.mark.asyncio
+async def test_model_cache_disabled():
+    """Test that models are disconnected right after use if the size limit is 0."""
+    cache = model_cache.ModelCache(max_size=0)
+
+    (model,) = await _use(cache, _controller(), "model_1")
+
+    model.disconnect.assert_called_once()
+    assert len(cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_model_cache_idle_timeout(mocker):
+    """Test that models idle for longer than the timeout are disconnected."""
+    monotonic = mocker.patch.object(model_cache.time, "monotonic", return_value=1000)
+    cache = model_cache.ModelCache(idle_timeout=60)
+    controller = _controller()
+
+    model_1, model_2 = await _use(cache, controller, "model_1", "model_2")
+    monotonic.return_value = 1030
+    await _use(cache, controller, "model_2")
+    monotonic.return_value = 1070
+    await cache.evict()
+
+    model_1.disconnect.assert_called_once()
+    model_2.disconnect.assert_not_called()
+    assert len(cache) == 1
+
+
+@pytest.mark.asyncio
+async def test_model_cache_reconnect():
+    """Test that closed connections are replaced and failed ones are not reused."""
+    cache = model_cache.ModelCache()
+    controller = _controller()
+
+    (closed,) = await _use(cache, controller, "model_1")
+    closed.is_connected.return_value = False
+    (reconnected,) = await _use(cache, controller, "model_1")
+    failed = []
+
+    async def fail(model):
+        failed.append(model)
+        raise ValueError
+
+    with pytest.raises(ValueError):
+        await cache.run(controller, "", "model_1", fail)
+
+    # error that isn't a connection error is not retried
+    assert failed == [reconnected]
+    closed.disconnect.assert_called_once()
+    reconnected.disconnect.assert_called_once()
+    assert (cache.hits, cache.misses, len(cache)) == (1, 2, 0)
+
+
+@pytest.mark.asyncio
+async def test_model_cache_same_model_concurrently():
+    """Test that only one connection is kept if the same model is checked out twice."""
+    cache = model_cache.ModelCache()
+    controller = _controller()
+
+    async def check_out_again(first):
+        second = await cache.run(controller, "", "model_1", _checked_out)
+        assert len(cache) == 2
+        return first, second
+
+    first, second = await cache.run(controller, "", "model_1", check_out_again)
+
+    assert first is not second
+    second.disconnect.assert_not_called()
+    first.disconnect.assert_called_once()
+    assert len(cache) == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("error", [_ConnectionClosed(), JujuConnectionError("connection lost")])
+async def test_model_cache_run_retry(error):
+    """Test that connection error with a cached connection is retried once with a new one."""
+    cache = model_cache.ModelCache()
+    controller = _controller()
+    (stale,) = await _use(cache, controller, "model_1")
+
+    async def collect(model):
+        if model is stale:
+            raise error
+        return model
+
+    collected = await cache.run(controller, "", "model_1", collect)
+
+    stale.disconnect.assert_called_once()
+    (fresh,) = await _use(cache, controller, "model_1")
+    assert collected is fresh
+    assert fresh is not stale
+    assert (cache.hits, cache.misses, len(cache)) == (2, 2, 1)
+
+
+@pytest.mark.asyncio
+async def test_model_cache_run_no_retry():
+    """Test that failure with a new connection, or repeated failure, is raised."""
+    cache = model_cache.ModelCache()
+    controller = _controller()
+    function = AsyncMock(side_effect=JujuConnectionError("connection lost"))
+
+    with pytest.raises(JujuConnectionError):
+        await cache.run(controller, "", "model_1", function)
+    assert function.call_count == 1
+
+    await _use(cache, controller, "model_1")
+    with pytest.raises(JujuConnectionError):
+        await cache.run(controller, "", "model_1", function)
+    assert function.call_count == 3
+    assert len(cache) == 0
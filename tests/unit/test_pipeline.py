@@ -0,0 +1,145 @@
+"""Tests for software_inventory_collector.pipeline module."""
+import asyncio
+import threading
+import time
+from io import BytesIO
+from unittest.mock import ANY, MagicMock
+
+import pytest
+
+from software_inventory_collector import pipeline
+
+
+def test_memory_budget_blocks_until_released():
+    """Test that reservation waits until enough of the budget is released."""
+    budget = pipeline.MemoryBudget(10)
+    assert budget.acquire(8) == 8
+
+    acquired = threading.Event()
+    waiter = threading.Thread(target=lambda: acquired.set() if budget.acquire(5) else None)
+    waiter.start()
+    assert not acquired.wait(0.05)
+
+    budget.release(8)
+    waiter.join(timeout=1)
+
+    assert acquired.is_set()
+    assert budget.used == 5
+    assert budget.peak == 8
+
+
+@pytest.mark.asyncio
+async def test_memory_budget_acquire_async():
+    """Test that tasks wait for the budget on the event loop, released from any thread."""
+    budget = pipeline.MemoryBudget(10)
+    assert await budget.acquire_async(100) == 10
+
+    cancelled = asyncio.ensure_future(budget.acquire_async(5))
+    waiting = asyncio.ensure_future(budget.acquire_async(5))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    releaser = threading.Thread(target=budget.release, args=(10,))
+    releaser.start()
+
+    assert await asyncio.wait_for(waiting, 1) == 5
+    releaser.join()
+    assert cancelled.cancelled()
+    assert budget.used == 5
+
+
+def test_memory_budget_caps_large_reservation():
+    """Test that reservation bigger than whole budget is capped to the budget limit."""
+    budget = pipeline.MemoryBudget(10)
+
+    assert budget.acquire(100) == 10
+    assert budget.used == 10
+
+
+@pytest.mark.parametrize("max_size, in_memory", [(100, True), (5, False)])
+def test_spool(max_size, in_memory):
+    """Test that data are kept in memory up to the `max_size` and spill to disk afterwards."""
+    chunks = [b"abc", b"def", b"ghi"]
+
+    payload = pipeline.spool(chunks, max_size)
+
+    assert isinstance(payload, BytesIO) == in_memory
+    assert payload.read() == b"abcdefghi"
+
+
+def test_archive_pipeline_writes_items():
+    """Test that submitted items are written in order and their reservations released."""
+    writer = MagicMock()
+    written = []
+    writer.side_effect = lambda name, content, tar: written.append((name, content.read(), tar))
+
+    with pipeline.ArchivePipeline(writer, memory_budget=1024, queue_size=1) as archive:
+        reserved = archive.reserve()
+        archive.submit("a.tar", "file_1", BytesIO(b"data 1"), reserved)
+        archive.submit_data("b.tar", "file_2", b"data 2")
+
+    assert written == [("file_1", b"data 1", "a.tar"), ("file_2", b"data 2", "b.tar")]
+    assert archive.budget.used == 0
+    assert archive.budget.peak <= 1024
+
+
+def test_archive_pipeline_writer_error():
+    """Test that writer errors are raised to fetchers and when the pipeline is closed."""
+    writer = MagicMock(side_effect=OSError("disk full"))
+
+    with pytest.raises(pipeline.CollectionError, match="disk full"):
+        with pipeline.ArchivePipeline(writer, memory_budget=1024, queue_size=1) as archive:
+            archive.submit_data("a.tar", "file_1", b"data 1")
+            while archive._error is None:
+                time.sleep(0.01)
+            with pytest.raises(pipeline.CollectionError):
+                archive.submit_data("a.tar", "file_2", b"data 2")
+
+    writer.assert_called_once_with("file_1", ANY, "a.tar")
+    assert archive.budget.used == 0
+
+
+def test_archive_pipeline_keeps_original_error():
+    """Test that writer errors don't mask exception that closed the pipeline."""
+    writer = MagicMock(side_effect=OSError("disk full"))
+
+    with pytest.raises(ValueError):
+        with pipeline.ArchivePipeline(writer, memory_budget=1024, queue_size=1) as archive:
+            archive.submit_data("a.tar", "file_1", b"data 1")
+            archive.submit_data("a.tar", "file_2", b"data 2")
+            raise ValueError()
+
+
+@pytest.mark.asyncio
+async def test_archive_pipeline_submit_data_async():
+    """Test that data are covered by reservation made before they were fetched."""
+    written = []
+    writer = MagicMock(side_effect=lambda name, content, tar: written.append(content.read()))
+
+    with pipeline.ArchivePipeline(writer, memory_budget=1024, queue_size=1) as archive:
+        reserved = await archive.reserve_async(100)
+        reserved = await archive.submit_data_async("a.tar", "file_1", b"x" * 30, reserved)
+        assert reserved == 70
+        # data outgrowing the reservation replace it with one of their full size
+        reserved = await archive.submit_data_async("a.tar", "file_2", b"y" * 200, reserved)
+        assert reserved == 0
+
+    assert written == [b"x" * 30, b"y" * 200]
+    assert archive.budget.used == 0
+    assert archive.budget.peak <= 230
+
+
+@pytest.mark.asyncio
+async def test_archive_pipeline_submit_data_async_error():
+    """Test that whole reservation is released if the data can't be submitted."""
+    writer = MagicMock(side_effect=OSError("disk full"))
+
+    with pytest.raises(pipeline.CollectionError, match="disk full"):
+        with pipeline.ArchivePipeline(writer, memory_budget=1024, queue_size=1) as archive:
+            archive.submit_data("a.tar", "file_1", b"data 1")
+            while archive._error is None:
+                await asyncio.sleep(0.01)
+            reserved = await archive.reserve_async(100)
+            with pytest.raises(pipeline.CollectionError):
+                await archive.submit_data_async("a.tar", "file_2", b"data 2", reserved)
+
+    assert archive.budget.used == 0
@@ -0,0 +1,61 @@
+"""Tests for software_inventory_collector.profiling module."""
+import pstats
+import threading
+import tracemalloc
+
+from software_inventory_collector import profiling
+
+
+def _busy_function():
+    """Do some work that shows up in the profile."""
+    return sum(range(1000))
+
+
+def test_profiler_disabled(capsys):
+    """Test that nothing is measured or reported if profiling is disabled."""
+    with profiling.Profiler() as profiler:
+        with profiler.phase("collection"), profiling.timed("model"):
+            pass
+
+    assert profiler.durations == []
+    assert profiling._ACTIVE is None
+    assert capsys.readouterr().out == ""
+
+
+def test_profiler_cpu_profile(tmp_path, capsys):
+    """Test that CPU profile covers the main thread and threads started during the run."""
+    profile_path = tmp_path / "run.pstats"
+    with profiling.Profiler(profile_path=str(profile_path)) as profiler:
+        assert profiling._ACTIVE is profiler
+        with profiler.phase("collection"):
+            thread = threading.Thread(target=_busy_function)
+            thread.start()
+            thread.join()
+            with profiling.timed("model foo"):
+                _busy_function()
+
+    assert profiling._ACTIVE is None
+    assert [name for name, _ in profiler.durations] == ["model foo", "phase collection"]
+    functions = pstats.Stats(str(profile_path)).stats  # type: ignore[attr-defined]
+    calls = [stat[1] for func, stat in functions.items() if func[2] == "_busy_function"]
+    assert calls == [2]
+    output = capsys.readouterr().out
+    assert f"CPU profile written to '{profile_path}'" in output
+    assert "phase collection: " in output
+    assert "model foo: " in output
+
+
+def test_profiler_trace_malloc(capsys):
+    """Test that top allocators are reported at the end of each phase."""
+    with profiling.Profiler(trace_malloc=1) as profiler:
+        with profiler.phase("first"):
+            data = [bytearray(1024) for _ in range(100)]
+        with profiler.phase("second"):
+            pass
+
+    assert not tracemalloc.is_tracing()
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].startswith("Memory after phase first: current")
+    assert "test_profiling.py" in lines[1]
+    assert lines[2].startswith("Memory after phase second: current")
+    assert len(data) == 100
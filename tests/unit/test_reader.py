@@ -0,0 +1,127 @@
+"""Tests for software_inventory_collector.reader module."""
+import io
+import json
+import tarfile
+
+import pytest
+import zstandard
+
+from software_inventory_collector import archive
+from software_inventory_collector.exception import ArchiveError
+from software_inventory_collector.reader import IndexedArchive
+
+RUN = "20240101120000"
+PAYLOADS = {
+    f"{endpoint}_@_host-{host}_@_{RUN}": f"{endpoint} of host-{host}\n".encode() * 50
+    for endpoint in ["dpkg", "kernel"]
+    for host in range(3)
+}
+
+
+@pytest.fixture()
+def archive_path(tmp_path):
+    """Return path to consolidated archive with uncompressed payloads."""
+    tar_path = tmp_path / f"customer_@_site_@_model_@_{RUN}.tar"
+    with tarfile.open(tar_path, "w") as tar_file:
+        for name, payload in PAYLOADS.items():
+            member = tarfile.TarInfo(name)
+            member.size = len(payload)
+            tar_file.addfile(member, io.BytesIO(payload))
+    path = archive.consolidated_path(str(tmp_path), RUN)
+    archive.consolidate_tarballs([str(tar_path)], path)
+    return path
+
+
+def test_indexed_archive_read(archive_path):
+    """Test that members are found by host and read by their index entries."""
+    with IndexedArchive(archive_path) as indexed:
+        assert len(indexed.names()) == len(PAYLOADS)
+        names = indexed.find("dpkg", "host-1")
+        assert names == [f"customer_@_site_@_model_@_{RUN}/dpkg_@_host-1_@_{RUN}"]
+        assert indexed.read(names[0]) == PAYLOADS[f"dpkg_@_host-1_@_{RUN}"]
+        assert indexed.read_payload(names[0]) == PAYLOADS[f"dpkg_@_host-1_@_{RUN}"]
+
+
+def test_indexed_archive_missing_member(archive_path):
+    """Test that reading unknown member fails."""
+    with IndexedArchive(archive_path) as indexed, pytest.raises(ArchiveError, match="not found"):
+        indexed.read("missing")
+
+
+def test_indexed_archive_checksum_mismatch(archive_path):
+    """Test that corrupted member data is detected."""
+    with IndexedArchive(archive_path) as indexed:
+        name = indexed.find("kernel", "host-2")[0]
+        offset = indexed._members[name]["offset"]
+    with open(archive_path, "r+b") as archive_file:
+        archive_file.seek(offset)
+        archive_file.write(b"X")
+
+    with IndexedArchive(archive_path) as indexed:
+        with pytest.raises(ArchiveError, match="Checksum mismatch"):
+            indexed.read(name)
+
+
+@pytest.mark.parametrize("index", ["not json", '{"version": 99}', '{"version": 1}', None])
+def test_indexed_archive_invalid_index(index, archive_path):
+    """Test that missing or malformed index is rejected."""
+    index_path = archive.index_path(archive_path)
+    if index is None:
+        archive_path = f"{archive_path}.missing"
+    else:
+        with open(index_path, "w", encoding="UTF-8") as index_file:
+            index_file.write(index)
+
+    with pytest.raises(ArchiveError, match="Failed to load index"):
+        IndexedArchive(archive_path)
+
+
+@pytest.mark.parametrize("with_dictionary", [True, False])
+def test_indexed_archive_read_payload_compressed(with_dictionary, tmp_path):
+    """Test that payloads compressed with zstd are decompressed, with the dictionary if any."""
+    tar_path = tmp_path / f"customer_@_site_@_model_@_{RUN}.tar"
+    with tarfile.open(tar_path, "w") as tar_file:
+        for name, payload in PAYLOADS.items():
+            member = tarfile.TarInfo(name)
+            member.size = len(payload)
+            tar_file.addfile(member, io.BytesIO(payload))
+        # frame streamed by exporter, without content size in its header
+        streamed = io.BytesIO()
+        with zstandard.ZstdCompressor().stream_writer(streamed, closefd=False) as writer:
+            writer.write(b"snap of host-0")
+        member = tarfile.TarInfo(f"snap_@_host-0_@_{RUN}.zst")
+        member.size = len(streamed.getvalue())
+        tar_file.addfile(member, io.BytesIO(streamed.getvalue()))
+    dictionary = b""
+    if with_dictionary:
+        samples = [
+            payload + str(index).encode() for index in range(20) for payload in PAYLOADS.values()
+        ]
+        dictionary = zstandard.train_dictionary(1024, samples).as_bytes()
+        (tmp_path / "dictionary.dict").write_bytes(dictionary)
+    archive.compress_members(str(tar_path), dictionary)
+    path = archive.consolidated_path(str(tmp_path), RUN)
+    archive.consolidate_tarballs([str(tar_path)], path, "dictionary.dict" if dictionary else "")
+
+    with IndexedArchive(path) as indexed:
+        name = indexed.find("dpkg", "host-0")[0]
+        assert name.endswith(".zst")
+        assert indexed.read_payload(name) == PAYLOADS[f"dpkg_@_host-0_@_{RUN}"]
+        assert indexed.read_payload(indexed.find("snap", "host-0")[0]) == b"snap of host-0"
+        with open(archive.index_path(path), encoding="UTF-8") as index_file:
+            assert json.load(index_file)["dictionary"] == indexed.dictionary
+
+
+def test_indexed_archive_find_deterministic(tmp_path):
+    """Test that members without run timestamp in their names are found."""
+    tar_path = tmp_path / f"customer_@_site_@_model_@_{RUN}.tar"
+    with tarfile.open(tar_path, "w") as tar_file:
+        for name in ["dpkg_@_host-1", "dpkg_@_host-10", "dpkg_@_host-1.zst.bak"]:
+            member = tarfile.TarInfo(name)
+            member.size = 4
+            tar_file.addfile(member, io.BytesIO(b"dpkg"))
+    path = archive.consolidated_path(str(tmp_path), RUN)
+    archive.consolidate_tarballs([str(tar_path)], path, run=RUN)
+
+    with IndexedArchive(path) as indexed:
+        assert indexed.find("dpkg", "host-1") == ["customer_@_site_@_model/dpkg_@_host-1"]
@@ -0,0 +1,140 @@
+"""Tests for software_inventory_collector.schedule module."""
+import json
+
+import pytest
+
+from software_inventory_collector import schedule
+from software_inventory_collector.exception import CollectionError
+
+HISTORY = {
+    "target": {"10.0.0.1:8675": 1.0, "10.0.0.2:8675": 30.0, "10.0.0.3:8675": "bad"},
+    "model": {"big": 100.0},
+}
+
+
+@pytest.fixture()
+def history_path(tmp_path):
+    """Return path to history file with durations from previous runs."""
+    path = tmp_path / "history.json"
+    path.write_text(json.dumps(HISTORY))
+    return str(path)
+
+
+def test_run_schedule_order(history_path):
+    """Test that jobs are ordered longest first, with unknown jobs at the beginning."""
+    run_schedule = schedule.RunSchedule(history_path)
+    endpoints = ["10.0.0.1:8675", "10.0.0.2:8675", "10.0.0.3:8675", "10.0.0.4:8675"]
+
+    ordered = run_schedule.order(schedule.TARGETS, endpoints, key=str)
+
+    assert ordered == ["10.0.0.3:8675", "10.0.0.4:8675", "10.0.0.2:8675", "10.0.0.1:8675"]
+    assert run_schedule.order(schedule.MODELS, ["small", "big"], key=str) == ["small", "big"]
+
+
+@pytest.mark.parametrize("content", ["not json", "[]", '{"target": []}'])
+def test_run_schedule_malformed_history(content, tmp_path):
+    """Test that malformed history is ignored."""
+    path = tmp_path / "history.json"
+    path.write_text(content)
+
+    run_schedule = schedule.RunSchedule(str(path))
+
+    assert run_schedule.estimate(schedule.TARGETS, "10.0.0.1:8675") is None
+
+
+def test_run_schedule_timed(history_path, mocker):
+    """Test that durations of successful full jobs are smoothed into the history and saved."""
+    mocker.patch.object(schedule.time, "monotonic", side_effect=[0, 0, 11, 20, 30, 40, 50])
+    run_schedule = schedule.RunSchedule(history_path)
+
+    with run_schedule.timed(schedule.TARGETS, "10.0.0.1:8675"):
+        pass
+    with pytest.raises(RuntimeError):
+        with run_schedule.timed(schedule.MODELS, "big"):
+            raise RuntimeError
+    with run_schedule.timed(schedule.MODELS, "new"):
+        pass
+    # job collecting only some artifacts is not representative of the whole job
+    with run_schedule.timed(schedule.TARGETS, "10.0.0.2:8675", full=False):
+        pass
+    run_schedule.save()
+
+    with open(history_path, encoding="UTF-8") as history_file:
+        saved = json.load(history_file)
+    assert saved["target"] == {"10.0.0.1:8675": 6.0, "10.0.0.2:8675": 30.0}
+    assert saved["model"] == {"big": 100.0, "new": 10}
+
+
+def test_run_schedule_save_disabled(tmp_path):
+    """Test that history is not saved without history path."""
+    run_schedule = schedule.RunSchedule()
+    with run_schedule.timed(schedule.TARGETS, "10.0.0.1:8675"):
+        pass
+
+    run_schedule.save()
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_run_schedule_save_error(tmp_path):
+    """Test handling of failure to save the history."""
+    run_schedule = schedule.RunSchedule(str(tmp_path / "missing" / "history.json"))
+
+    with pytest.raises(CollectionError, match="Failed to save run history"):
+        run_schedule.save()
+
+
+def test_run_schedule_skip(history_path, mocker):
+    """Test that jobs which can't finish before the deadline are skipped."""
+    mocker.patch.object(schedule.time, "monotonic", side_effect=[0, 10, 10, 10, 61])
+    run_schedule = schedule.RunSchedule(history_path, deadline=60)
+
+    assert not run_schedule.skip(schedule.TARGETS, "10.0.0.1:8675")
+    assert not run_schedule.skip(schedule.TARGETS, "10.0.0.4:8675")
+    assert run_schedule.skip(schedule.MODELS, "big")
+    assert run_schedule.skip(schedule.TARGETS, "10.0.0.1:8675")
+    assert run_schedule.skipped == ["model big", "target 10.0.0.1:8675"]
+
+
+def test_run_schedule_no_deadline(history_path):
+    """Test that nothing is skipped without deadline."""
+    run_schedule = schedule.RunSchedule(history_path)
+
+    assert not run_schedule.skip(schedule.MODELS, "big")
+    assert run_schedule.skipped == []
+
+
+def test_run_schedule_due(tmp_path, mocker):
+    """Test that only artifacts whose interval elapsed are due, and that collection is saved."""
+    mocker.patch.object(schedule.time, "time", return_value=10000)
+    path = tmp_path / "history.json"
+    collected = {"10.0.0.1:8675/kernel": 10000 - 3600 + 30, "10.0.0.1:8675/snap": 10000 - 100}
+    path.write_text(json.dumps({"collected": collected}))
+    run_schedule = schedule.RunSchedule(str(path), intervals={"snap": 600, "kernel": 3600})
+
+    assert run_schedule.due("10.0.0.1:8675", ["dpkg", "snap", "kernel"]) == ["dpkg", "kernel"]
+    assert run_schedule.due("10.0.0.2:8675", ["snap", "kernel"]) == ["snap", "kernel"]
+    assert run_schedule.last_collected("10.0.0.1:8675", "snap") == 9900
+    assert run_schedule.last_collected("10.0.0.2:8675", "snap") is None
+
+    run_schedule.collected("10.0.0.1:8675", ["dpkg", "kernel"])
+    run_schedule.save()
+
+    saved = json.loads(path.read_text())
+    assert saved["collected"] == {
+        "10.0.0.1:8675/dpkg": 10000,
+        "10.0.0.1:8675/kernel": 10000,
+        "10.0.0.1:8675/snap": 9900,
+    }
+
+
+def test_run_schedule_sizes(tmp_path):
+    """Test that sizes of artifacts are saved for the next runs."""
+    path = str(tmp_path / "history.json")
+    run_schedule = schedule.RunSchedule(path)
+    assert run_schedule.size("model_1", "status") is None
+
+    run_schedule.record_size("model_1", "status", 1024)
+    run_schedule.save()
+
+    assert schedule.RunSchedule(path).size("model_1", "status") == 1024
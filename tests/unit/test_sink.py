@@ -0,0 +1,167 @@
+"""Tests for software_inventory_collector.sink module."""
+import io
+import os
+import socket
+import tarfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from software_inventory_collector import sink
+from software_inventory_collector.exception import CollectionError
+
+TAR_PATH = "/path/to/output/customer_@_site_@_model_@_20240101120000.tar"
+
+
+class _IngestHandler(BaseHTTPRequestHandler):
+    """Ingest service that stores complete chunked uploads."""
+
+    def do_POST(self):  # noqa: N802
+        """Read chunked body and respond with the status of the server."""
+        body = b""
+        while True:
+            size = int(self.rfile.readline().strip() or b"-1", 16)
+            if size < 0:
+                return
+            body += self.rfile.read(size + 2)[:size]
+            if size == 0:
+                break
+        self.server.uploads.append((self.headers["Content-Type"], body))
+        self.send_response(self.server.status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *_):
+        """Don't log requests."""
+
+
+@pytest.fixture()
+def ingest():
+    """Return local ingest server running in a thread."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _IngestHandler)
+    server.uploads = []
+    server.status = 200
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _members(data: bytes) -> dict:
+    """Return names and content of members of tar archive."""
+    with tarfile.open(fileobj=io.BytesIO(data), mode="r|") as tar_file:
+        return {member.name: tar_file.extractfile(member).read() for member in tar_file}
+
+
+def test_tar_stream_sink():
+    """Test that files are streamed as members named by their tarballs."""
+    stream = io.BytesIO()
+
+    with sink.TarStreamSink(stream) as tar_sink:
+        tar_sink.write("dpkg_@_host-1", io.BytesIO(b"dpkg data"), TAR_PATH)
+        tar_sink.write("snap_@_host-1", io.BytesIO(b"snap data"), TAR_PATH)
+
+    prefix = "customer_@_site_@_model_@_20240101120000"
+    assert _members(stream.getvalue()) == {
+        f"{prefix}/dpkg_@_host-1": b"dpkg data",
+        f"{prefix}/snap_@_host-1": b"snap data",
+    }
+
+
+def test_tar_stream_sink_abort():
+    """Test that end of archive is not written if collection fails."""
+    complete = io.BytesIO()
+    with sink.TarStreamSink(complete) as tar_sink:
+        tar_sink.write("kernel_@_host-1", io.BytesIO(b"kernel" * 4096), TAR_PATH)
+
+    aborted = io.BytesIO()
+    with pytest.raises(RuntimeError), sink.TarStreamSink(aborted) as tar_sink:
+        tar_sink.write("kernel_@_host-1", io.BytesIO(b"kernel" * 4096), TAR_PATH)
+        raise RuntimeError
+
+    assert complete.getvalue().startswith(aborted.getvalue())
+    assert len(aborted.getvalue()) < len(complete.getvalue())
+
+
+def test_http_upload_sink(ingest):
+    """Test that tar stream is uploaded by single chunked request."""
+    payload = os.urandom(256 * 1024)
+    url = f"http://127.0.0.1:{ingest.server_address[1]}/ingest"
+
+    with sink.HTTPUploadSink(url) as upload:
+        upload.write("dpkg_@_host-1", io.BytesIO(payload), TAR_PATH)
+
+    content_type, body = ingest.uploads[0]
+    assert content_type == "application/x-tar"
+    assert list(_members(body).values()) == [payload]
+
+
+def test_http_upload_sink_rejected(ingest):
+    """Test that upload rejected by the ingest service fails the collection."""
+    ingest.status = 500
+    upload = sink.HTTPUploadSink(f"http://127.0.0.1:{ingest.server_address[1]}/")
+    upload.write("dpkg_@_host-1", io.BytesIO(b"data"), TAR_PATH)
+
+    with pytest.raises(CollectionError, match="Failed to upload collected data"):
+        upload.close()
+
+    with pytest.raises(CollectionError, match="Failed to upload collected data"):
+        upload.write("snap_@_host-1", io.BytesIO(b"data"), TAR_PATH)
+
+
+def test_http_upload_sink_unreachable():
+    """Test that data written while the ingest service is unreachable don't block."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    upload = sink.HTTPUploadSink(f"http://127.0.0.1:{port}/")
+    for index in range(sink.UPLOAD_QUEUE_SIZE):
+        upload._stream.write(f"chunk {index}".encode())
+
+    with pytest.raises(CollectionError, match="Failed to upload collected data"):
+        upload.close()
+
+
+def test_http_upload_sink_abort(ingest):
+    """Test that aborted upload is not accepted by the ingest service."""
+    upload = sink.HTTPUploadSink(f"http://127.0.0.1:{ingest.server_address[1]}/")
+    upload.write("dpkg_@_host-1", io.BytesIO(os.urandom(64 * 1024)), TAR_PATH)
+
+    upload.abort()
+
+    assert not ingest.uploads
+
+
+def test_detach_stdout(capfd, mocker):
+    """Test that original stdout receives the stream and further output goes to stderr."""
+    # capfd replaces sys.stdout with its own buffer, file descriptors are captured
+    mocker.patch.object(sink.sys, "stdout").fileno.return_value = 1
+    mocker.patch.object(sink.sys, "stderr").fileno.return_value = 2
+    stream = sink._detach_stdout()
+    stream.write(b"archive")
+    stream.close()
+    os.write(1, b"message")
+
+    captured = capfd.readouterr()
+    assert captured.out == "archive"
+    assert captured.err == "message"
+
+
+def test_new_sink(collector_config, mocker):
+    """Test that sink is created according to the output setting."""
+    assert sink.new_sink(collector_config.settings) is None
+
+    stdout = io.BytesIO()
+    mocker.patch.object(sink, "_detach_stdout", return_value=stdout)
+    collector_config.settings.output = "stdout"
+    stream_sink = sink.new_sink(collector_config.settings)
+    stream_sink.close()
+    assert _members(stdout.getvalue()) == {}
+
+    upload_sink = mocker.patch.object(sink, "HTTPUploadSink")
+    collector_config.settings.output = "http"
+    collector_config.settings.ingest_url = "http://ingest/"
+    assert sink.new_sink(collector_config.settings) is upload_sink.return_value
+    upload_sink.assert_called_once_with("http://ingest/")